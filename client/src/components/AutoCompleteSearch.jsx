@@ -1,7 +1,6 @@
 import React, {
   useRef,
   useEffect,
-  useState,
   forwardRef,
   useImperativeHandle
 } from 'react';
@@ -9,6 +8,9 @@ import autoComplete from '@tarekraafat/autocomplete.js';
 import '@tarekraafat/autocomplete.js/dist/css/autoComplete.01.css';
 import '../styles/AutoComplete.css';
 
+// Suggestions requested per keystroke
+const SUGGESTION_LIMIT = 10;
+
 const AutoCompleteSearch = forwardRef(function AutoCompleteSearch({
   dataKey,
   placeholder,
@@ -17,7 +19,6 @@ const AutoCompleteSearch = forwardRef(function AutoCompleteSearch({
 }, ref) {
   const inputRef = useRef(null);
   const acInstance = useRef(null);
-  const [dataset, setDataset] = useState([]);
 
   useImperativeHandle(ref, () => ({
     clear: () => {
@@ -28,44 +29,8 @@ const AutoCompleteSearch = forwardRef(function AutoCompleteSearch({
   }));
 
   useEffect(() => {
-    let isMounted = true;
-
-    async function loadDataset() {
-      try {
-        const response = await fetch(`${process.env.REACT_APP_API_URL}/get_alleles`);
-        if (!response.ok) throw new Error(`Failed to load alleles`);
-
-        const list = await response.json(); // list of { allele_1, allele_2 }
-        if (!isMounted) return;
-
-        if (dataKey === 'allele_1') {
-          const a1List = list.map(item => item.allele_1);
-          setDataset(a1List);
-        } else {
-          if (!a1_value) {
-            setDataset([]);
-            return;
-          }
-
-          const a2List = list
-            .filter(item => item.allele_1 === a1_value && item.allele_2)
-            .map(item => item.allele_2);
-
-          setDataset(a2List);
-        }
-      } catch (err) {
-        console.error('AutoCompleteSearch fetch error:', err);
-      }
-    }
-
-    loadDataset();
-    return () => {
-      isMounted = false;
-    };
-  }, [dataKey, a1_value]);
-
-  useEffect(() => {
-    if (!dataset.length) return;
+    // Second allele suggestions are the partners of the chosen first allele
+    if (dataKey === 'allele_2' && !a1_value) return;
 
     const id = `autoComplete-${dataKey}`;
     inputRef.current.id = id;
@@ -78,10 +43,28 @@ const AutoCompleteSearch = forwardRef(function AutoCompleteSearch({
       console.warn('AutoComplete cleanup failed:', e);
     }
 
+    // Ranked matches for what has been typed so far, from the server's allele index
+    const fetchSuggestions = async (query) => {
+      const params = new URLSearchParams({ prefix: query, limit: SUGGESTION_LIMIT });
+      if (dataKey === 'allele_2') {
+        params.append('allele1', a1_value);
+      }
+      try {
+        const response = await fetch(`${process.env.REACT_APP_API_URL}/alleles/suggest?${params.toString()}`);
+        if (!response.ok) throw new Error(`Failed to load alleles`);
+        const list = await response.json(); // list of { allele, count }
+        return list.map(item => item.allele);
+      } catch (err) {
+        console.error('AutoCompleteSearch fetch error:', err);
+        return [];
+      }
+    };
+
     acInstance.current = new autoComplete({
       selector: `#${id}`,
       placeHolder: placeholder,
-      data: { src: dataset, cache: true },
+      data: { src: fetchSuggestions, cache: false },
+      debounce: 150,
       resultItem: { highlight: true },
       events: {
         input: {
@@ -103,7 +86,7 @@ const AutoCompleteSearch = forwardRef(function AutoCompleteSearch({
       }
       acInstance.current = null;
     };
-  }, [dataset, dataKey, placeholder, onSelect]);
+  }, [dataKey, a1_value, placeholder, onSelect]);
 
   return (
     <div className="autocomplete-wrapper">
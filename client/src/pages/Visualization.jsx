@@ -87,6 +87,8 @@ function Visualization() {
         if (inputs.Manifestations.Age_of_Onset_of) {
           queryParams.append('manifestation', inputs.Manifestations.Age_of_Onset_of);
         }
+        // Only the fields the plots use
+        queryParams.append('fields', 'sex,severity,dm,oa,di,hl');
 
         const url = `${process.env.REACT_APP_API_URL}/patients?${queryParams.toString()}`;
         console.log('Fetching data from:', url);
@@ -240,8 +242,8 @@ function Visualization() {
       const manifestation1Key = getManifestationKey(selectedManifestations[0]);
       const manifestation2Key = getManifestationKey(selectedManifestations[1]);
 
-      // Only include patients that have both manifestations
-      if (item[manifestation1Key] === null || item[manifestation2Key] === null) {
+      // Only include patients that have both manifestations (missing ones come back as null)
+      if (item[manifestation1Key] == null || item[manifestation2Key] == null) {
         return [];
       }
 
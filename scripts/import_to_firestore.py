@@ -1,134 +1,208 @@
-import csv
+import argparse
+import json
 import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import firebase_admin
 from firebase_admin import credentials, firestore
 
-# Initialize admin connection to firestore db
-cred_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS', '../../firebase.json')
-cred = credentials.Certificate(cred_path)
-firebase_admin.initialize_app(cred)
-
-db = firestore.client()
+# The column schema lives with the server code, which also loads this data
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+from schema import read_csv
 
 CSV_PATH = 'data.csv'
 COLL     = 'patients'
 
-with open(CSV_PATH, newline='') as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        # Cast integers
-        if row['id'] != '':
-            row['id'] = int(row['id'])
-        else:
-            row['id'] = None
-
-        if row['sex'] != '':
-            row['sex'] = int(row['sex'])
-        else:
-            row['sex'] = None
-
-        if row['age'] != '':
-            row['age'] = int(row['age'])
-        else:
-            row['age'] = None
-
-        if row['hu'] != '':
-            row['hu'] = int(row['hu'])
-        else:
-            row['hu'] = None
-
-        if row['position_1'] != '':
-            row['position_1'] = int(row['position_1'])
-        else:
-            row['position_1'] = None
-
-        if row['tmem_1'] != '':
-            row['tmem_1'] = int(row['tmem_1'])
-        else:
-            row['tmem_1'] = None
-
-        if row['position_2'] != '':
-            row['position_2'] = int(row['position_2'])
-        else:
-            row['position_2'] = None
-
-        if row['tmem_2'] != '':
-            row['tmem_2'] = int(row['tmem_2'])
-        else:
-            row['tmem_2'] = None
-
-        if row['n_nsfs'] != '':
-            row['n_nsfs'] = int(row['n_nsfs'])
-        else:
-            row['n_nsfs'] = None
-
-        if row['n_tm'] != '':
-            row['n_tm'] = int(row['n_tm'])
-        else:
-            row['n_tm'] = None
-
-        # Cast floats
-        if row['severity'] != '':
-            row['severity'] = float(row['severity'])
-        else:
-            row['severity'] = None
-
-        if row['dm'] != '':
-            row['dm'] = float(row['dm'])
-        else:
-            row['dm'] = None
-
-        if row['oa'] != '':
-            row['oa'] = float(row['oa'])
-        else:
-            row['oa'] = None
-
-        if row['di'] != '':
-            row['di'] = float(row['di'])
-        else:
-            row['di'] = None
-
-        if row['hl'] != '':
-            row['hl'] = float(row['hl'])
-        else:
-            row['hl'] = None
-
-        # Cast Booleans
-        if row['has_dm'] == 'Y':
-            row['has_dm'] = True
-        elif row['has_dm'] == 'N':
-            row['has_dm'] = False
-        else:
-            row['has_dm'] = None
-
-        if row['has_oa'] == 'Y':
-            row['has_oa'] = True
-        elif row['has_oa'] == 'N':
-            row['has_oa'] = False
-        else:
-            row['has_oa'] = None
-
-        if row['has_di'] == 'Y':
-            row['has_di'] = True
-        elif row['has_di'] == 'N':
-            row['has_di'] = False
-        else:
-            row['has_di'] = None
-
-        if row['has_hl'] == 'Y':
-            row['has_hl'] = True
-        elif row['has_hl'] == 'N':
-            row['has_hl'] = False
-        else:
-            row['has_hl'] = None
-
-        # Leave remaining features as strings
-
-        # Write to Firestore --> doc = id
-        doc_id = row.get('id')
-        if doc_id is not None:
-            db.collection(COLL).document(str(doc_id)).set(row)
-
-        print(f"Imported {doc_id or '(new)'}")
-
-print("Done.")
+# Firestore accepts at most 500 writes per batch commit
+BATCH_SIZE      = 500
+WORKERS         = 8
+MAX_RETRIES     = 5
+BACKOFF_SECONDS = 0.5
+CHECKPOINT_PATH = 'import_checkpoint.json'
+# Rows coerced at a time
+COERCE_CHUNK_ROWS = 10000
+
+
+# Yield (batch number, [(doc id, row), ...]) for consecutive groups of batch_size rows with an id
+# Cells are coerced column by column against the shared schema; rows with bad cells are reported and
+# left out, or abort the import when strict
+def read_batches(csv_path, batch_size=BATCH_SIZE, strict=False):
+    batch = []
+    number = 0
+    for records, errors in read_csv(csv_path, chunk_size=COERCE_CHUNK_ROWS):
+        for error in errors:
+            print(f"[import] row {error.row}, column {error.column!r}: {error.message} ({error.value!r})", file=sys.stderr)
+        if errors and strict:
+            raise ValueError(f"{len(errors)} bad cells in {csv_path}, nothing further imported")
+        for row in records:
+            # doc = id
+            doc_id = row.get('id')
+            if doc_id is None:
+                continue
+            batch.append((str(doc_id), row))
+            if len(batch) == batch_size:
+                yield number, batch
+                number += 1
+                batch = []
+    if batch:
+        yield number, batch
+
+
+# Commit one batch of writes, retrying with exponential backoff (plus jitter) when it fails
+def commit_batch(db, coll, docs, retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    for attempt in range(retries + 1):
+        try:
+            batch = db.batch()
+            for doc_id, row in docs:
+                batch.set(db.collection(coll).document(doc_id), row)
+            batch.commit()
+            return
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * (1 + random.random())
+            print(f"[import] batch commit failed ({e}); retrying in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+
+
+# Batch numbers already committed by a previous run over the same file, persisted after every commit
+# so that a crashed import resumes where it left off. The file is recognized by path, size and
+# modification time, so a file edited in place (even to the same size) starts over
+class Checkpoint:
+    def __init__(self, path, source, batch_size):
+        self.path = path
+        stat = os.stat(source)
+        self.key = {'source': os.path.abspath(source), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                    'batch_size': batch_size}
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            # A different file (or batching) makes the old batch numbers meaningless
+            if saved.get('key') == self.key:
+                self.done = set(saved.get('done', []))
+
+    def mark(self, number):
+        self.done.add(number)
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'key': self.key, 'done': sorted(self.done)}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# Import every row of csv_path into collection coll, committing batches of batch_size writes on up to
+# `workers` threads. db is anything with Firestore's batch()/collection() API (the real client, an
+# emulator-backed client, or MemoryClient). Returns the number of rows written
+def import_csv(db, csv_path=CSV_PATH, coll=COLL, batch_size=BATCH_SIZE, workers=WORKERS,
+               checkpoint_path=CHECKPOINT_PATH, retries=MAX_RETRIES, backoff=BACKOFF_SECONDS, strict=False):
+    checkpoint = Checkpoint(checkpoint_path, csv_path, batch_size)
+    if checkpoint.done:
+        print(f"[import] resuming: {len(checkpoint.done)} batches already committed")
+
+    start = time.monotonic()
+    written = 0
+    pending = {}
+
+    # Wait for at least one in-flight commit and record it; a batch that ran out of retries raises, but
+    # only after every other finished batch has been checkpointed
+    def collect(return_when):
+        nonlocal written
+        done, _ = wait(pending, return_when=return_when)
+        failed = None
+        for future in done:
+            number, size = pending.pop(future)
+            if future.exception() is not None:
+                failed = failed or future.exception()
+                continue
+            checkpoint.mark(number)
+            written += size
+            elapsed = max(time.monotonic() - start, 1e-9)
+            print(f"[import] batch {number} committed: {written} rows, {written / elapsed:.0f} rows/s")
+        if failed is not None:
+            raise failed
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for number, docs in read_batches(csv_path, batch_size, strict):
+            if number in checkpoint.done:
+                continue
+            # Keep a bounded number of batches in memory / in flight
+            if len(pending) >= workers * 2:
+                collect(FIRST_COMPLETED)
+            pending[pool.submit(commit_batch, db, coll, docs, retries, backoff)] = (number, len(docs))
+        while pending:
+            collect(FIRST_COMPLETED)
+
+    checkpoint.clear()
+    elapsed = max(time.monotonic() - start, 1e-9)
+    print(f"Done. {written} rows in {elapsed:.1f}s ({written / elapsed:.0f} rows/s)")
+    return written
+
+
+# In-process stand-in for the Firestore client (documents kept in a dict), for dry runs and tests
+class MemoryClient:
+    def __init__(self):
+        self.collections = {}
+
+    def collection(self, name):
+        return _MemoryCollection(self.collections.setdefault(name, {}))
+
+    def batch(self):
+        return _MemoryBatch()
+
+
+class _MemoryCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def document(self, doc_id):
+        return (self.docs, doc_id)
+
+
+class _MemoryBatch:
+    def __init__(self):
+        self.writes = []
+
+    def set(self, ref, data):
+        self.writes.append((ref, data))
+
+    def commit(self):
+        for (docs, doc_id), data in self.writes:
+            docs[doc_id] = dict(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import the patient CSV into Firestore.')
+    parser.add_argument('csv_path', nargs='?', default=CSV_PATH)
+    parser.add_argument('--collection', default=COLL)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--retries', type=int, default=MAX_RETRIES)
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help="resume file ('' to disable)")
+    parser.add_argument('--strict', action='store_true', help='stop at the first chunk with bad cells instead of skipping those rows')
+    parser.add_argument('--dry-run', action='store_true', help='write to an in-memory client instead of Firestore')
+    args = parser.parse_args()
+
+    if args.dry_run:
+        db = MemoryClient()
+    else:
+        # Initialize admin connection to firestore db (FIRESTORE_EMULATOR_HOST targets the emulator)
+        cred_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS', '../../firebase.json')
+        cred = credentials.Certificate(cred_path)
+        firebase_admin.initialize_app(cred)
+        db = firestore.client()
+
+    import_csv(db, args.csv_path, args.collection, batch_size=min(args.batch_size, BATCH_SIZE),
+               workers=args.workers, checkpoint_path=args.checkpoint or None, retries=args.retries,
+               strict=args.strict)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+# ASGI entry point, for deployments that front the app with an ASGI server, e.g.
+#   uvicorn asgi:app --host 0.0.0.0 --port 8000
+# This wraps the same WSGI app, which asgiref runs on a thread pool: every request, async views
+# included, holds a thread until it returns, so concurrency is bounded by threads just as under
+# gunicorn. Async views (POST /api/refresh) read Firestore through the one long-lived AsyncClient on
+# firebase_client's persistent event loop
+from asgiref.wsgi import WsgiToAsgi
+from run import create_app
+
+app = WsgiToAsgi(create_app())
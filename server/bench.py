@@ -0,0 +1,254 @@
+# bench.py
+# Benchmarks of the API routes and the mutation parser on synthetic cohorts (see synthetic_cohort.py)
+# of growing size, without Firestore: each cohort is generated, loaded into firebase_client the way a
+# refresh would be, and driven through Flask's test client. Every case runs cold (response / stats
+# caches dropped before each call) and warm, reporting p50 / p99 latency and throughput; each size
+# runs in its own process so its peak RSS is its own.
+#
+#   python bench.py                                   # 1k, 100k and 1M patients
+#   python bench.py --sizes 1000 100000 --save-baseline bench_baseline.json
+#   python bench.py --sizes 1000 100000 --compare bench_baseline.json --tolerance 0.25
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlencode
+import numpy as np
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the API and parser on synthetic cohorts.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='cohort sizes (default: 1k 100k 1M)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic cohorts')
+    parser.add_argument('--iterations', type=int, default=50, help='calls per case and mode (at most)')
+    parser.add_argument('--time-budget', type=float, default=10.0, help='seconds per case and mode before it stops early')
+    parser.add_argument('--full-dump-max', type=int, default=100000,
+                        help='largest cohort the unpaged /patients case runs on')
+    parser.add_argument('--cases', nargs='+', help='only run cases whose name starts with one of these')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    parser.add_argument('--save-baseline', metavar='PATH', help='save the results as the baseline to compare against')
+    parser.add_argument('--compare', metavar='PATH', help='compare with a saved baseline; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative p50 / peak RSS increase counted as a regression (default: 0.2)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help='p50 increases smaller than this are noise, whatever the ratio (default: 0.5)')
+    return parser.parse_args(argv)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Time calls of fn until iterations or the time budget run out (at least 3 calls); reset runs before
+# each call, untimed. items: units of work per call, for throughput
+def measure(fn, reset, iterations, budget, items=1):
+    fn()  # warm-up: imports, first-touch allocations
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < iterations and (len(samples) < 3 or time.perf_counter() - started < budget):
+        if reset is not None:
+            reset()
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    samples = np.array(samples)
+    return {
+        'n':          len(samples),
+        'p50_ms':     round(float(np.percentile(samples, 50)) * 1000, 3),
+        'p99_ms':     round(float(np.percentile(samples, 99)) * 1000, 3),
+        'throughput': round(items * len(samples) / float(samples.sum()), 1),
+    }
+
+
+# A common genotype of the cohort: the most frequent allele_1 and an allele_2 seen with it
+def _common_genotype(store):
+    a1 = store.column('allele_1')
+    a2 = store.column('allele_2')
+    code = int(np.bincount(a1.data[~a1.null]).argmax())
+    rows = np.flatnonzero((a1.data == code) & (a2.data != a2.encode('')))
+    return a1.vocab[code], a2.decode(a2.data[rows[:1]])[0]
+
+
+# {name: (fn, items per call)} for one cohort
+def build_cases(client, store, size, full_dump_max, seed):
+    allele1, allele2 = _common_genotype(store)
+
+    def get(path, **params):
+        url = f"/api/{path}?{urlencode(params)}" if params else f"/api/{path}"
+
+        def call():
+            response = client.get(url)
+            if response.status_code >= 500:
+                raise RuntimeError(f"{url}: HTTP {response.status_code}")
+            return response.data
+        return call, 1
+
+    cases = {
+        'patients_page':     get('patients', limit=1000),
+        'patients_filtered': get('patients', sex='Female', severity=4, fields='sex,severity,dm,oa,di,hl'),
+        'stats':             get('stats/dm'),
+        'stats_filtered':    get('stats/oa', sex='Male', severity=3),
+        'stats_all':         get('stats/all', sex='Female'),
+        'stats_pair':        get('stats/dm', manifestation2='oa'),
+        'relative_stats':    get('relative-stats', value='dm', group='inheritance'),
+        'relative_stats_filtered': get('relative-stats', value='oa', group='n_tm', sex='Male'),
+        'stats_approx':      get('stats/oa', sex='Male', severity=3, exact='false'),
+        'relative_stats_approx': get('relative-stats', value='oa', group='n_tm', sex='Male', exact='false'),
+        'correlations':      get('correlations', sex='Female'),
+        'check_alleles':     get('check_alleles', allele1=allele1, allele2=allele2),
+        'alleles_suggest':   get('alleles/suggest', prefix='c.1'),
+        'score':             get('score', m1=allele1, m2=allele2),
+    }
+    if size <= full_dump_max:
+        cases['patients_all'] = get('patients')
+
+    from mutation_parser import parse_mutation
+    from scoring import score_batch
+    vocab = [a for a in store.column('allele_1').vocab if a][:5000]
+    rng = np.random.default_rng(seed)
+    pairs = [(vocab[i], vocab[j]) for i, j in rng.integers(0, len(vocab), size=(1000, 2)).tolist()]
+    cases['parse_mutation'] = (lambda: [parse_mutation(a) for a in vocab], len(vocab))
+    cases['score_batch'] = (lambda: score_batch(pairs), len(pairs))
+
+    # Bulk aggregation, in-process and over one process per CPU (see parallel_stats.py)
+    from parallel_stats import subgroup_stats
+    from stats_cube import CUBE_VALUE_FEATURES, StatsCube
+    cases['cube_build'] = (lambda: StatsCube(store, workers=1), 1)
+    cases['cube_build_parallel'] = (lambda: StatsCube(store, workers=0), 1)
+    cases['subgroup_stats'] = (lambda: subgroup_stats(store, CUBE_VALUE_FEATURES, workers=1), 1)
+    cases['subgroup_stats_parallel'] = (lambda: subgroup_stats(store, CUBE_VALUE_FEATURES, workers=0), 1)
+    return cases
+
+
+# Cold runs start from empty caches: responses, stats, correlations and parsed mutations
+def reset_caches():
+    import firebase_client
+    from cache import response_cache, stats_cache
+    from mutation_parser import _parse_mutation_cached
+    response_cache.clear()
+    stats_cache.clear()
+    firebase_client._dataset.correlations.clear()
+    _parse_mutation_cached.cache_clear()
+
+
+# Benchmark one cohort size (meant to run in a fresh process): returns its result dict
+def run_size(size, seed, iterations, budget, full_dump_max, only=None):
+    os.environ.setdefault('FIREBASE_OFFLINE', '1')
+    from run import create_app
+    from firebase_client import load_store
+    from synthetic_cohort import generate_store
+
+    t = time.perf_counter()
+    store = generate_store(size, seed)
+    generate_seconds = time.perf_counter() - t
+    t = time.perf_counter()
+    # Builds the filter / genotype indexes and the stats cube, as a refresh would
+    load_store(store)
+    load_seconds = time.perf_counter() - t
+
+    client = create_app(load_data=False).test_client()
+    cases = {}
+    for name, (fn, items) in build_cases(client, store, size, full_dump_max, seed).items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        for mode, reset in (('cold', reset_caches), ('warm', None)):
+            if reset is not None:
+                reset()
+            cases[f'{name}:{mode}'] = result = measure(fn, reset, iterations, budget, items)
+            print(f"  {size:>9} {name + ':' + mode:<32} p50 {result['p50_ms']:>10.3f} ms  "
+                  f"p99 {result['p99_ms']:>10.3f} ms  {result['throughput']:>12.1f}/s", file=sys.stderr, flush=True)
+    return {
+        'generate_seconds': round(generate_seconds, 3),
+        'load_seconds':     round(load_seconds, 3),
+        'peak_rss_mb':      round(peak_rss_mb(), 1),
+        'cases':            cases,
+    }
+
+
+def run(args):
+    results = {}
+    # fork: each size gets a clean process without re-importing everything
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    for size in args.sizes:
+        print(f"[Bench] {size} patients", file=sys.stderr, flush=True)
+        job = (size, args.seed, args.iterations, args.time_budget, args.full_dump_max, args.cases)
+        if context is None:
+            result = run_size(*job)
+        else:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_size, *job).result()
+        results[str(size)] = result
+        print(f"[Bench] {size} patients: generated in {result['generate_seconds']}s, "
+              f"loaded in {result['load_seconds']}s, peak RSS {result['peak_rss_mb']} MB", file=sys.stderr, flush=True)
+    return {
+        'meta': {
+            'created':  time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python':   platform.python_version(),
+            'machine':  platform.machine(),
+            'platform': platform.platform(),
+            'cpus':     os.cpu_count(),
+            'seed':     args.seed,
+        },
+        'results': results,
+    }
+
+
+# Regressions of report against baseline: one line per case (or peak RSS) that got slower / bigger by
+# more than tolerance (and, for latencies, by at least min_delta_ms)
+def compare(report, baseline, tolerance, min_delta_ms=0.0):
+    regressions = []
+    for size, result in report['results'].items():
+        base = baseline['results'].get(size)
+        if base is None:
+            continue
+        print(f"\n{size} patients (vs baseline of {baseline['meta'].get('created')})")
+        rows = [(case, base['cases'][case]['p50_ms'], stats['p50_ms'], min_delta_ms)
+                for case, stats in result['cases'].items() if case in base['cases']]
+        rows.append(('peak_rss_mb', base['peak_rss_mb'], result['peak_rss_mb'], 0.0))
+        for case, before, after, min_delta in rows:
+            ratio = after / before if before else float('inf')
+            flag = ' REGRESSION' if ratio > 1 + tolerance and after - before >= min_delta else ''
+            print(f"  {case:<32} {before:>10.3f} -> {after:>10.3f}  x{ratio:.2f}{flag}")
+            if flag:
+                regressions.append(f"{size} {case}: {before} -> {after}")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+
+    print(f"\n{'size':>9} {'case':<32} {'p50 ms':>10} {'p99 ms':>10} {'per second':>12}")
+    for size, result in report['results'].items():
+        for case, stats in result['cases'].items():
+            print(f"{size:>9} {case:<32} {stats['p50_ms']:>10.3f} {stats['p99_ms']:>10.3f} {stats['throughput']:>12.1f}")
+        print(f"{size:>9} {'peak RSS':<32} {result['peak_rss_mb']:>10.1f} MB")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# cache.py
+from collections import OrderedDict
+from threading import Lock
+
+
+# Thread-safe LRU cache bounded by entry count and total payload size (bytes). Every entry belongs to
+# a dataset version: as soon as a lookup/insert carries a newer version the whole cache is dropped, and
+# lookups/inserts with an older one (requests still pinned to the previous dataset) bypass it
+class LRUCache:
+    def __init__(self, max_entries=1024, max_bytes=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+    def configure(self, max_entries=None, max_bytes=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    # Whether entries of this version can be served / stored: drops every entry if the dataset moved on
+    # since they were stored, and is False for a version older than theirs
+    def _check_version(self, version):
+        if version == self.version:
+            return True
+        if self.version is not None and (version is None or version < self.version):
+            return False
+        self._entries.clear()
+        self._bytes = 0
+        self.version = version
+        return True
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+
+    # Cached value for key under the given dataset version, or None
+    def get(self, key, version=None):
+        with self._lock:
+            entry = self._entries.get(key) if self._check_version(version) else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # Store a value; size is what it counts against max_bytes
+    def put(self, key, value, size, version=None):
+        if size > self.max_bytes:
+            # Also forget an earlier, smaller copy under this key (e.g. before a body was compressed)
+            self.pop(key)
+            return
+        with self._lock:
+            if not self._check_version(version):
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            self._evict()
+
+    # Drop one entry, if present
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# Encoded /stats and /relative-stats responses, keyed by normalized query signature
+stats_cache = LRUCache()
+# Encoded dataset-derived responses (/patients, /data, /get_alleles), keyed by route and query
+response_cache = LRUCache(max_entries=256, max_bytes=64 * 1024 * 1024)
@@ -12,10 +12,72 @@ import json
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev')
+
+    # Where sessions (the tracking list) are kept: 'memory' (in this process, LRU-bounded to
+    # SESSION_MAX_ENTRIES; refused when running several workers), 'redis' (SESSION_REDIS_URL, any
+    # Redis-compatible server) or 'cookie' (Flask's signed-cookie sessions). Unset: 'memory' with one
+    # worker, 'cookie' with several (see sessions.worker_count)
+    SESSION_BACKEND = os.getenv('SESSION_BACKEND', '')
+    SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', 10000))
+    SESSION_REDIS_URL = os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Limits for the /stats and /relative-stats result cache
+    STATS_CACHE_MAX_ENTRIES = int(os.getenv('STATS_CACHE_MAX_ENTRIES', 1024))
+    STATS_CACHE_MAX_BYTES = int(os.getenv('STATS_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+    # Limits for the cache of encoded /patients, /data and /get_alleles responses
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 256))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # Encodings cached responses are pre-compressed in, in order of preference ('br' needs the brotli
+    # package), for bodies of at least RESPONSE_COMPRESS_MIN_BYTES
+    RESPONSE_COMPRESSION = [e.strip() for e in os.getenv('RESPONSE_COMPRESSION', 'br,gzip').split(',') if e.strip()]
+    RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', 1024))
+    # Build the /relative-stats cube on first access instead of when the data loads
+    STATS_CUBE_LAZY = os.getenv('STATS_CUBE_LAZY', '').lower() in ('1', 'true', 'yes')
+    # Processes that building the stats cube of a large cohort (see parallel_stats.PARALLEL_MIN_ROWS) is
+    # spread over: 1 = in-process, 0 = one per CPU
+    STATS_WORKERS = int(os.getenv('STATS_WORKERS', 1))
+    # Serve /stats and /relative-stats from mergeable quantile sketches (see sketch.py) unless a request
+    # asks for exact=true; exact=false gets approximate stats either way. STATS_SKETCH_K trades sketch
+    # size for accuracy (quantile rank error about 1.7% at 200)
+    STATS_APPROXIMATE = os.getenv('STATS_APPROXIMATE', '').lower() in ('1', 'true', 'yes')
+    STATS_SKETCH_K = int(os.getenv('STATS_SKETCH_K', 200))
+    # CSV (start,end) of transmembrane domains used when scoring; defaults to data/wfs1_transmembrane_domains.csv
+    TRANSMEMBRANE_DOMAINS = os.getenv('TRANSMEMBRANE_DOMAINS')
+    # POST /score/batch: max pairs per request, and processes used to parse large batches: 1 = in the
+    # request, else a pool spawned at start-up (0 = one per CPU)
+    SCORE_BATCH_MAX_PAIRS = int(os.getenv('SCORE_BATCH_MAX_PAIRS', 200000))
+    SCORE_BATCH_WORKERS = int(os.getenv('SCORE_BATCH_WORKERS', 1))
+
+    # Most suggestions /alleles/suggest returns at once
+    ALLELE_SUGGEST_MAX_LIMIT = int(os.getenv('ALLELE_SUGGEST_MAX_LIMIT', 100))
+    # Patients serialized per chunk by /patients?stream=
+    PATIENTS_STREAM_CHUNK_ROWS = int(os.getenv('PATIENTS_STREAM_CHUNK_ROWS', 1000))
+
+    # Local patient snapshot: workers boot from it and only read Firestore when it is missing or older
+    # than SNAPSHOT_MAX_AGE seconds (0 = never stale). Off unless SNAPSHOT_DIR is set (e.g. 'snapshot')
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '')
+    SNAPSHOT_MAX_AGE = int(os.getenv('SNAPSHOT_MAX_AGE', 3600))
+    # With SNAPSHOT_DIR set: memory-map the snapshot read-only so all workers share one copy of the data,
+    # and pick up newly published snapshots (checked at most every SNAPSHOT_CHECK_INTERVAL seconds)
+    SHARED_STORE = os.getenv('SHARED_STORE', '1').lower() in ('1', 'true', 'yes')
+    SNAPSHOT_CHECK_INTERVAL = float(os.getenv('SNAPSHOT_CHECK_INTERVAL', 5))
+    # The worker following live changes publishes them as a snapshot at most every
+    # SNAPSHOT_PUBLISH_INTERVAL seconds
+    SNAPSHOT_PUBLISH_INTERVAL = float(os.getenv('SNAPSHOT_PUBLISH_INTERVAL', 5))
+    # Follow changes to the patients collection while running: 'listen' (Firestore listener, falling back
+    # to polling), 'poll' (re-read every LIVE_REFRESH_POLL_INTERVAL seconds and apply the difference), or off
+    LIVE_REFRESH = os.getenv('LIVE_REFRESH', '').lower()
+    LIVE_REFRESH_POLL_INTERVAL = float(os.getenv('LIVE_REFRESH_POLL_INTERVAL', 60))
+    # Bearer token for POST /api/refresh (re-read Firestore now); the route is off when unset
+    REFRESH_TOKEN = os.getenv('REFRESH_TOKEN')
+    # Serve entirely from the snapshot: no credentials and no Firestore access at all
+    FIREBASE_OFFLINE = os.getenv('FIREBASE_OFFLINE', '').lower() in ('1', 'true', 'yes')
     
     firebase_json = os.getenv('FIREBASE_CONFIG')
     if firebase_json:
         FIREBASE_CRED = json.loads(firebase_json)
+    elif FIREBASE_OFFLINE:
+        FIREBASE_CRED = None
     else:
         # Fallback to file path for local dev
         with open('../../firebase.json') as f:
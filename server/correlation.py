@@ -0,0 +1,143 @@
+# correlation.py
+# Pairwise-complete correlation and regression between numeric patient fields: every pair of features
+# is compared over the patients that have both. Pearson correlation, linear regression and the pairwise
+# means / standard deviations all come out of a few matrix products over the masked value matrix;
+# Spearman needs the ranks within each pair's own patients, so it is done pair by pair
+from itertools import combinations
+import numpy as np
+
+# Features /correlations compares: age of onset of each manifestation, and severity
+CORRELATION_FEATURES = ['dm', 'oa', 'di', 'hl', 'severity']
+
+
+# Ranks 1..n of a's values, ties getting the average of the ranks they span
+def rankdata(a):
+    order = np.argsort(a, kind='mergesort')
+    ordered = a[order]
+    first = np.concatenate(([True], ordered[1:] != ordered[:-1]))
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], len(a))
+    ranks = np.empty(len(a), dtype=np.float64)
+    ranks[order] = ((starts + ends + 1) / 2)[np.cumsum(first) - 1]
+    return ranks
+
+
+def _pearson(x, y):
+    x = x - x.mean()
+    y = y - y.mean()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return float(x @ y / np.sqrt((x @ x) * (y @ y)))
+
+
+# Pairwise statistics of a set of features. For features i and j, entry [i, j] of
+#   n          patients having both
+#   mean, std  mean and (population) standard deviation of feature i over those patients
+#   pearson    Pearson correlation (NaN where either feature is constant or n < 2)
+#   slope, intercept   least-squares line predicting feature j from feature i
+#   spearman   Spearman rank correlation
+class Correlations:
+    def __init__(self, features, n, mean, std, pearson, slope, intercept, spearman):
+        self.features = features
+        self.n = n
+        self.mean = mean
+        self.std = std
+        self.pearson = pearson
+        self.slope = slope
+        self.intercept = intercept
+        self.spearman = spearman
+        self._position = {feature: i for i, feature in enumerate(features)}
+
+    # Statistics of one pair as a dict, or None if either feature isn't covered
+    def pair(self, x_feature, y_feature):
+        i = self._position.get(x_feature)
+        j = self._position.get(y_feature)
+        if i is None or j is None:
+            return None
+        return {
+            'n':         int(self.n[i, j]),
+            'pearson':   float(self.pearson[i, j]),
+            'spearman':  float(self.spearman[i, j]),
+            'slope':     float(self.slope[i, j]),
+            'intercept': float(self.intercept[i, j]),
+            'x_mean':    float(self.mean[i, j]),
+            'y_mean':    float(self.mean[j, i]),
+            'x_std':     float(self.std[i, j]),
+            'y_std':     float(self.std[j, i]),
+        }
+
+    # JSON-ready form: {"features", "sample_size", "pearson", "spearman", "regression"}, each statistic a
+    # nested {feature: {feature: value}} dict, rounded to 3 places, with null where it is undefined
+    def to_dict(self):
+        def nested(matrix, cast=lambda v: round(v, 3)):
+            return {
+                fi: {fj: cast(float(matrix[i, j])) if np.isfinite(matrix[i, j]) else None
+                     for j, fj in enumerate(self.features)}
+                for i, fi in enumerate(self.features)
+            }
+
+        slope, intercept = nested(self.slope), nested(self.intercept)
+        return {
+            'features':    self.features,
+            'sample_size': nested(self.n, int),
+            'pearson':     nested(self.pearson),
+            'spearman':    nested(self.spearman),
+            # [x][y]: line predicting y from x
+            'regression':  {fi: {fj: {'slope': slope[fi][fj], 'intercept': intercept[fi][fj]}
+                                 for fj in self.features}
+                            for fi in self.features},
+        }
+
+
+# Correlate features (numeric fields of the store) over the given rows (None = every patient)
+def correlate(store, features=CORRELATION_FEATURES, rows=None):
+    features = list(features)
+    if rows is None:
+        rows = np.arange(len(store))
+    k = len(features)
+    values = np.zeros((len(rows), k), dtype=np.float64)
+    present = np.zeros((len(rows), k), dtype=np.bool_)
+    for i, feature in enumerate(features):
+        col = store.column(feature)
+        if col is None or col.kind == 'str':
+            continue
+        present[:, i] = ~col.null[rows]
+        values[:, i] = np.where(present[:, i], col.data[rows], 0)
+
+    # Center each feature on its overall mean first so the sums below don't lose precision
+    mask = present.astype(np.float64)
+    counts = mask.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        center = np.where(counts > 0, values.sum(axis=0) / counts, 0.0)
+    centered = (values - center) * mask
+
+    n = mask.T @ mask
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # [i, j]: sums of feature i (and its square) over the patients having both i and j
+        sums = centered.T @ mask
+        squares = (centered * centered).T @ mask
+        products = centered.T @ centered
+
+        shifted_mean = sums / n
+        var = squares / n - shifted_mean ** 2
+        # A constant feature leaves rounding residue rather than an exact 0
+        var[~(var > 1e-12 * (1 + (shifted_mean + center[:, None]) ** 2))] = 0
+        cov = products / n - shifted_mean * shifted_mean.T
+        mean = shifted_mean + center[:, None]
+        std = np.sqrt(np.maximum(var, 0))
+        pearson = cov / np.sqrt(var * var.T)
+        slope = cov / var
+        intercept = mean.T - slope * mean
+    pearson[(n < 2) | (var == 0) | (var.T == 0)] = np.nan
+    slope[var == 0] = np.nan
+    intercept[var == 0] = np.nan
+
+    spearman = np.full((k, k), np.nan)
+    for i in range(k):
+        if n[i, i] >= 2:
+            spearman[i, i] = 1.0 if std[i, i] > 0 else np.nan
+    for i, j in combinations(range(k), 2):
+        both = present[:, i] & present[:, j]
+        if both.sum() >= 2:
+            spearman[i, j] = spearman[j, i] = _pearson(rankdata(values[both, i]), rankdata(values[both, j]))
+
+    return Correlations(features, n.astype(np.int64), mean, std, pearson, slope, intercept, spearman)
@@ -0,0 +1,99 @@
+# filter_index.py
+import numpy as np
+
+# Query-string sex values and how they are stored (0 = male, 1 = female)
+SEX_VALUES = {
+    'Male':   0,
+    'Female': 1,
+}
+
+# Manifestation display names (as sent by the client) and their field keys
+MANIFESTATION_KEYS = {
+    'Diabetes Mellitus':  'dm',
+    'Optic Atrophy':      'oa',
+    'Diabetes Insipidus': 'di',
+    'Hearing Loss':       'hl',
+}
+
+
+# Raised when a filter value can't be understood (e.g. an unknown sex)
+class InvalidFilter(ValueError):
+    pass
+
+
+# Stored values of query-string sex / severity filters: (sex, severity), None where not given
+def parse_filters(sex=None, severity=None):
+    if sex and sex not in SEX_VALUES:
+        raise InvalidFilter('Invalid sex value')
+    if severity in (None, ''):
+        return (SEX_VALUES[sex] if sex else None), None
+    try:
+        severity = int(severity)
+    except (TypeError, ValueError):
+        raise InvalidFilter('Invalid severity value')
+    return (SEX_VALUES[sex] if sex else None), severity
+
+
+# Prebuilt boolean-mask indexes over the patient store for the sex, severity and manifestation
+# filters, plus the matching row numbers so that a single filter needs no scan at all
+class FilterIndex:
+    # Fields the index is built from: a change to any other field leaves it valid
+    FIELDS = frozenset(['sex', 'severity', *MANIFESTATION_KEYS.values()])
+
+    def __init__(self, store):
+        self.size = len(store)
+        self.all_rows = np.arange(self.size)
+        self.sex = self._value_index(store, 'sex')
+        self.severity = self._value_index(store, 'severity')
+        self.manifestation = {
+            key: self._entry(store.present(key))
+            for key in MANIFESTATION_KEYS.values()
+        }
+
+    @staticmethod
+    def _entry(mask):
+        return mask, np.flatnonzero(mask)
+
+    # One (mask, rows) entry per distinct non-null value of a field
+    def _value_index(self, store, field):
+        col = store.column(field)
+        if col is None:
+            return {}
+        present = ~col.null
+        index = {}
+        for value in np.unique(col.data[present]):
+            index[col.decode(np.array([value]))[0]] = self._entry((col.data == value) & present)
+        return index
+
+    def _empty(self):
+        return np.zeros(self.size, dtype=bool), np.empty(0, dtype=np.intp)
+
+    # Resolve query-string filters into the individual (mask, rows) entries to combine
+    def _entries(self, sex=None, severity=None, manifestation=None):
+        entries = []
+        sex, severity = parse_filters(sex, severity)
+        if sex is not None:
+            entries.append(self.sex.get(sex) or self._empty())
+
+        if severity is not None:
+            entries.append(self.severity.get(severity) or self._empty())
+
+        if manifestation:
+            key = MANIFESTATION_KEYS.get(manifestation, manifestation)
+            if key in self.manifestation:
+                entries.append(self.manifestation[key])
+        return entries
+
+    # Row numbers of the patients matching every given filter (None/'' means no filter)
+    def select(self, sex=None, severity=None, manifestation=None):
+        entries = self._entries(sex, severity, manifestation)
+        if not entries:
+            return self.all_rows
+        if len(entries) == 1:
+            return entries[0][1]
+        # Start from the smallest match set and probe the other masks only at those rows
+        entries.sort(key=lambda entry: len(entry[1]))
+        rows = entries[0][1]
+        for mask, _ in entries[1:]:
+            rows = rows[mask[rows]]
+        return rows
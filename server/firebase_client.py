@@ -1,73 +1,452 @@
+import asyncio
+import threading
+import time
+import numpy as np
+from flask import g, has_request_context
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
+from patient_store import PatientStore
+from schema import PATIENT_TYPES
+from filter_index import FilterIndex, parse_filters
+from genotype_index import AlleleVocabulary, GenotypeIndex, GENOTYPE_FIELDS
+from stats_cube import SketchCube, StatsCube
+from sketch import DEFAULT_K, merge_summaries
+from correlation import CORRELATION_FEATURES, correlate
+from snapshot import load_snapshot, save_snapshot, read_meta, is_stale, prune_snapshots, current_version, locked as snapshot_lock, try_lock
+from live_refresh import PatientSync, diff_documents
 
 # Global variables
 db = None
-_patients_cache = None
+# The one async Firestore client (AsyncClient) of this process and the event loop it lives on. Its
+# channels belong to that loop, which runs for the life of the process in its own thread; requests,
+# each on a loop of their own, hand their Firestore reads to it (see _on_firestore_loop)
+_async_db = None
+_async_loop = None
+_async_lock = threading.Lock()
+# Build the /relative-stats cube cell by cell on first access instead of at load time
+_cube_lazy = False
+# Processes a full build of the stats cube of a large cohort is spread over (0 = one per CPU)
+_stats_workers = 1
+# Serve approximate stats by default (built with the data), and the size of their quantile sketches
+_approximate = False
+_sketch_k = DEFAULT_K
+# Snapshot root, whether the store is memory-mapped from it (shared by every worker), and which
+# snapshot version is loaded
+_snapshot_dir = None
+_shared = False
+_snapshot_version = None
+_check_interval = 5
+_last_check = 0.0
+# Background Firestore change subscriber (see live_refresh.py), if running, and in shared mode the
+# lock that makes this worker the one that subscribes
+_sync = None
+_refresh_lock = None
+# In shared mode, the subscribing worker publishes its changes as a snapshot at most every
+# SNAPSHOT_PUBLISH_INTERVAL seconds: a burst of changes becomes one snapshot
+_publish_interval = 5
+_publish_timer = None
+_last_publish = 0.0
+# Serializes writers: initial loads, snapshot swaps and incremental changes (re-entrant, so a
+# reconciliation can hold it across its diff and the change it applies)
+_write_lock = threading.RLock()
+# {doc id: Firestore update time} of the loaded documents, when known (they were read from Firestore
+# rather than a snapshot), so a re-read of the collection is diffed by update time, not record by record
+_update_times = None
+# Background load of a snapshot another process published (see sync_shared_store)
+_swap_thread = None
+
+
+# One version of the patient data: the store plus everything derived from it. Never modified once
+# published; a load or an incremental change builds a new Dataset and swaps the module reference,
+# so a request (which pins the dataset it started with, see _current) never sees a half-applied update
+# sketches: approximate stats (SketchCube) already brought up to date for this store, else a new one is
+# built (at once, or as it is used when sketch_lazy)
+# previous / changed: the dataset this one replaces and the fields that differ from it (None = rows were
+# added or removed); indexes and cube cells over untouched fields are carried over instead of rebuilt
+class Dataset:
+    def __init__(self, store, version, cube_lazy=False, cube_workers=1, sketches=None, sketch_lazy=True,
+                 sketch_k=DEFAULT_K, previous=None, changed=None):
+        self.store = store
+        self.version = version
+        carried = previous is not None and changed is not None
+        self.index = previous.index if carried and not changed & FilterIndex.FIELDS else FilterIndex(store)
+        if carried and not changed & GenotypeIndex.FIELDS:
+            self.genotypes = previous.genotypes.for_store(store)
+            self.alleles = previous.alleles
+        else:
+            self.genotypes = GenotypeIndex(store)
+            self.alleles = AlleleVocabulary(self.genotypes)
+        self.cube = StatsCube(store, lazy=cube_lazy, workers=cube_workers,
+                              cells=previous.cube.carry_over(changed) if previous is not None else None)
+        if sketches is None:
+            sketches = SketchCube(store, lazy=sketch_lazy, k=sketch_k,
+                                  pairs=previous.sketches.carry_over(changed) if previous is not None else None)
+        self.sketches = sketches
+        # {(sex, severity): Correlations}, filled in on demand
+        self.correlations = {}
+
+
+# version bumps every time the patient data changes, so derived caches know when they are stale
+_dataset = Dataset(PatientStore.empty(), 0, cube_lazy=True)
+
+
+# The dataset this request works on: the one that was current when the request first asked for it
+def _current():
+    if has_request_context():
+        if 'patient_dataset' not in g:
+            g.patient_dataset = _dataset
+        return g.patient_dataset
+    return _dataset
 
 # Called at server start-up, initialize connection to firebase as db. Retrieve all data and store locally
+# A fresh local snapshot (see snapshot.py) is used instead of reading the collection when available
 def init_firebase(app):
-    # Initialize Firebase Admin SDK and preload all patient records once at startup
+    global db, _cube_lazy, _stats_workers, _approximate, _sketch_k, _snapshot_dir, _shared, _check_interval, _publish_interval
+    _cube_lazy = app.config.get('STATS_CUBE_LAZY', False)
+    _stats_workers = app.config.get('STATS_WORKERS', 1)
+    _approximate = app.config.get('STATS_APPROXIMATE', False)
+    _sketch_k = app.config.get('STATS_SKETCH_K', DEFAULT_K)
+    _snapshot_dir = app.config.get('SNAPSHOT_DIR')
+    _shared = bool(_snapshot_dir) and app.config.get('SHARED_STORE', False)
+    _check_interval = app.config.get('SNAPSHOT_CHECK_INTERVAL', 5)
+    _publish_interval = app.config.get('SNAPSHOT_PUBLISH_INTERVAL', 5)
+
+    if app.config.get('FIREBASE_OFFLINE'):
+        if not _snapshot_dir or not _load_from_snapshot():
+            raise RuntimeError(f"FIREBASE_OFFLINE is set but there is no patient snapshot in {_snapshot_dir!r}")
+        print(f"[Init] Offline: loaded {len(get_store())} patient records from snapshot {_snapshot_version}")
+        return
+
+    # Initialize Firebase Admin SDK
     cred = credentials.Certificate(app.config['FIREBASE_CRED'])
     firebase_admin.initialize_app(cred)
-    global db, _patients_cache
     db = firestore.client()
-    # Single Firestore query at startup
-    docs = db.collection('patients').get()
-    _patients_cache = [doc.to_dict() for doc in docs if doc.exists]
-    print(f"[Init] Preloaded {len(_patients_cache)} patient records into cache")
 
-# Return dict of all patients and their associated data
-def get_patients():
-    return _patients_cache if _patients_cache is not None else []
+    if not _snapshot_dir:
+        _load_from_firestore()
+    else:
+        _init_from_snapshot(app.config.get('SNAPSHOT_MAX_AGE'))
+    start_live_refresh(app.config.get('LIVE_REFRESH'), app.config.get('LIVE_REFRESH_POLL_INTERVAL', 60))
+
+def _init_from_snapshot(max_age):
+    global _snapshot_version
+    # With several workers starting at once, only the first one to get the lock reads Firestore and
+    # publishes a snapshot; the others then find it fresh and just load (or map) it
+    with snapshot_lock(_snapshot_dir):
+        meta = read_meta(_snapshot_dir)
+        if meta is None or is_stale(meta, max_age):
+            _load_from_firestore()
+            try:
+                meta = save_snapshot(get_store(), _snapshot_dir)
+            except (OSError, TypeError) as e:
+                # Serve what was just read; this worker then keeps its own copy
+                print(f"[Init] Couldn't save a patient snapshot ({e}); serving the data read from Firestore")
+                return
+            prune_snapshots(_snapshot_dir)
+            print(f"[Init] Saved patient snapshot {meta['version']}")
+            if not _shared:
+                _snapshot_version = meta['version']
+                return
+        # Shared mode maps the published snapshot, dropping this worker's private copy
+        _load_from_snapshot()
+    print(f"[Init] Loaded {len(get_store())} patient records from snapshot {_snapshot_version}"
+          f"{' (memory-mapped)' if _shared else ''}")
+
+# Single Firestore query for the whole collection
+def _load_from_firestore():
+    global _update_times
+    docs = [doc for doc in db.collection('patients').get() if doc.exists]
+    with _write_lock:
+        load_patients((doc.to_dict() for doc in docs), [doc.id for doc in docs])
+        _update_times = {doc.id: doc.update_time for doc in docs}
+    print(f"[Init] Preloaded {len(get_store())} patient records into cache")
+
+# Load (or, in shared mode, memory-map) the current snapshot; False if there is none
+def _load_from_snapshot():
+    global _snapshot_version, _update_times
+    loaded = load_snapshot(_snapshot_dir, mmap=_shared)
+    if loaded is None:
+        return False
+    with _write_lock:
+        load_store(loaded[0])
+        _snapshot_version = loaded[1]['version']
+        _update_times = None
+    return True
+
+def _swap_in_snapshot():
+    try:
+        _load_from_snapshot()
+        print(f"[Refresh] Switched to patient snapshot {_snapshot_version}")
+    except Exception as e:
+        print(f"[Refresh] Loading patient snapshot failed: {e}")
+
+# Called before requests in shared mode: at most every SNAPSHOT_CHECK_INTERVAL seconds, check whether
+# another process published a new snapshot, and if so load it on a background thread. Requests keep
+# being answered from the current dataset until the new one is built and swapped in. The worker that
+# follows the collection publishes the snapshots and never picks them up
+def sync_shared_store():
+    global _last_check, _swap_thread
+    if not _shared or _refresh_lock is not None:
+        return
+    now = time.monotonic()
+    if now - _last_check < _check_interval:
+        return
+    _last_check = now
+    if _swap_thread is not None and _swap_thread.is_alive():
+        return
+    version = current_version(_snapshot_dir)
+    if version is not None and version != _snapshot_version:
+        _swap_thread = threading.Thread(target=_swap_in_snapshot, name='snapshot-swap', daemon=True)
+        _swap_thread.start()
+
+# Subscribe to changes of the patients collection and apply them as they happen
+# mode: 'listen' (Firestore listener, polling if it can't be started), 'poll', or off when empty.
+# In shared mode only the worker holding the refresh lock subscribes (the others keep trying for it, so
+# one takes over if it exits); it publishes its changes as snapshots, which the other workers then pick
+# up through sync_shared_store
+def start_live_refresh(mode, poll_interval=60):
+    global _sync
+    if not mode or db is None or _sync is not None:
+        return None
+    _sync = PatientSync(db, 'patients', apply_patient_changes, reconcile_documents, poll_interval,
+                        _take_refresh_lock if _shared else None)
+    _sync.start(mode)
+    return _sync
+
+# Become the worker that follows the collection, if no other one is; False if another one is. It then
+# works from the latest published snapshot and stops picking snapshots up (it publishes them itself)
+def _take_refresh_lock():
+    global _refresh_lock
+    lock = try_lock(_snapshot_dir, '.refresh')
+    if lock is None:
+        return False
+    _refresh_lock = lock
+    try:
+        if _swap_thread is not None:
+            _swap_thread.join()
+        if current_version(_snapshot_dir) != _snapshot_version:
+            _load_from_snapshot()
+    except Exception:
+        _refresh_lock = None
+        lock.close()
+        raise
+    return True
+
+# Publish the current data as a snapshot once _publish_interval has passed since the last one (called
+# with _write_lock held after a change). Changes made until then go into the same snapshot
+def _schedule_publish():
+    global _publish_timer
+    if _publish_timer is not None:
+        return
+    delay = max(0.0, _last_publish + _publish_interval - time.monotonic())
+    _publish_timer = threading.Timer(delay, _publish_snapshot)
+    _publish_timer.daemon = True
+    _publish_timer.start()
+
+def _publish_snapshot():
+    global _publish_timer, _last_publish, _snapshot_version
+    with _write_lock:
+        _publish_timer = None
+        _last_publish = time.monotonic()
+        dataset = _dataset
+    try:
+        meta = save_snapshot(dataset.store, _snapshot_dir, source='firestore-changes')
+        prune_snapshots(_snapshot_dir)
+    except Exception as e:
+        print(f"[Refresh] Publishing a patient snapshot failed ({e}); retrying in {_publish_interval}s")
+        with _write_lock:
+            _schedule_publish()
+        return
+    _snapshot_version = meta['version']
+
+# The persistent event loop Firestore is read from asynchronously, started on first use
+def _firestore_loop():
+    global _async_loop
+    with _async_lock:
+        if _async_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='firestore-async', daemon=True).start()
+            _async_loop = loop
+        return _async_loop
+
+# Run a coroutine on the persistent Firestore loop and await its result from the caller's loop
+async def _on_firestore_loop(coro):
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _firestore_loop()))
+
+# The async Firestore client, on the same app as db. Only valid on the persistent Firestore loop
+def get_async_db():
+    global _async_db
+    if db is None:
+        raise RuntimeError('Firestore is not available (offline mode)')
+    if _async_db is None:
+        _async_db = firestore_async.client()
+    return _async_db
+
+# Document snapshots of the whole collection (runs on the persistent Firestore loop)
+async def _stream_patients():
+    return [doc async for doc in get_async_db().collection('patients').stream()]
+
+# Document snapshots of the whole collection, read without blocking the caller's event loop
+async def fetch_patients_async():
+    return await _on_firestore_loop(_stream_patients())
+
+# Re-read the collection and apply whatever differs from the loaded data (like a live-refresh poll).
+# The diff and the new dataset version are built off the event loop. Returns (changed, deleted) counts
+async def refresh_patients_async():
+    docs = await fetch_patients_async()
+    return await asyncio.to_thread(reconcile_documents, docs)
+
+# Bring the loaded data in line with a full read of the collection (document snapshots) and apply the
+# difference. Documents are compared by update time when those of the loaded data are known, else
+# (after loading a snapshot) record by record, once. Returns (changed, deleted) counts
+def reconcile_documents(docs):
+    global _update_times
+    with _write_lock:
+        upserts, deletes, times = diff_documents(docs, _update_times, get_records_by_id)
+        if upserts or deletes:
+            apply_patient_changes(upserts, deletes)
+        _update_times = times
+    return len(upserts), len(deletes)
+
+# Build the columnar patient store (and its filter / genotype indexes and stats cube) from an iterable of patient dicts
+# ids: Firestore document id of each record (defaults to the record's 'id' field)
+def load_patients(records, ids=None):
+    return load_store(PatientStore.from_records(records, PATIENT_TYPES, ids))
+
+# Dataset for a store, set up as configured (previous / changed / sketches: see Dataset)
+def _new_dataset(store, version, previous=None, changed=None, sketches=None):
+    return Dataset(store, version, _cube_lazy, _stats_workers, sketches, sketch_lazy=_cube_lazy or not _approximate,
+                   sketch_k=_sketch_k, previous=previous, changed=changed)
+
+# Make a ready-built patient store the current one, with fresh indexes and stats cube
+def load_store(store):
+    global _dataset
+    with _write_lock:
+        _dataset = _new_dataset(store, _dataset.version + 1)
+    return store
+
+# Apply changed documents ({doc id: record}) and deleted doc ids to the current data without reloading
+# it. The new version is built on the side and swapped in at once; columns, indexes and stats cube cells
+# the change can't affect are carried over, and when the change only adds patients they are added to
+# the approximate stats instead of rebuilding them. times: {doc id: update time} of the upserted
+# documents, if known. In shared mode the change reaches the other workers with the next published
+# snapshot (see _schedule_publish). Returns the new store
+def apply_patient_changes(upserts, deletes=(), times=None):
+    global _dataset
+    with _write_lock:
+        current = _dataset
+        store, changed = current.store.apply_changes(upserts, deletes, PATIENT_TYPES)
+        # Only new documents and no deletions: exactly one row more per upsert
+        sketches = None
+        if len(store) == len(current.store) + len(upserts):
+            sketches = current.sketches.with_records(store, upserts.values())
+        _dataset = _new_dataset(store, current.version + 1, current, changed, sketches)
+        if _shared:
+            _schedule_publish()
+        if _update_times is not None:
+            for doc_id in deletes:
+                _update_times.pop(doc_id, None)
+            _update_times.update(times or dict.fromkeys(upserts))
+    print(f"[Refresh] Applied {len(upserts)} changed and {len(deletes)} deleted patient records "
+          f"({len(store)} total)")
+    return store
+
+# {doc id: patient dict} of the current data, to diff against the collection when update times aren't known
+def get_records_by_id():
+    store = _dataset.store
+    return dict(zip(store.ids(), store.to_records()))
+
+# Version of the currently loaded patient data
+def get_dataset_version():
+    return _current().version
+
+# Return the columnar patient store (empty if nothing has been loaded)
+def get_store():
+    return _current().store
+
+# Row numbers of the patients matching the sex / severity / manifestation filters (query-string values)
+def select_patients(sex=None, severity=None, manifestation=None):
+    return _current().index.select(sex, severity, manifestation)
+
+# Return dict of all patients and their associated data, optionally only for the given rows
+def get_patients(rows=None):
+    return get_store().to_records(rows)
 
 # Gets all the values for a specific feature
 def get_feature(feature):
-    return [record.get(feature) for record in _patients_cache if record.get(feature) is not None]
+    return get_store().values(feature)
 
 # Gets all the values for a specific feature, for only those instances that fit within the chosen group
-def get_feature_grouped(value_feature, group_feature):
-    grouped = {}
-    for record in _patients_cache:
-        val = record.get(value_feature)
-        grp = record.get(group_feature)
-        if val is None or grp is None:
-            continue
-        grouped.setdefault(grp, []).append(val)
-    return grouped
+# sex / severity optionally restrict the patients considered, as in select_patients
+def get_feature_grouped(value_feature, group_feature, sex=None, severity=None):
+    rows = select_patients(sex=sex, severity=severity) if sex or severity else None
+    return get_store().grouped_values(value_feature, group_feature, rows)
+
+# Same as get_feature_grouped, but as arrays ready for batched stats: (values, group keys, decode)
+# where decode turns the (stored) group keys back into python values
+def get_feature_grouped_arrays(value_feature, group_feature, sex=None, severity=None):
+    rows = select_patients(sex=sex, severity=severity) if sex or severity else None
+    return get_store().grouped_arrays(value_feature, group_feature, rows)
+
+# Precomputed {group: stats} of value_feature grouped by group_feature over the whole cohort,
+# or None if the pair isn't part of the stats cube
+def get_grouped_stats(value_feature, group_feature):
+    return _current().cube.get(value_feature, group_feature)
+
+# Approximate stats (see SketchCube) of the values of the given features taken together, among the
+# patients matching the sex / severity filters: stats dict, {} if there are none, or None if a feature
+# isn't covered by the sketches
+def get_approximate_stats(features, sex=None, severity=None):
+    sketches = _current().sketches
+    sex, severity = parse_filters(sex, severity)
+    parts = []
+    for feature in features:
+        found = sketches.summaries(feature, None, sex, severity)
+        if found is None:
+            return None
+        parts.extend(found.values())
+    merged = merge_summaries(parts, sketches.k)
+    return merged.stats() if len(merged) else {}
+
+# Approximate {group: stats} of value_feature grouped by group_feature among the patients matching the
+# sex / severity filters, or None if the pair isn't covered by the sketches
+def get_approximate_grouped_stats(value_feature, group_feature, sex=None, severity=None):
+    found = _current().sketches.summaries(value_feature, group_feature, *parse_filters(sex, severity))
+    if found is None:
+        return None
+    return {group: summary.stats() for group, summary in found.items()}
+
+# Pairwise correlations of CORRELATION_FEATURES among the patients matching the sex / severity filters
+# (see correlation.py), computed once per subgroup for each version of the data
+def get_correlations(sex=None, severity=None):
+    dataset = _current()
+    key = parse_filters(sex, severity)
+    rows = dataset.index.select(sex, severity)
+    result = dataset.correlations.get(key)
+    if result is None:
+        result = dataset.correlations[key] = correlate(dataset.store, CORRELATION_FEATURES, rows)
+    return result
 
 # Get all of allele_1 and all of allele_2
 def get_allele_data():
-    data = []
-    for record in _patients_cache:
-        a1 = record.get("allele_1")
-        a2 = record.get("allele_2")
-        if a1 is not None and a2 is not None:
-            data.append({
-                "allele_1": a1,
-                "allele_2": a2
-            })
-    return data
+    store = get_store()
+    rows = np.flatnonzero(store.present("allele_1") & store.present("allele_2"))
+    return store.to_records(rows, ["allele_1", "allele_2"])
+
+# Up to limit (allele, patient count) suggestions for an allele starting with prefix, most common first;
+# with allele_1 given, the allele_2 values recorded with that allele_1
+def suggest_alleles(prefix='', limit=10, allele_1=None):
+    return _current().alleles.suggest(prefix, limit, allele_1)
+
+# Patient records (genotype fields only) whose allele_1 / allele_2 match a1 and a2 (a2 None = any allele_2)
+def find_alleles(a1, a2):
+    return _current().genotypes.lookup(a1, a2)
 
 # Get the full patient data associated with a given combination of alleles
 def get_data_given_alleles(a1, a2):
-    fields = ["allele_1", "allele_2", "inheritance", "dm", "oa", "di", "hl", 'sex', 'severity']
-    data = { field: [] for field in fields }
-
-    for record in _patients_cache:
-        if record.get("allele_1") == a1 and (a2 is None or record.get("allele_2") == a2):
-            data["allele_1"].append(record.get("allele_1"))
-            data["allele_2"].append(record.get("allele_2"))
-            for feature in fields[2:]:
-                data[feature].append(record.get(feature))
-    return data
+    records = find_alleles(a1, a2)
+    return { field: [record.get(field) for record in records] for field in GENOTYPE_FIELDS }
 
 # Determine if for any one patient, their feature "allele_1" and "allele_2" match a1 and a2 provided
 def check_alleles(a1, a2):
-    for record in _patients_cache:
-        if a2 is None and record.get("allele_1") == a1:
-            return True
-
-        if record.get("allele_1") == a1 and record.get("allele_2") == a2:
-            return True
-    return False
+    return bool(find_alleles(a1, a2))
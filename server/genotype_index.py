@@ -0,0 +1,126 @@
+# genotype_index.py
+import bisect
+import heapq
+import numpy as np
+
+# Fields returned for each patient matched by a genotype lookup
+GENOTYPE_FIELDS = ["allele_1", "allele_2", "inheritance", "dm", "oa", "di", "hl", 'sex', 'severity']
+
+
+# Hash indexes from (allele_1, allele_2) and from allele_1 alone to the matching rows of the
+# patient store, built once at load time so lookups don't scan the cohort
+class GenotypeIndex:
+    def __init__(self, store):
+        self.store = store
+        self.by_pair = {}
+        self.by_allele_1 = {}
+        self._records = {}
+
+        a1 = store.column("allele_1")
+        if a1 is None:
+            return
+        a2 = store.column("allele_2")
+
+        rows = np.flatnonzero(~a1.null)
+        self.by_allele_1 = self._group(rows, a1.data[rows], a1.decode)
+
+        if a2 is None:
+            return
+        # Pack both codes into one int64 key so a single sort groups every genotype
+        width = len(a2.vocab) + 1
+        pair_codes = a1.data[rows].astype(np.int64) * width + (a2.data[rows] + 1)
+
+        def decode_pairs(codes):
+            return list(zip(a1.decode(codes // width), a2.decode(codes % width - 1)))
+
+        self.by_pair = self._group(rows, pair_codes, decode_pairs)
+
+    # Fields the row groups are built from
+    FIELDS = frozenset(['allele_1', 'allele_2'])
+
+    # Index over store, which has the same allele_1 / allele_2 values row for row as this index's
+    # store: the row groups are shared, the memoized records start over
+    def for_store(self, store):
+        index = GenotypeIndex.__new__(GenotypeIndex)
+        index.store = store
+        index.by_pair = self.by_pair
+        index.by_allele_1 = self.by_allele_1
+        index._records = {}
+        return index
+
+    # {decoded key: rows} for rows grouped by their (encoded) key
+    @staticmethod
+    def _group(rows, keys, decode):
+        order = np.argsort(keys, kind='stable')
+        uniq, starts = np.unique(keys[order], return_index=True)
+        ordered_rows = rows[order]
+        bounds = starts.tolist() + [len(rows)]
+        return {
+            key: ordered_rows[bounds[i]:bounds[i + 1]]
+            for i, key in enumerate(decode(uniq))
+        }
+
+    # Rows of the patients with allele_1 == a1 and (unless a2 is None) allele_2 == a2
+    def rows(self, a1, a2=None):
+        if a2 is None:
+            return self.by_allele_1.get(a1)
+        return self.by_pair.get((a1, a2))
+
+    # Patient records (GENOTYPE_FIELDS only) for a genotype, memoized per key
+    def lookup(self, a1, a2=None):
+        key = (a1, a2)
+        records = self._records.get(key)
+        if records is None:
+            rows = self.rows(a1, a2)
+            if rows is None:
+                return []
+            records = self.store.to_records(rows, GENOTYPE_FIELDS)
+            self._records[key] = records
+        return records
+
+
+# Deduplicated allele_1 values with a sorted prefix index, plus the allele_2 partners seen with each,
+# all ranked by how many patients carry them. Built from a GenotypeIndex
+class AlleleVocabulary:
+    def __init__(self, genotypes):
+        # Blank alleles are left out: they are no use as suggestions
+        counts = {a1: len(rows) for a1, rows in genotypes.by_allele_1.items() if a1}
+        # Matching is case-insensitive: sorted casefolded keys, bisected for a prefix's range
+        entries = sorted((str(a1).casefold(), a1) for a1 in counts)
+        self._keys = [key for key, _ in entries]
+        self._alleles = [a1 for _, a1 in entries]
+        self._counts = [counts[a1] for a1 in self._alleles]
+        self._ranked = self._rank(range(len(self._alleles)))
+
+        partners = {}
+        for (a1, a2), rows in genotypes.by_pair.items():
+            if a1 and a2:
+                partners.setdefault(a1, []).append((a2, len(rows)))
+        self._partners = {
+            a1: sorted(pairs, key=lambda pair: (-pair[1], str(pair[0])))
+            for a1, pairs in partners.items()
+        }
+
+    def __len__(self):
+        return len(self._alleles)
+
+    # Positions sorted by count (highest first), then alphabetically
+    def _rank(self, positions):
+        return sorted(positions, key=lambda i: (-self._counts[i], self._keys[i]))
+
+    # Up to limit (allele, patient count) pairs starting with prefix, most common first.
+    # With allele_1 given, suggests allele_2 values seen together with it instead
+    def suggest(self, prefix='', limit=10, allele_1=None):
+        prefix = prefix.casefold()
+        if allele_1 is not None:
+            pairs = self._partners.get(allele_1, [])
+            return [pair for pair in pairs if str(pair[0]).casefold().startswith(prefix)][:limit]
+
+        if not prefix:
+            positions = self._ranked[:limit]
+        else:
+            lo = bisect.bisect_left(self._keys, prefix)
+            # Every key starting with prefix sorts below prefix + the highest code point
+            hi = bisect.bisect_left(self._keys, prefix + '\U0010ffff', lo)
+            positions = heapq.nsmallest(limit, range(lo, hi), key=lambda i: (-self._counts[i], self._keys[i]))
+        return [(self._alleles[i], self._counts[i]) for i in positions]
@@ -0,0 +1,75 @@
+# json_provider.py
+# Flask JSON provider that encodes with orjson when it is installed and with the standard library
+# otherwise. Both understand numpy scalars and arrays, so routes can hand over store values as they are.
+# Install with app.json = JSONProvider(app)
+import numpy as np
+import dataclasses
+import decimal
+import uuid
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# numpy values for the standard library encoder (orjson handles them natively)
+def _numpy_default(o):
+    if isinstance(o, np.integer):
+        return int(o)
+    if isinstance(o, np.floating):
+        return float(o)
+    if isinstance(o, np.bool_):
+        return bool(o)
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    # What Flask's own provider encodes
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class JSONProvider(DefaultJSONProvider):
+    default = staticmethod(_numpy_default)
+
+    # Serialize to bytes: the form responses and caches want, without the str round trip
+    def dumps_bytes(self, obj, indent=False):
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:
+                # Out of orjson's range (e.g. ints over 64 bits, unusual key types); the standard
+                # library has the final say
+                pass
+        kwargs = {'indent': 2} if indent else {'separators': (',', ':')}
+        return super().dumps(obj, **kwargs).encode()
+
+    def dumps(self, obj, **kwargs):
+        # Options orjson doesn't have go straight to the standard library
+        if orjson is None or set(kwargs) - {'indent', 'separators'}:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj, indent=bool(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,138 @@
+# live_refresh.py
+# Keeps the in-memory patient data in step with the Firestore collection without reloading it:
+# a background subscriber turns collection changes into (upserts, deletes) and hands them to an apply
+# function (firebase_client.apply_patient_changes), which builds and swaps in the next data version.
+# Changes come from a Firestore listener (on_snapshot); if it can't be started, or stops, the
+# subscriber falls back to polling the collection and diffing it against the loaded data by
+# document update time (firebase_client.reconcile_documents)
+import threading
+
+
+# Whether a local record (every store field, None where missing) holds the same data as a document
+def same_record(local, remote):
+    return (all(local.get(key) == value for key, value in remote.items())
+            and all(value is None for key, value in local.items() if key not in remote))
+
+
+# Changes that turn the local records into the remote ones, both {doc id: record}: (upserts, deletes)
+def diff_records(local, remote):
+    upserts = {doc_id: record for doc_id, record in remote.items()
+               if doc_id not in local or not same_record(local[doc_id], record)}
+    deletes = set(local) - set(remote)
+    return upserts, deletes
+
+
+# Changes that turn the loaded data into a full read of the collection (document snapshots):
+# (upserts, deletes, {doc id: update time} of the read). known: {doc id: update time} of the loaded
+# documents, so only new or rewritten documents are decoded; when it is None, records() gives the
+# loaded data as {doc id: record} to compare field by field instead
+def diff_documents(docs, known, records):
+    docs = {doc.id: doc for doc in docs if doc.exists}
+    times = {doc_id: doc.update_time for doc_id, doc in docs.items()}
+    if known is None:
+        upserts, deletes = diff_records(records(), {doc_id: doc.to_dict() for doc_id, doc in docs.items()})
+    else:
+        upserts = {doc_id: doc.to_dict() for doc_id, doc in docs.items() if known.get(doc_id) != times[doc_id]}
+        deletes = set(known) - set(docs)
+    return upserts, deletes, times
+
+
+class PatientSync:
+    # apply(upserts, deletes, times) applies changes; reconcile(docs) applies whatever differs between
+    # the loaded data and a full read of the collection. acquire(), if given, says whether this process
+    # may follow the collection (e.g. holds the lock only one worker gets); until it does it is asked
+    # again every poll_interval
+    def __init__(self, db, collection, apply, reconcile, poll_interval=60, acquire=None):
+        self.db = db
+        self.collection = collection
+        self.apply = apply
+        self.reconcile = reconcile
+        self.poll_interval = poll_interval
+        self.acquire = acquire
+        self.mode = None
+        self._requested = None
+        self._watch = None
+        self._first = True
+        self._stop = threading.Event()
+        self._thread = None
+
+    # mode: 'listen' or 'poll'
+    def start(self, mode='listen'):
+        self._requested = mode
+        if self.acquire is None or self.acquire():
+            self._subscribe()
+        else:
+            print(f"[Refresh] Another process follows '{self.collection}'; retrying every {self.poll_interval}s")
+        # Polls in poll mode; in listen mode watches the listener and takes over if it dies
+        self._thread = threading.Thread(target=self._run, name='patient-sync', daemon=True)
+        self._thread.start()
+
+    def _subscribe(self):
+        if self._requested == 'listen':
+            try:
+                self._watch = self.db.collection(self.collection).on_snapshot(self._on_snapshot)
+                self.mode = 'listen'
+            except Exception as e:
+                print(f"[Refresh] Couldn't start the Firestore listener ({e}); polling every {self.poll_interval}s")
+        if self.mode is None:
+            self.mode = 'poll'
+        print(f"[Refresh] Following changes to '{self.collection}' ({self.mode})")
+
+    def stop(self):
+        self._stop.set()
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            if self.mode is None:
+                try:
+                    acquired = self.acquire()
+                except Exception as e:
+                    print(f"[Refresh] Taking over '{self.collection}' failed: {e}")
+                    continue
+                if not acquired:
+                    continue
+                self._subscribe()
+                # A listener starts with a full read; a poller catches up at once
+                if self.mode == 'listen':
+                    continue
+            if self.mode == 'listen':
+                if getattr(self._watch, 'is_active', True):
+                    continue
+                print("[Refresh] Firestore listener stopped; falling back to polling")
+                self._watch = None
+                self.mode = 'poll'
+            self.poll()
+
+    # Read the whole collection and apply whatever differs from the loaded data
+    def poll(self):
+        try:
+            self.reconcile(self.db.collection(self.collection).get())
+        except Exception as e:
+            print(f"[Refresh] Polling '{self.collection}' failed: {e}")
+
+    # Listener callback (runs on Firestore's thread). The first call delivers the whole collection,
+    # which is diffed against the data loaded at start-up; later calls deliver only what changed
+    def _on_snapshot(self, docs, changes, read_time):
+        try:
+            if self._first:
+                self._first = False
+                self.reconcile(docs)
+                return
+            upserts, deletes, times = {}, set(), {}
+            for change in changes:
+                doc_id = change.document.id
+                if change.type.name == 'REMOVED':
+                    upserts.pop(doc_id, None)
+                    times.pop(doc_id, None)
+                    deletes.add(doc_id)
+                else:
+                    deletes.discard(doc_id)
+                    upserts[doc_id] = change.document.to_dict()
+                    times[doc_id] = change.document.update_time
+            if upserts or deletes:
+                self.apply(upserts, deletes, times)
+        except Exception as e:
+            print(f"[Refresh] Applying Firestore changes failed: {e}")
@@ -0,0 +1,155 @@
+# metrics.py
+# In-process request instrumentation, exposed in the Prometheus text format: per-route request counts,
+# latency and response size histograms, time per phase of a request (store / stats / serialize, see
+# timed) and hit ratios of the response caches. Each worker process keeps its own numbers
+import bisect
+import time
+from contextlib import contextmanager
+from threading import Lock
+from flask import g, has_request_context, request
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(tuple(zip(self.label_names, labels)))} {value}")
+        return lines
+
+
+# Cumulative-bucket histogram, as Prometheus expects: per label set, counts per upper bound plus the
+# total count and sum
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, labels, value):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][slot] += 1
+            series[1] += 1
+            series[2] += value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, count, total) in sorted(self._series.items()):
+                named = tuple(zip(self.label_names, labels))
+                cumulative = 0
+                for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += bucket
+                    lines.append(f"{self.name}_bucket{_labels(named + (('le', _number(bound)),))} {cumulative}")
+                lines.append(f"{self.name}_count{_labels(named)} {count}")
+                lines.append(f"{self.name}_sum{_labels(named)} {total}")
+        return lines
+
+
+def _number(value):
+    return value if isinstance(value, str) else repr(float(value))
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+requests_total = Counter('api_requests_total', 'API requests by route, method and status',
+                         ('endpoint', 'method', 'status'))
+request_seconds = Histogram('api_request_duration_seconds', 'API request latency', ('endpoint', 'method'),
+                            LATENCY_BUCKETS)
+response_bytes = Histogram('api_response_size_bytes', 'API response body size', ('endpoint',), SIZE_BUCKETS)
+phase_seconds = Histogram('api_phase_duration_seconds', 'Time spent per phase of an API request',
+                          ('endpoint', 'phase'), LATENCY_BUCKETS)
+
+# {name: LRUCache} reported as cache hits / misses / size
+_caches = {}
+
+
+def register_cache(name, cache):
+    _caches[name] = cache
+
+
+# Time a phase of the current request ('store', 'stats', 'serialize', ...); phases repeated within
+# one request add up. Outside a request it does nothing
+@contextmanager
+def timed(phase):
+    if not has_request_context():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = g.setdefault('metric_phases', {})
+        phases[phase] = phases.get(phase, 0.0) + time.perf_counter() - start
+
+
+def _before_request():
+    g.metric_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.pop('metric_start', None)
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'unknown'
+    requests_total.inc((endpoint, request.method, str(response.status_code)))
+    request_seconds.observe((endpoint, request.method), time.perf_counter() - start)
+    # Streamed bodies have no length up front
+    if response.content_length is not None:
+        response_bytes.observe((endpoint,), response.content_length)
+    for phase, seconds in g.pop('metric_phases', {}).items():
+        phase_seconds.observe((endpoint, phase), seconds)
+    return response
+
+
+# Record every request of a blueprint
+def instrument(blueprint):
+    blueprint.before_request(_before_request)
+    blueprint.after_request(_after_request)
+
+
+# Everything in the Prometheus text exposition format
+def render():
+    lines = []
+    for metric in (requests_total, request_seconds, response_bytes, phase_seconds):
+        lines.extend(metric.expose())
+    if _caches:
+        for metric, attribute, help_text in (
+            ('cache_hits_total', 'hits', 'Cache lookups that found an entry'),
+            ('cache_misses_total', 'misses', 'Cache lookups that found nothing'),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{cache="{name}"}} {getattr(cache, attribute)}' for name, cache in _caches.items()]
+        lines += ["# HELP cache_hit_ratio Share of cache lookups that hit", "# TYPE cache_hit_ratio gauge"]
+        for name, cache in _caches.items():
+            lookups = cache.hits + cache.misses
+            lines.append(f'cache_hit_ratio{{cache="{name}"}} {cache.hits / lookups if lookups else 0.0}')
+        lines += ["# HELP cache_size_bytes Bytes held by a cache", "# TYPE cache_size_bytes gauge"]
+        lines += [f'cache_size_bytes{{cache="{name}"}} {cache.size_bytes}' for name, cache in _caches.items()]
+    return '\n'.join(lines) + '\n'
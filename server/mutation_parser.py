@@ -0,0 +1,285 @@
+# mutation_parser.py
+import logging
+import re
+from functools import lru_cache
+from transmembrane import DomainTable, is_in_transmembrane, set_domain_table
+
+logger = logging.getLogger(__name__)
+
+# Number of distinct raw mutation strings whose parse result is memoized
+PARSE_CACHE_SIZE = 4096
+
+AA_THREE_TO_ONE = {
+    'Ala':'A','Arg':'R','Asn':'N','Asp':'D','Cys':'C',
+    'Gln':'Q','Glu':'E','Gly':'G','His':'H','Ile':'I',
+    'Leu':'L','Lys':'K','Met':'M','Phe':'F','Pro':'P',
+    'Ser':'S','Thr':'T','Trp':'W','Tyr':'Y','Val':'V',
+    'Ter':'*','Sec':'U','Pyl':'O'
+}
+
+INFO_FIELDS = [
+    'notation_type','aa_format','orig_aa','new_aa',
+    'start','end','ref','alt','position',
+    'mutation_type','is_transmembrane'
+]
+
+# Protein notations, tried in this order (first full match wins)
+PROTEIN_PATTERNS = [
+    # three‐letter nonsense: p.Glu753* or p.Glu753X
+    ('nonsense_3', r'(?:p\.)?([A-Za-z]{3})(\d+)(\*|X)'),
+    ('del_single', r'(?:p\.)?([A-Za-z]{3})(\d+)del'),
+    ('del_range',  r'(?:p\.)?([A-Za-z]{3})(\d+)_([A-Za-z]{3})(\d+)del'),
+    ('dup_range',  r'(?:p\.)?([A-Za-z]{3})(\d+)_([A-Za-z]{3})(\d+)dup'),
+    ('ins',        r'(?:p\.)?([A-Za-z]{3})(\d+)_([A-Za-z]{3})(\d+)ins([A-Za-z]{3})'),
+    ('sub_3',      r'(?:p\.)?([A-Za-z]{3})(\d+)([A-Za-z]{3})(fs\*?\d*|\*|X)?'),
+    ('sub_1',      r'(?:p\.)?([ACDEFGHIKLMNPQRSTVWY])'      # orig
+                   r'(\d+)'                                   # pos
+                   r'([ACDEFGHIKLMNPQRSTVWYX\*])'            # new
+                   r'(fs\*?\d*)?'),                          # optional frameshift suffix
+]
+
+# Coding-DNA notations, tried in this order (first full match wins)
+CODING_PATTERNS = [
+    ('substitution', r'c\.(\d+)([ACGTNatgcy]+)>([ACGTNatgcy]+)'),
+    ('delins',       r'c\.(\d+)_(\d+)delins([A-Za-z0-9]+)'),
+    ('insertion',    r'c\.(\d+)_(\d+)ins([A-Za-z0-9]+)'),
+    ('duplication',  r'c\.(\d+)(?:_(\d+))?dup([A-Za-z0-9]*)'),
+    ('deletion',     r'c\.(\d+)(?:_(\d+))?del([A-Za-z0-9]+)'),
+]
+
+
+# Fold an ordered list of (kind, pattern) into one anchored alternation. Each alternative is wrapped
+# in a group named after its kind, so match.lastgroup says which one matched; the returned slots
+# map each kind to the range of its own capture groups
+def _compile_dispatcher(patterns):
+    parts = []
+    slots = {}
+    index = 1
+    for kind, pattern in patterns:
+        count = re.compile(pattern).groups
+        parts.append(f'(?P<{kind}>{pattern})')
+        slots[kind] = range(index + 1, index + 1 + count)
+        index += 1 + count
+    return re.compile('^(?:' + '|'.join(parts) + ')$', re.IGNORECASE), slots
+
+
+_PROTEIN_DISPATCH, _PROTEIN_SLOTS = _compile_dispatcher(PROTEIN_PATTERNS)
+_CODING_DISPATCH, _CODING_SLOTS = _compile_dispatcher(CODING_PATTERNS)
+_PAREN_PROTEIN = re.compile(r'\((p\.[^)]+)\)')
+_TRAILING_PROTEIN = re.compile(r'\s*\(p\.[^)]+\)')
+
+
+# Match a string against a dispatcher: (kind, groups of that kind) or (None, None)
+def _dispatch(dispatcher, slots, mutation):
+    m = dispatcher.match(mutation)
+    if not m:
+        return None, None
+    kind = m.lastgroup
+    return kind, tuple(m.group(i) for i in slots[kind])
+
+
+# Parse a mutation given in protein and/or coding-DNA notation. Results are memoized per raw string;
+# callers get their own copy of the info dict
+def parse_mutation(mutation):
+    return dict(_parse_mutation_cached(mutation))
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_mutation_cached(mutation):
+    logger.debug("parsing mutation %r", mutation)
+    prot = None
+
+    # 1) "(p.…)" notation?
+    m = _PAREN_PROTEIN.search(mutation)
+    if m:
+        prot = m.group(1)
+    # 2) bare "p.…"
+    elif mutation.lower().startswith("p."):
+        prot = mutation
+
+    if prot:
+        try:
+            return parse_protein_mutation(prot)
+        except ValueError as e:
+            logger.debug("protein parse failed: %s", e)
+            # fall back to coding‐DNA
+            pass
+
+    # strip off any trailing " (p.…)" before coding parse
+    coding_only = _TRAILING_PROTEIN.sub('', mutation)
+    return parse_coding_sequence_mutation(coding_only)
+
+
+def parse_protein_mutation(mutation):
+    kind, groups = _dispatch(_PROTEIN_DISPATCH, _PROTEIN_SLOTS, mutation)
+    if kind is None:
+        raise ValueError(f"Unrecognized protein mutation format: {mutation!r}")
+
+    info = dict.fromkeys(INFO_FIELDS, None)
+    info['notation_type'] = 'protein'
+
+    if kind == 'nonsense_3':
+        orig3, pos, _ = groups
+        orig3 = orig3.title()
+        info.update({
+            'aa_format':     'three_letter',
+            'orig_aa':       AA_THREE_TO_ONE[orig3],
+            'new_aa':        '*',
+            'start':         int(pos),
+            'end':           int(pos),
+            'position':      int(pos),
+            'mutation_type': 'nonsense'
+        })
+
+    elif kind == 'del_single':
+        orig3, pos = groups
+        orig3 = orig3.title()
+        info.update({
+            'aa_format':     'three_letter',
+            'orig_aa':       AA_THREE_TO_ONE[orig3],
+            'new_aa':        None,
+            'start':         int(pos),
+            'end':           int(pos),
+            'position':      int(pos),
+            'mutation_type': 'deletion'
+        })
+
+    elif kind == 'del_range':
+        _, s, _, e = groups
+        info.update({
+            'aa_format':     'three_letter',
+            'start':         int(s),
+            'end':           int(e),
+            'position':      int(s),
+            'mutation_type': 'deletion'
+        })
+
+    elif kind == 'dup_range':
+        _, s, _, e = groups
+        info.update({
+            'aa_format':     'three_letter',
+            'start':         int(s),
+            'end':           int(e),
+            'position':      int(s),
+            'mutation_type': 'duplication'
+        })
+
+    elif kind == 'ins':
+        _, s, _, e, ins3 = groups
+        ins3 = ins3.title()
+        info.update({
+            'aa_format':     'three_letter',
+            'new_aa':        AA_THREE_TO_ONE[ins3],
+            'start':         int(s),
+            'end':           int(e),
+            'position':      int(s),
+            'mutation_type': 'insertion'
+        })
+
+    elif kind == 'sub_3':
+        orig3, pos, new3, suffix = groups
+        orig3, new3 = orig3.title(), new3.title()
+        one_orig = AA_THREE_TO_ONE[orig3]
+        one_new  = AA_THREE_TO_ONE[new3]
+        info.update({
+            'aa_format':     'three_letter',
+            'orig_aa':       one_orig,
+            'new_aa':        one_new,
+            'position':      int(pos),
+        })
+        if suffix and suffix.lower().startswith('fs'):
+            info['mutation_type'] = 'frameshift'
+        elif one_new == '*' or suffix in ('*', 'X'):
+            info['mutation_type'] = 'nonsense'
+        else:
+            info['mutation_type'] = 'missense'
+
+    elif kind == 'sub_1':
+        orig1, pos, new1, suffix = groups
+        orig1, new1 = orig1.upper(), new1.upper()
+        info.update({
+            'aa_format':     'one_letter',
+            'orig_aa':       orig1,
+            'new_aa':        new1,
+            'position':      int(pos),
+        })
+        if suffix and suffix.lower().startswith('fs'):
+            info['mutation_type'] = 'frameshift'
+        elif new1 in ('*', 'X'):
+            info['mutation_type'] = 'nonsense'
+        else:
+            info['mutation_type'] = 'missense'
+
+    # set TM status if we have a position
+    if info['position'] is not None:
+        info['is_transmembrane'] = is_in_transmembrane(info['position'])
+
+    return info
+
+
+def parse_coding_sequence_mutation(mutation):
+    name, groups = _dispatch(_CODING_DISPATCH, _CODING_SLOTS, mutation)
+    if name is None:
+        raise ValueError(f"Unrecognized coding mutation format: {mutation!r}")
+
+    info = dict.fromkeys(INFO_FIELDS, None)
+    info['notation_type'] = 'coding'
+
+    if name == 'substitution':
+        start, ref, alt = groups
+        info.update({
+            'mutation_type':'substitution',
+            'start':        int(start),
+            'position':     int(start),
+            'ref':          ref,
+            'alt':          alt
+        })
+    elif name == 'delins':
+        s, e, alt = groups
+        info.update({
+            'mutation_type':'delins',
+            'start':        int(s),
+            'end':          int(e),
+            'alt':          alt,
+            'position':     int(s)
+        })
+    elif name == 'insertion':
+        s, e, alt = groups
+        info.update({
+            'mutation_type':'insertion',
+            'start':        int(s),
+            'end':          int(e),
+            'alt':          alt,
+            'position':     int(s)
+        })
+    elif name == 'duplication':
+        s, e, dup = groups
+        info.update({
+            'mutation_type':'duplication',
+            'start':        int(s),
+            'end':          int(e) if e else None,
+            'alt':          dup,
+            'position':     int(s)
+        })
+    elif name == 'deletion':
+        s, e, ref = groups
+        info.update({
+            'mutation_type':'deletion',
+            'start':        int(s),
+            'end':          int(e) if e else None,
+            'ref':          ref,
+            'position':     int(s)
+        })
+
+    if info['position'] is not None:
+        aa_pos = (info['position'] + 2) // 3
+        info['is_transmembrane'] = is_in_transmembrane(aa_pos)
+
+    return info
+
+
+# Swap in another protein's / isoform's transmembrane domains (CSV of start,end). Memoized parse
+# results carry the old transmembrane flags, so they are dropped
+def load_transmembrane_domains(path):
+    set_domain_table(DomainTable.from_file(path))
+    _parse_mutation_cached.cache_clear()
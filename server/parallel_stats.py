@@ -0,0 +1,188 @@
+# parallel_stats.py
+# Bulk aggregation over a process pool, for work that covers many subgroups of a large cohort at once
+# (building the whole stats cube, a report of every manifestation x sex x severity subgroup). The
+# columns involved are copied once into shared memory, each worker maps them and reduces its shard
+# of rows to a partial per task (counts, moments and an exact value histogram per group, see
+# stats.Partial), and the partials are merged here. Nothing per patient is pickled, and the merged
+# stats are what the in-process path gives (up to floating-point rounding of means and deviations).
+# Workers are spawned, never forked: builds also run on the live-refresh and snapshot-swap threads,
+# and a fork of a process with Firestore's gRPC threads can deadlock. A server starts one pool up
+# front (start_pool); without one, each call spawns its own
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from filter_index import SEX_VALUES
+from stats import grouped_partial, merge_partials, partial_stats
+
+# Below this many patients a pool costs more than it saves
+PARALLEL_MIN_ROWS = 200000
+
+# Stats of the value field per distinct value of the group field (None = all together, under the key
+# None) among the patients matching every (field, stored value) filter
+StatsTask = namedtuple('StatsTask', 'value group filters')
+
+
+# Data and null arrays of some store columns, copied into shared memory blocks that worker processes
+# attach to by name. close() releases the blocks
+class SharedColumns:
+    def __init__(self, store, fields):
+        self._blocks = []
+        # {(field, 'data' / 'null'): (block name, dtype, length)}
+        self.spec = {}
+        try:
+            for field in fields:
+                col = store.column(field)
+                for part, array in (('data', col.data), ('null', col.null)):
+                    block = SharedMemory(create=True, size=max(array.nbytes, 1))
+                    self._blocks.append(block)
+                    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+                    self.spec[(field, part)] = (block.name, array.dtype.str, len(array))
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+# Long-lived pool of a server (see start_pool), None when not started
+_pool = None
+_pool_workers = 0
+
+
+# Start the pool grouped_stats uses from then on: `workers` processes (0 = one per CPU) that live as
+# long as this process
+def start_pool(workers=0):
+    global _pool, _pool_workers
+    if _pool is None:
+        _pool_workers = workers or os.cpu_count() or 1
+        _pool = ProcessPoolExecutor(max_workers=_pool_workers, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+# Worker side: the columns of the call being worked on, as {(field, part): array} views of the
+# parent's shared memory, and the spec they were attached from
+_columns = {}
+_blocks = []
+_attached = None
+
+
+def _attach(spec):
+    global _attached
+    if spec == _attached:
+        return
+    _columns.clear()
+    for block in _blocks:
+        block.close()
+    _blocks.clear()
+    for key, (name, dtype, length) in spec.items():
+        block = SharedMemory(name=name)
+        _blocks.append(block)
+        _columns[key] = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)
+    _attached = spec
+
+
+# Partials of the rows start:stop for each task, tasks' filters holding stored values (None: matches
+# nothing, e.g. a value the column has never seen)
+def _partials(columns, start, stop, tasks):
+    out = []
+    for value, group, filters in tasks:
+        keep = ~columns[(value, 'null')][start:stop]
+        if group is not None:
+            keep &= ~columns[(group, 'null')][start:stop]
+        for field, stored in filters:
+            if stored is None:
+                keep[:] = False
+            else:
+                keep &= (columns[(field, 'data')][start:stop] == stored) & ~columns[(field, 'null')][start:stop]
+        values = columns[(value, 'data')][start:stop][keep]
+        labels = columns[(group, 'data')][start:stop][keep] if group is not None else np.zeros(len(values), dtype=np.int8)
+        out.append(grouped_partial(values, labels))
+    return out
+
+
+def _shard_partials(spec, start, stop, tasks):
+    _attach(spec)
+    return _partials(_columns, start, stop, tasks)
+
+
+# {group key: stats} for each task ({} where no patient qualifies, or a field is missing or not
+# numeric), over shards of the store spread across `workers` processes (0/None = one per CPU; the
+# started pool's size when there is one). Small stores, and workers=1, are done in this process
+def grouped_stats(store, tasks, workers=None, shards_per_worker=4):
+    tasks = list(tasks)
+    runnable = []
+    fields = set()
+    for i, task in enumerate(tasks):
+        vcol = store.column(task.value)
+        group_missing = task.group is not None and store.column(task.group) is None
+        if vcol is None or vcol.kind == 'str' or group_missing:
+            continue
+        filters = []
+        for field, value in task.filters:
+            col = store.column(field)
+            filters.append((field, None if col is None else col.encode(value)))
+            if col is not None:
+                fields.add(field)
+        fields.update(f for f in (task.value, task.group) if f is not None)
+        runnable.append((i, (task.value, task.group, tuple(filters))))
+    results = [{} for _ in tasks]
+    if not runnable:
+        return results
+    jobs = [job for _, job in runnable]
+
+    if _pool is not None and workers != 1:
+        workers = _pool_workers
+    else:
+        workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(store) < PARALLEL_MIN_ROWS:
+        columns = {(f, part): getattr(store.column(f), part) for f in fields for part in ('data', 'null')}
+        merged = _partials(columns, 0, len(store), jobs)
+    else:
+        bounds = np.linspace(0, len(store), workers * shards_per_worker + 1).astype(np.int64).tolist()
+        shared = SharedColumns(store, sorted(fields))
+        pool = _pool if _pool is not None else ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            with nullcontext(pool) if pool is _pool else pool:
+                count = len(bounds) - 1
+                shards = list(pool.map(_shard_partials, [shared.spec] * count, bounds[:-1], bounds[1:], [jobs] * count))
+        finally:
+            shared.close()
+        merged = [merge_partials(parts) for parts in zip(*shards)]
+
+    for (i, _), partial in zip(runnable, merged):
+        groups, stats = partial_stats(partial)
+        group = tasks[i].group
+        keys = store.column(group).decode(groups) if group is not None else [None] * len(groups)
+        results[i] = dict(zip(keys, stats))
+    return results
+
+
+# Stats of each feature for every combination of sex (None, 'Male', 'Female') and severity (None or
+# any severity on record), as {(feature, sex, severity): stats}, subgroups without patients left out
+def subgroup_stats(store, features, workers=None):
+    severities = [None]
+    col = store.column('severity')
+    if col is not None:
+        severities += col.decode(np.unique(col.data[~col.null]))
+
+    keys, tasks = [], []
+    for feature in features:
+        for sex in (None, *SEX_VALUES):
+            for severity in severities:
+                filters = []
+                if sex is not None:
+                    filters.append(('sex', SEX_VALUES[sex]))
+                if severity is not None:
+                    filters.append(('severity', severity))
+                keys.append((feature, sex, severity))
+                tasks.append(StatsTask(feature, None, tuple(filters)))
+    return {key: cell[None] for key, cell in zip(keys, grouped_stats(store, tasks, workers)) if cell}
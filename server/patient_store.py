@@ -0,0 +1,384 @@
+# patient_store.py
+import itertools
+import numpy as np
+
+# Code used in dictionary-encoded columns for a missing value
+MISSING_CODE = -1
+
+_NUMPY_DTYPES = {
+    'bool':  np.bool_,
+    'int':   np.int64,
+    'float': np.float64,
+    'str':   np.int32,
+}
+
+
+# Kinds of new values a column of each kind can take without being rebuilt (see Column.patched)
+_FITS = {
+    'bool':  {'bool'},
+    'int':   {'int'},
+    'float': {'int', 'float'},
+    'str':   {'str'},
+}
+
+
+# Python / numpy types each numeric or boolean column kind stores as they are (an int is a bool too)
+_ACCEPTS = {
+    'bool':  (bool, np.bool_),
+    'int':   (int, np.integer),
+    'float': (int, float, np.integer, np.floating),
+}
+
+
+# values, checked on the way through: ValueError for any the column's dtype would silently change
+# (1.5 truncated in an 'int' column, 'N' taken as True in a 'bool' one). Whole floats fit 'int' columns
+def _checked(values, kind):
+    accepts = _ACCEPTS[kind]
+    for v in values:
+        if v is not None and not isinstance(v, accepts):
+            if not (kind == 'int' and isinstance(v, float) and v.is_integer()):
+                raise ValueError(f"{v!r} doesn't fit a {kind!r} column")
+        yield v
+
+
+# Work out how a column should be stored from the non-null values it holds
+def infer_kind(values):
+    kinds = set()
+    for v in values:
+        if v is None:
+            continue
+        if isinstance(v, bool):
+            kinds.add('bool')
+        elif isinstance(v, int):
+            kinds.add('int')
+        elif isinstance(v, float):
+            kinds.add('float')
+        else:
+            kinds.add('str')
+    if kinds == {'bool'}:
+        return 'bool'
+    if kinds == {'int'}:
+        return 'int'
+    if kinds and kinds <= {'int', 'float'}:
+        return 'float'
+    return 'str'
+
+
+# A single field of the cohort: a typed array plus a null mask
+# Numeric/boolean columns keep the raw values in data, 'str' columns keep int32 codes into vocab
+class Column:
+    def __init__(self, name, kind, data, null, vocab=None):
+        self.name = name
+        self.kind = kind
+        self.data = data
+        self.null = null
+        self.vocab = vocab
+        self._codes = {v: i for i, v in enumerate(vocab)} if vocab is not None else None
+        self._decoder = None
+
+    # Build a column from a list of python values (None = missing)
+    # kind comes from the schema when known; values that don't fit it fall back to an inferred kind
+    @classmethod
+    def from_values(cls, name, values, kind=None):
+        if kind is not None:
+            try:
+                return cls._build(name, values, kind)
+            except (TypeError, ValueError):
+                pass
+        return cls._build(name, values, infer_kind(values))
+
+    @classmethod
+    def _build(cls, name, values, kind):
+        null = np.fromiter((v is None for v in values), dtype=np.bool_, count=len(values))
+
+        if kind == 'str':
+            codes = {}
+            data = np.fromiter(
+                (MISSING_CODE if v is None else codes.setdefault(v, len(codes)) for v in values),
+                dtype=np.int32, count=len(values)
+            )
+            return cls(name, kind, data, null, vocab=list(codes))
+
+        fill = False if kind == 'bool' else 0
+        data = np.fromiter((fill if v is None else v for v in _checked(values, kind)),
+                           dtype=_NUMPY_DTYPES[kind], count=len(values))
+        return cls(name, kind, data, null)
+
+    def __len__(self):
+        return len(self.data)
+
+    # Encode a python value into this column's storage domain (None if it can't occur)
+    def encode(self, value):
+        if self.kind == 'str':
+            return self._codes.get(value)
+        return value
+
+    # Boolean mask of the rows whose value equals the given one
+    def equals(self, value):
+        encoded = self.encode(value)
+        if encoded is None:
+            return np.zeros(len(self), dtype=np.bool_)
+        return (self.data == encoded) & ~self.null
+
+    # Turn stored values (codes for 'str' columns) back into python values
+    def decode(self, data):
+        if self.kind != 'str':
+            return data.tolist()
+        if self._decoder is None:
+            # Trailing None so that MISSING_CODE (-1) decodes to None
+            self._decoder = np.array(self.vocab + [None], dtype=object)
+        return self._decoder[data].tolist()
+
+    # Python list of values (None where missing) for the given rows, or for every row
+    def to_list(self, rows=None):
+        data = self.data if rows is None else self.data[rows]
+        out = self.decode(data)
+        if self.kind != 'str':
+            null = self.null if rows is None else self.null[rows]
+            for i in np.flatnonzero(null).tolist():
+                out[i] = None
+        return out
+
+    # Copy of the column with the given rows set to new values, then the rows outside keep (a boolean
+    # mask, None = all) dropped and appended values added at the end. The existing arrays are never
+    # written to; values that don't fit the column's kind rebuild it from python values instead
+    def patched(self, rows, values, appended=(), keep=None):
+        values, appended = list(values), list(appended)
+        new = values + appended
+
+        def rebuilt():
+            full = self.to_list()
+            for row, value in zip(rows, values):
+                full[row] = value
+            if keep is not None:
+                full = [v for v, kept in zip(full, keep.tolist()) if kept]
+            return Column.from_values(self.name, full + appended)
+
+        if not {infer_kind([v]) for v in new if v is not None} <= _FITS[self.kind]:
+            return rebuilt()
+
+        vocab = self.vocab
+        null = np.fromiter((v is None for v in new), dtype=np.bool_, count=len(new))
+        if self.kind == 'str':
+            vocab = list(vocab)
+            codes = dict(self._codes)
+            encoded = np.fromiter(
+                (MISSING_CODE if v is None else codes.setdefault(v, len(codes)) for v in new),
+                dtype=np.int32, count=len(new)
+            )
+            vocab.extend(list(codes)[len(vocab):])
+        else:
+            fill = False if self.kind == 'bool' else 0
+            try:
+                encoded = np.fromiter((fill if v is None else v for v in _checked(new, self.kind)),
+                                      dtype=_NUMPY_DTYPES[self.kind], count=len(new))
+            except ValueError:
+                return rebuilt()
+
+        data = np.array(self.data)
+        nulls = np.array(self.null)
+        data[rows] = encoded[:len(values)]
+        nulls[rows] = null[:len(values)]
+        if keep is not None:
+            data, nulls = data[keep], nulls[keep]
+        data = np.concatenate([data, encoded[len(values):]])
+        nulls = np.concatenate([nulls, null[len(values):]])
+        return Column(self.name, self.kind, data, nulls, vocab)
+
+    # Rows (out of the given ones, or all) where this column has a value
+    def present_rows(self, rows=None):
+        if rows is None:
+            return np.flatnonzero(~self.null)
+        return rows[~self.null[rows]]
+
+    # Python list of the non-null values for the given rows, or for every row
+    def present_values(self, rows=None):
+        return self.decode(self.data[self.present_rows(rows)])
+
+    # Float array of the non-null values for the given rows, or for every row
+    def present_array(self, rows=None):
+        if self.kind == 'str':
+            raise TypeError(f"Field {self.name!r} is not numeric")
+        return self.data[self.present_rows(rows)].astype(np.float64)
+
+
+# Columnar copy of every patient record, built when the data is loaded
+# A store is never modified once built: apply_changes returns a new one, so readers holding a store
+# always see one consistent version of the data
+class PatientStore:
+    def __init__(self, columns, size, ids=None):
+        self.columns = columns
+        self.size = size
+        self._ids = ids
+        self._rows = None
+
+    # Build the store from an iterable of patient dicts (e.g. Firestore documents)
+    # kinds: {field: 'int' / 'float' / 'bool' / 'str'}, e.g. schema.PATIENT_TYPES; other fields are inferred
+    # ids: document id of each record, if known (see ids())
+    @classmethod
+    def from_records(cls, records, kinds=None, ids=None):
+        records = list(records)
+        kinds = kinds or {}
+
+        # Keep every field seen in any record, in order of first appearance
+        fields = {}
+        for record in records:
+            for key in record:
+                fields.setdefault(key, None)
+
+        columns = {}
+        for field in fields:
+            values = [record.get(field) for record in records]
+            columns[field] = Column.from_values(field, values, kinds.get(field))
+        return cls(columns, len(records), list(ids) if ids is not None else None)
+
+    @classmethod
+    def empty(cls):
+        return cls({}, 0)
+
+    def __len__(self):
+        return self.size
+
+    def fields(self):
+        return list(self.columns)
+
+    def column(self, name):
+        return self.columns.get(name)
+
+    # Document id of every row. Stores built without ids fall back to the 'id' field, which is what
+    # the importer names the documents after
+    def ids(self):
+        if self._ids is None:
+            col = self.columns.get('id')
+            values = col.to_list() if col is not None else [None] * self.size
+            self._ids = [None if v is None else str(v) for v in values]
+        return self._ids
+
+    # {doc id: row number}, built on first use
+    def rows_by_id(self):
+        if self._rows is None:
+            self._rows = {doc_id: row for row, doc_id in enumerate(self.ids())}
+        return self._rows
+
+    # New store with upserts ({doc id: full record}, replacing any existing record with that id) and
+    # deletes (doc ids) applied; this store is left untouched. Returns (store, changed fields), where
+    # changed fields is None when rows were added or removed (i.e. every field is affected). When no
+    # rows are added or removed, columns the change doesn't touch are shared with this store
+    def apply_changes(self, upserts, deletes=(), kinds=None):
+        kinds = kinds or {}
+        ids = self.ids()
+        row_of = self.rows_by_id()
+
+        updated_rows, updated, added_ids, added = [], [], [], []
+        for doc_id, record in upserts.items():
+            row = row_of.get(doc_id)
+            if row is None:
+                added_ids.append(doc_id)
+                added.append(record)
+            else:
+                updated_rows.append(row)
+                updated.append(record)
+        removed = [row_of[doc_id] for doc_id in set(deletes) if doc_id in row_of]
+        keep = None
+        if removed:
+            keep = np.ones(self.size, dtype=np.bool_)
+            keep[removed] = False
+
+        fields = dict.fromkeys(self.columns)
+        for record in itertools.chain(updated, added):
+            for key in record:
+                fields.setdefault(key, None)
+
+        rows = np.array(updated_rows, dtype=np.intp)
+        columns = {}
+        changed = set()
+        for field in fields:
+            values = [record.get(field) for record in updated]
+            col = self.columns.get(field)
+            if col is None:
+                col = Column.from_values(field, [None] * self.size, kinds.get(field))
+            if col.to_list(rows) != values:
+                changed.add(field)
+            elif not added and keep is None:
+                columns[field] = col
+                continue
+            columns[field] = col.patched(rows, values, [record.get(field) for record in added], keep)
+
+        new_ids = ids if keep is None else [doc_id for doc_id, kept in zip(ids, keep.tolist()) if kept]
+        store = PatientStore(columns, len(new_ids) + len(added_ids), new_ids + added_ids)
+        return store, (None if removed or added else changed)
+
+    # Mask of rows where the field is present
+    def present(self, name):
+        col = self.columns.get(name)
+        if col is None:
+            return np.zeros(self.size, dtype=np.bool_)
+        return ~col.null
+
+    # Mask of rows where the field equals the given value
+    def equals(self, name, value):
+        col = self.columns.get(name)
+        if col is None:
+            return np.zeros(self.size, dtype=np.bool_)
+        return col.equals(value)
+
+    # All non-null values of a field, optionally restricted to some rows
+    def values(self, name, rows=None):
+        col = self.columns.get(name)
+        if col is None:
+            return []
+        return col.present_values(rows)
+
+    # Non-null values of a numeric field as a float array, optionally restricted to some rows
+    def array(self, name, rows=None):
+        col = self.columns.get(name)
+        if col is None:
+            return np.empty(0, dtype=np.float64)
+        return col.present_array(rows)
+
+    # Rows (optionally out of the given ones) where both value_name and group_name are present
+    # Returns (rows, value column, group column), or None if either field doesn't exist
+    def _grouped_rows(self, value_name, group_name, rows=None):
+        vcol = self.columns.get(value_name)
+        gcol = self.columns.get(group_name)
+        if vcol is None or gcol is None:
+            return None
+        keep = ~vcol.null & ~gcol.null
+        rows = np.flatnonzero(keep) if rows is None else rows[keep[rows]]
+        return rows, vcol, gcol
+
+    # Numeric values of value_name with the stored group key of each one, plus a decoder that turns
+    # stored group keys back into python values: (values, keys, decode)
+    def grouped_arrays(self, value_name, group_name, rows=None):
+        found = self._grouped_rows(value_name, group_name, rows)
+        if found is None:
+            return np.empty(0, dtype=np.float64), np.empty(0), lambda keys: []
+        rows, vcol, gcol = found
+        return vcol.present_array(rows), gcol.data[rows], gcol.decode
+
+    # Non-null values of value_name bucketed by the (non-null) value of group_name
+    def grouped_values(self, value_name, group_name, rows=None):
+        found = self._grouped_rows(value_name, group_name, rows)
+        if found is None or not len(found[0]):
+            return {}
+        rows, vcol, gcol = found
+
+        keys = gcol.data[rows]
+        order = np.argsort(keys, kind='stable')
+        uniq, starts = np.unique(keys[order], return_index=True)
+        values = vcol.decode(vcol.data[rows[order]])
+        bounds = starts.tolist() + [len(rows)]
+
+        return {
+            group: values[bounds[i]:bounds[i + 1]]
+            for i, group in enumerate(gcol.decode(uniq))
+        }
+
+    # Materialize rows back into patient dicts, optionally projecting to some fields
+    def to_records(self, rows=None, fields=None):
+        names = self.fields() if fields is None else [f for f in fields if f in self.columns]
+        count = self.size if rows is None else len(rows)
+        if not names:
+            return [{} for _ in range(count)]
+        lists = [self.columns[name].to_list(rows) for name in names]
+        return [dict(zip(names, row)) for row in zip(*lists)]
@@ -0,0 +1,67 @@
+# payload.py
+# Responses kept as ready-to-send bytes: the JSON body, its ETag, and (for bodies worth it) gzip and
+# brotli copies, each compressed the first time a client asks for that encoding and kept from then on.
+# Serving one again is a dict lookup and a copy; requests that already hold the current ETag get a 304
+# with no body at all
+import gzip
+import hashlib
+from collections import namedtuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_COMPRESSORS = {
+    'gzip': lambda body: gzip.compress(body, compresslevel=6, mtime=0),
+}
+if brotli is not None:
+    _COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=5)
+
+# bodies: {content encoding ('identity', 'gzip', 'br'): bytes} compressed so far; encodings: those the
+# body may be compressed into on request; headers: extra response headers
+EncodedPayload = namedtuple('EncodedPayload', 'bodies encodings status headers etag mimetype')
+
+
+# Content encodings this server can produce, out of the configured ones, in order of preference
+def available_encodings(names):
+    return [name for name in names if name in _COMPRESSORS]
+
+
+# Build a payload from an encoded body, to be served compressed in the given encodings when it is at
+# least min_bytes long (nothing is compressed yet, see payload_response)
+def encode_payload(body, status=200, headers=None, encodings=(), min_bytes=1024,
+                   mimetype='application/json'):
+    encodings = tuple(available_encodings(encodings)) if len(body) >= min_bytes else ()
+    etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+    return EncodedPayload({'identity': body}, encodings, status, dict(headers or {}), etag, mimetype)
+
+
+# Bytes a payload takes up in a cache
+def payload_size(payload):
+    return sum(len(body) for body in payload.bodies.values())
+
+
+# Response for a payload: the best encoding the client accepts, with its ETag (so If-None-Match can
+# be answered with 304). An encoding not compressed yet is compressed now and added to the payload
+def payload_response(payload, request, response_class):
+    encoding = 'identity'
+    best = 0
+    for name in payload.encodings:
+        quality = request.accept_encodings[name]
+        if quality > best:
+            encoding, best = name, quality
+    if encoding not in payload.bodies:
+        payload.bodies[encoding] = _COMPRESSORS[encoding](payload.bodies['identity'])
+
+    response = response_class(payload.bodies[encoding], status=payload.status, mimetype=payload.mimetype)
+    response.headers.update(payload.headers)
+    if payload.encodings:
+        response.vary.add('Accept-Encoding')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    # Each encoding is a different representation, so a different (strong) ETag
+    response.set_etag(payload.etag if encoding == 'identity' else f"{payload.etag}-{encoding}")
+    if payload.status == 200:
+        response.make_conditional(request)
+    return response
@@ -1,13 +1,34 @@
 # routes/api.py
-from flask import jsonify, request, session
+from flask import current_app, jsonify, request, session
 from . import api_bp
-from firebase_client import get_patients, get_feature, get_feature_grouped, check_alleles, get_allele_data, get_data_given_alleles
+from firebase_client import get_dataset_version, get_store, select_patients, get_feature, get_feature_grouped_arrays, get_grouped_stats, find_alleles, get_allele_data, suggest_alleles, refresh_patients_async, get_correlations, get_approximate_stats, get_approximate_grouped_stats
+from correlation import correlate
+from filter_index import InvalidFilter
+from cache import response_cache, stats_cache
+from payload import encode_payload, payload_response, payload_size
+from stats import calculate_stats, calculate_grouped_stats
+from scoring import score_pair, score_batch
 import numpy as np
-import re
+import base64
+import hmac
+import json
+import logging
+from metrics import instrument, register_cache, render as render_metrics, timed
+
+logger = logging.getLogger(__name__)
+
+# Request counts, latency, payload size and phase timings for every route (see /_metrics)
+instrument(api_bp)
+register_cache('stats', stats_cache)
+register_cache('response', response_cache)
 
 # new comment
 # Get a dict of patients and their data filtered based on passed parameters
 # Returns {"age": x, "allele_1": xxx, etc...}, {"age": x, "allele_1": xxx, etc...}, ...
+# Every patient carries every field (of the store, or of fields=), null where it has no value
+# Optional: fields=a,b,c returns only those fields; limit=N returns at most N patients, with the cursor
+# for the next page in the X-Next-Cursor header (pass it back as cursor=); stream=ndjson|json streams
+# the rows (one JSON object per line, or one JSON array) instead of building the whole body at once
 @api_bp.route('/patients')
 def read_patients():
     try:
@@ -16,149 +37,346 @@ def read_patients():
         severity = request.args.get('severity')
         manifestation = request.args.get('manifestation')
         
-        # Debug message
-        print(f"Received request with params: sex={sex}, severity={severity}, manifestation={manifestation}")
+        logger.debug("patients request sex=%s severity=%s manifestation=%s", sex, severity, manifestation)
         
-        # Returns a list of all patients in the database
-        patients = get_patients()
-        
-        # Apply filters based on which parameters were provided
-        if sex:
-            # Convert sex to integer (1 for male, 0 for female)
-            if sex == "Male":
-                sex_value = 0
-            elif sex == "Female":
-                sex_value = 1
-            else:
-                return jsonify({'error': 'Invalid sex value'}), 400
-            patients = [p for p in patients if p.get('sex') == sex_value]
-
-
-        if severity:
-            patients = [p for p in patients if p.get('severity') == int(severity)]
-
-        if manifestation:
-            # Get the manifestation's key
-            manifestation_key = {
-                'Diabetes Mellitus': 'dm',
-                'Optic Atrophy': 'oa',
-                'Diabetes Insipidus': 'di',
-                'Hearing Loss': 'hl'
-            }.get(manifestation)
-
-            if manifestation_key:
-                patients = [p for p in patients if p.get(manifestation_key) is not None]
-
-        if not patients:
-            return jsonify({'error': 'No patients found matching the criteria'}), 404
-            
-        return jsonify(patients)
+        stream = request.args.get('stream')
+        if stream not in (None, 'ndjson', 'json'):
+            return jsonify({'error': "stream must be 'ndjson' or 'json'"}), 400
+        if not stream:
+            key = ('patients', sex, _severity_key(severity), manifestation,
+                   request.args.get('fields'), request.args.get('limit'), request.args.get('cursor'))
+            return _cached_response(response_cache, key, lambda: _compute_patients(sex, severity, manifestation))
+
+        found = _patient_query(sex, severity, manifestation)
+        if len(found) == 2:
+            return jsonify(found[0]), found[1]
+        store, rows, fields, headers = found
+        response = current_app.response_class(
+            _stream_patients(store, rows, fields, stream == 'ndjson', current_app.json.dumps,
+                             current_app.config['PATIENTS_STREAM_CHUNK_ROWS']),
+            mimetype='application/x-ndjson' if stream == 'ndjson' else 'application/json',
+        )
+        response.headers.update(headers)
+        return response
     
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+# Row numbers of the patients matching whichever parameters were provided, then the requested page of
+# them: (store, rows, fields, headers), or (error payload, status)
+def _patient_query(sex, severity, manifestation):
+    store = get_store()
+    try:
+        rows = select_patients(sex=sex, severity=severity, manifestation=manifestation)
+        total = len(rows)
+        fields = _patient_fields(store, request.args.get('fields'))
+        rows, next_cursor = _patient_page(store, rows, request.args.get('limit'), request.args.get('cursor'))
+    except StaleCursor as e:
+        return {'error': str(e)}, 409
+    # InvalidFilter is a ValueError too
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    if not total:
+        return {'error': 'No patients found matching the criteria'}, 404
+    headers = {'X-Total-Count': str(total)}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    return store, rows, fields, headers
+
+def _compute_patients(sex, severity, manifestation):
+    with timed('store'):
+        found = _patient_query(sex, severity, manifestation)
+        if len(found) == 2:
+            return found
+        store, rows, fields, headers = found
+        return store.to_records(rows, fields), 200, headers
+
+# A cursor whose patient is no longer in the data (it was deleted since the previous page)
+class StaleCursor(ValueError):
+    pass
+
+# Fields to return for a fields= param (None = all of them)
+def _patient_fields(store, param):
+    if not param:
+        return None
+    fields = [f.strip() for f in param.split(',') if f.strip()]
+    unknown = [f for f in fields if store.column(f) is None]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+# The page of rows (sorted row numbers) to return and the cursor of the next page, or None on the last
+# one. A cursor names the document id of the last patient sent, so pages stay in step across
+# workers and across live data changes (rows keep their relative order when patients are added or
+# removed)
+def _patient_page(store, rows, limit, cursor):
+    if cursor:
+        last_id = _decode_cursor(cursor)
+        last_row = store.rows_by_id().get(last_id)
+        if last_row is None:
+            raise StaleCursor('The patient data changed since this cursor was issued; start again without a cursor')
+        rows = rows[np.searchsorted(rows, last_row, side='right'):]
+    if limit is None:
+        return rows, None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('limit must be a positive integer')
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last_id = store.ids()[rows[-1]]
+    return rows, base64.urlsafe_b64encode(last_id.encode()).decode()
+
+# Document id in a cursor; anything that isn't a cursor this API issued is a ValueError
+def _decode_cursor(cursor):
+    try:
+        last_id = base64.b64decode(cursor, altchars=b'-_', validate=True).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if base64.urlsafe_b64encode(last_id.encode()).decode() != cursor:
+        raise ValueError('Invalid cursor')
+    return last_id
+
+# Serialize rows a chunk at a time, so the full body never sits in memory
+def _stream_patients(store, rows, fields, ndjson, dumps, chunk_rows):
+    if not ndjson:
+        yield '['
+    for start in range(0, len(rows), chunk_rows):
+        records = store.to_records(rows[start:start + chunk_rows], fields)
+        if ndjson:
+            yield ''.join(dumps(record) + '\n' for record in records)
+        else:
+            yield (',' if start else '') + ','.join(dumps(record) for record in records)
+    if not ndjson:
+        yield ']'
+
 # Get the data associated with a specific manifestation
 @api_bp.route('/data/<string:manifestation>')
 def send_feature(manifestation):
-    manifestation_list = get_feature(manifestation)
+    return _cached_response(response_cache, ('data', manifestation), lambda: _compute_feature(manifestation))
+
+def _compute_feature(manifestation):
+    with timed('store'):
+        manifestation_list = get_feature(manifestation)
     if not manifestation_list:
-        return jsonify({'error': f'Query failed for manifestation {manifestation}'}), 404
+        return {'error': f'Query failed for manifestation {manifestation}'}, 404
     
-    return jsonify(manifestation_list), 200
+    return manifestation_list, 200
+
+# Normalize a severity param for cache keys ('05' and '5' are the same query)
+def _severity_key(severity):
+    if not severity:
+        return None
+    try:
+        return int(severity)
+    except ValueError:
+        return severity
+
+# Serve a JSON payload from a cache of encoded responses (see payload.py), computing and caching it on
+# a miss. compute() returns (payload, status) or (payload, status, headers); only deterministic
+# answers (200/404) that fit the cache are cached, and only those are ever compressed (in the encoding
+# a request asks for, the first time one does). cache_header names a header that reports HIT / MISS
+def _cached_response(cache, key, compute, cache_header=None):
+    version = get_dataset_version()
+    encoded = cache.get(key, version)
+    hit = cacheable = encoded is not None
+    if not hit:
+        payload, status, *headers = compute()
+        with timed('serialize'):
+            body = jsonify(payload).get_data()
+        cacheable = status in (200, 404) and len(body) <= cache.max_bytes
+        encoded = encode_payload(body, status, headers[0] if headers else None,
+                                 current_app.config['RESPONSE_COMPRESSION'] if cacheable else (),
+                                 current_app.config['RESPONSE_COMPRESS_MIN_BYTES'])
+    size = payload_size(encoded) if hit else 0
+    with timed('serialize'):
+        response = payload_response(encoded, request, current_app.response_class)
+    # New entries, and entries that just gained a compressed body, are (re)counted against the cache
+    if cacheable and payload_size(encoded) != size:
+        cache.put(key, encoded, payload_size(encoded), version)
+    if cache_header:
+        response.headers[cache_header] = 'HIT' if hit else 'MISS'
+    return response
+
+# /stats and /relative-stats responses, through the stats cache
+def _cached_json(key, compute):
+    return _cached_response(stats_cache, key, compute, 'X-Stats-Cache')
+
+# Marks answers computed from quantile sketches rather than from every value
+APPROXIMATE_HEADERS = {'X-Stats-Approximate': 'true'}
+
+# exact=true|false: exact stats, or approximate ones merged from sketches; without it STATS_APPROXIMATE
+# decides. Returns True / False, or None for a value that is neither
+def _exact_param():
+    exact = request.args.get('exact')
+    if exact is None:
+        return not current_app.config['STATS_APPROXIMATE']
+    return {'true': True, '1': True, 'false': False, '0': False}.get(exact.lower())
 
 # Retrieve statistics for a given manifestation for ONLY those patients that fit in the current subgroup defined by params
+# exact=true|false chooses exact or sketch-based approximate stats (see _exact_param)
 @api_bp.route('/stats/<string:manifestation>')
 def get_stats(manifestation):
     try:
         sex = request.args.get('sex')
         severity = request.args.get('severity')
         manifestation2 = request.args.get('manifestation2')
+        exact = _exact_param()
+        if exact is None:
+            return jsonify({'error': "exact must be 'true' or 'false'"}), 400
+
+        key = ('stats', manifestation, sex or None, _severity_key(severity), manifestation2 or None, exact)
+        return _cached_json(key, lambda: _compute_stats(manifestation, sex, severity, manifestation2, exact))
         
-        patients = get_patients()
+    except Exception as e:
+        logger.exception("stats request failed manifestation=%s", manifestation)
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+# Body of /stats: returns (payload, status) or (payload, status, headers)
+# exact=False answers single-manifestation queries from the sketches where they cover the manifestation
+def _compute_stats(manifestation, sex, severity, manifestation2, exact=True):
+    store = get_store()
+    
+    # apply selectors
+    try:
+        with timed('store'):
+            rows = select_patients(sex=sex, severity=severity)
+    except InvalidFilter as e:
+        return {'error': str(e)}, 400
+    
+    # If manifestation2 is provided, calculate correlation stats from the subgroup's correlation matrix
+    if manifestation2:
+        with timed('stats'):
+            pair = get_correlations(sex, severity).pair(manifestation, manifestation2)
+            if pair is None:
+                # Features outside the precomputed matrix are correlated on their own
+                pair = correlate(store, [manifestation, manifestation2], rows).pair(manifestation, manifestation2)
         
-        # apply selectors
-        if sex:
-            if sex == "Male":
-                sex_value = 0
-            elif sex == "Female":
-                sex_value = 1
-            else:
-                return jsonify({'error': 'Invalid sex value'}), 400
-            patients = [p for p in patients if p.get('sex') == sex_value]
-            
-        if severity:
-            patients = [p for p in patients if p.get('severity') == int(severity)]
+        if not pair['n']:
+            return {'error': 'No data found for the given manifestations'}, 404
         
-        # If manifestation2 is provided, calculate correlation stats
-        if manifestation2:
-            manifestation_key1 = manifestation  # The first manifestation is already the key
-            manifestation_key2 = manifestation2  # The second manifestation is already the key
-            
-            # Get pairs of values where both manifestations are present
-            pairs = [(p.get(manifestation_key1), p.get(manifestation_key2)) 
-                    for p in patients 
-                    if p.get(manifestation_key1) is not None and p.get(manifestation_key2) is not None]
-            
-            if not pairs:
-                return jsonify({'error': 'No data found for the given manifestations'}), 404
-                
-            # Calculate correlation statistics
-            x_values, y_values = zip(*pairs)
-            correlation = np.corrcoef(x_values, y_values)[0, 1]
-            
-            # Calculate regression line
-            slope, intercept = np.polyfit(x_values, y_values, 1)
-            
-            stats = {
-                "Correlation Coefficient": round(float(correlation), 3),
-                "Regression Slope": round(float(slope), 3),
-                "Regression Intercept": round(float(intercept), 3),
-                "Sample Size": len(pairs),
-                f"{manifestation} Mean": round(float(np.mean(x_values)), 2),
-                f"{manifestation2} Mean": round(float(np.mean(y_values)), 2),
-                f"{manifestation} Std Dev": round(float(np.std(x_values)), 2),
-                f"{manifestation2} Std Dev": round(float(np.std(y_values)), 2)
-            }
-            return jsonify(stats)
+        slope, intercept = pair['slope'], pair['intercept']
+        if not np.isfinite(slope):
+            # A single patient or a constant first manifestation: keep np.polyfit's least-squares answer
+            pair_rows = rows[store.present(manifestation)[rows] & store.present(manifestation2)[rows]]
+            slope, intercept = np.polyfit(store.array(manifestation, pair_rows), store.array(manifestation2, pair_rows), 1)
         
-        # Original single manifestation stats logic
+        stats = {
+            "Correlation Coefficient": round(pair['pearson'], 3),
+            "Regression Slope": round(float(slope), 3),
+            "Regression Intercept": round(float(intercept), 3),
+            "Sample Size": pair['n'],
+            f"{manifestation} Mean": round(pair['x_mean'], 2),
+            f"{manifestation2} Mean": round(pair['y_mean'], 2),
+            f"{manifestation} Std Dev": round(pair['x_std'], 2),
+            f"{manifestation2} Std Dev": round(pair['y_std'], 2)
+        }
+        return stats, 200
+    
+    if not exact:
+        try:
+            with timed('stats'):
+                stats = get_approximate_stats(['dm', 'oa', 'di', 'hl'] if manifestation == 'all' else [manifestation],
+                                              sex, severity)
+        except InvalidFilter as e:
+            return {'error': str(e)}, 400
+        if stats == {}:
+            return {'error': f'No data found{" for all manifestations" if manifestation == "all" else f" for manifestation {manifestation}"} with the given filters'}, 404
+        if stats is not None:
+            return stats, 200, APPROXIMATE_HEADERS
+
+    # Original single manifestation stats logic
+    with timed('store'):
         if manifestation == 'all':
-            all_values = []
-            for patient in patients:
-                for key in ['dm', 'oa', 'di', 'hl']:
-                    if patient.get(key) is not None:
-                        all_values.append(patient[key])
-            manifestation_list = all_values
+            manifestation_list = np.concatenate([store.array(key, rows) for key in ['dm', 'oa', 'di', 'hl']])
         else:
             # For specific feature, get values for that feature only
-            manifestation_list = [p.get(manifestation) for p in patients if p.get(manifestation) is not None]
-        
-        if not manifestation_list:
-            return jsonify({'error': f'No data found{" for all manifestations" if manifestation == "all" else f" for manifestation {manifestation}"} with the given filters'}), 404
-            
-        stats = calculate_stats(manifestation_list)
-        return jsonify(stats)
+            manifestation_list = store.array(manifestation, rows)
+    
+    if not len(manifestation_list):
+        return {'error': f'No data found{" for all manifestations" if manifestation == "all" else f" for manifestation {manifestation}"} with the given filters'}, 404
         
-    except Exception as e:
-        print(f"Error in get_stats: {str(e)}")
-        return jsonify({'error': f'Server error: {str(e)}'}), 500
+    with timed('stats'):
+        return calculate_stats(manifestation_list), 200
+
+# Pairwise correlation matrix of the manifestations and severity for the patients in the subgroup:
+# {"features": [...], "sample_size", "pearson", "spearman": {x: {y: value}}, "regression": {x: {y: {"slope", "intercept"}}}}
+@api_bp.route('/correlations')
+def get_correlation_matrix():
+    sex = request.args.get('sex')
+    severity = request.args.get('severity')
+
+    key = ('correlations', sex or None, _severity_key(severity))
+    return _cached_json(key, lambda: _compute_correlations(sex, severity))
+
+# Body of /correlations: returns (payload, status)
+def _compute_correlations(sex, severity):
+    try:
+        with timed('stats'):
+            result = get_correlations(sex, severity)
+    except InvalidFilter as e:
+        return {'error': str(e)}, 400
+    if not result.n.any():
+        return {'error': 'No data found with the given filters'}, 404
+    return result.to_dict(), 200
 
 # Retrive stats associated with a specific feature grouped by another feature
+# Optional sex / severity params restrict the patients the same way /stats does, and exact= works as for /stats
 @api_bp.route('/relative-stats')
 def get_relative_stats():
     value_feature = request.args.get('value')
     group_feature = request.args.get('group')
-    feature_dict = get_feature_grouped(value_feature, group_feature)
+    sex = request.args.get('sex')
+    severity = request.args.get('severity')
+    exact = _exact_param()
+    if exact is None:
+        return jsonify({'error': "exact must be 'true' or 'false'"}), 400
+
+    key = ('relative-stats', value_feature, group_feature, sex or None, _severity_key(severity), exact)
+    return _cached_json(key, lambda: _compute_relative_stats(value_feature, group_feature, sex, severity, exact))
+
+# Body of /relative-stats: returns (payload, status) or (payload, status, headers)
+# exact=False answers from the sketches for the pairs they cover
+def _compute_relative_stats(value_feature, group_feature, sex, severity, exact=True):
+    if not exact:
+        try:
+            with timed('stats'):
+                stats_dict = get_approximate_grouped_stats(value_feature, group_feature, sex, severity)
+        except InvalidFilter as e:
+            return {'error': str(e)}, 400
+        if stats_dict == {}:
+            return {'error': f'Query failed for feature {value_feature} or {group_feature}'}, 404
+        if stats_dict is not None:
+            return stats_dict, 200, APPROXIMATE_HEADERS
+
+    # Unfiltered queries on the usual features are a lookup in the precomputed cube
+    if not sex and not severity:
+        with timed('stats'):
+            stats_dict = get_grouped_stats(value_feature, group_feature)
+        if stats_dict is not None:
+            if not stats_dict:
+                return {'error': f'Query failed for feature {value_feature} or {group_feature}'}, 404
+            return stats_dict, 200
+
+    try:
+        with timed('store'):
+            values, keys, decode = get_feature_grouped_arrays(value_feature, group_feature, sex=sex, severity=severity)
+    except InvalidFilter as e:
+        return {'error': str(e)}, 400
     
-    if not feature_dict:
-        return jsonify({'error': f'Query failed for feature {value_feature} or {group_feature}'}), 404
+    if not len(values):
+        return {'error': f'Query failed for feature {value_feature} or {group_feature}'}, 404
     
-    stats_dict = {
-        group: calculate_stats(values)
-        for group, values in feature_dict.items()
-    }
+    # Every group in one batched call
+    with timed('stats'):
+        groups, stats = calculate_grouped_stats(values, keys)
+    stats_dict = dict(zip(decode(groups), stats))
     
-    return jsonify(stats_dict)
+    return stats_dict, 200
 
 # Check if the provided combination of alleles exists in db, if so, return the full data associated with that patient
 @api_bp.route('check_alleles')
@@ -166,74 +384,96 @@ def  check_allele_validity():
     allele1 = request.args.get('allele1')
     allele2 = request.args.get('allele2')
 
-    is_valid = check_alleles(allele1, allele2)
+    # Single probe of the genotype index
+    matches = find_alleles(allele1, allele2)
 
-    if not is_valid:
+    if not matches:
         return jsonify(None), 200
     
-    full_allele_data = get_data_given_alleles(allele1, allele2)
+    first = matches[0]
     new_mut = {
-        "allele1":     full_allele_data["allele_1"][0],
-        "allele2":     full_allele_data["allele_2"][0],
-        "inheritance": full_allele_data["inheritance"][0],
-        "dm":          full_allele_data["dm"][0],
-        "oa":          full_allele_data["oa"][0],
-        "di":          full_allele_data["di"][0],
-        "hl":          full_allele_data["hl"][0],
-        'sex':         full_allele_data['sex'][0],
-        'severity':    full_allele_data['severity'][0],
+        "allele1":     first.get("allele_1"),
+        "allele2":     first.get("allele_2"),
+        "inheritance": first.get("inheritance"),
+        "dm":          first.get("dm"),
+        "oa":          first.get("oa"),
+        "di":          first.get("di"),
+        "hl":          first.get("hl"),
+        'sex':         first.get('sex'),
+        'severity':    first.get('severity'),
     }
 
-    current = session.get('mutations', [])
-    if new_mut not in current:
-        current.append(new_mut)
-        session['mutations'] = current
+    tracked = _tracked_mutations()
+    key = _mutation_key(new_mut["allele1"], new_mut["allele2"])
+    if key not in tracked:
+        tracked[key] = new_mut
+        session['mutations'] = tracked
         return jsonify(new_mut)
 
     return jsonify(None), 200
 
+# Session key of a tracked mutation
+def _mutation_key(allele1, allele2):
+    return json.dumps([allele1, allele2])
+
+# This session's tracked mutations: {_mutation_key(allele1, allele2): mutation}, in the order added
+def _tracked_mutations():
+    tracked = session.get('mutations', {})
+    if isinstance(tracked, list):
+        # Sessions from before mutations were keyed
+        tracked = {_mutation_key(m.get('allele1'), m.get('allele2')): m for m in tracked}
+    return tracked
+
+# Re-read the patients collection now and apply what changed. Firestore is read through the process's
+# long-lived AsyncClient. Only enabled when REFRESH_TOKEN is set; callers send it as a bearer token
+@api_bp.route('/refresh', methods=['POST'])
+async def refresh_patients():
+    token = current_app.config.get('REFRESH_TOKEN')
+    if not token:
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        changed, deleted = await refresh_patients_async()
+    except Exception as e:
+        return jsonify({'error': f'Refresh failed: {str(e)}'}), 503
+    return jsonify({'changed': changed, 'deleted': deleted, 'version': get_dataset_version()})
+
 # Retrieve a dict of all the values for allele_1 and allele_2
 @api_bp.route('get_alleles')
 def get_alleles():
-    allele_list = get_allele_data()
-    return jsonify(allele_list)
+    return _cached_response(response_cache, ('alleles',), _compute_alleles)
+
+def _compute_alleles():
+    with timed('store'):
+        return get_allele_data(), 200
+
+# Autocomplete for allele inputs: [{"allele": xxx, "count": n}, ...] for the alleles starting with prefix
+# (case-insensitive), most common first. With allele1 given, suggests the allele_2 values recorded
+# together with that allele_1
+@api_bp.route('/alleles/suggest')
+def suggest_allele():
+    prefix = request.args.get('prefix', '')
+    allele_1 = request.args.get('allele1') or None
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    limit = min(limit, current_app.config['ALLELE_SUGGEST_MAX_LIMIT'])
+
+    suggestions = suggest_alleles(prefix, limit, allele_1)
+    return jsonify([{'allele': allele, 'count': count} for allele, count in suggestions])
 
 # Retrieve a list of all patient data - stored in session variable
 @api_bp.route('/get_mutation_list')
 def get_mutation_list():
     # Retrieve the list (or default to empty list)
-    mutations = session.get('mutations', [])
+    mutations = list(_tracked_mutations().values())
     return jsonify(mutations), 200
     
 
-# Local function for calculating stats based on a given list of patients
-def calculate_stats(feature_list):
-    if not feature_list:
-        return {'error': f'Stats failed for feature'}
-    # calculate stats
-    mean = np.mean(feature_list)
-    sum = np.sum(feature_list)
-    count = len(feature_list)
-    std = np.std(feature_list)
-    median = np.median(feature_list)
-    q1 = np.quantile(feature_list, 0.25)
-    q3 = np.quantile(feature_list, 0.75)
-    min = np.min(feature_list)
-    max = np.max(feature_list)
-
-    # assemble into a JSON‑serializable dict
-    stats = {
-        "Count":               count,
-        "Mean":                round(float(mean), 2),
-        "Median":              round(float(median), 2),
-        "Standard Deviation":  round(float(std), 2),
-        "Minimum":             round(float(min), 2),
-        "First Quartile":      round(float(q1), 2),
-        "Third Quartile":      round(float(q3), 2),
-        "Maximum":             round(float(max), 2)
-    }
-    return stats
-
 # Removes mutation from the mutations session variable
 @api_bp.route('/remove_mutation', methods=['POST'])
 def remove_mutation():
@@ -242,15 +482,12 @@ def remove_mutation():
     allele2 = data.get('allele2')
     
 
-    # Filter out target
-    current = session.get('mutations', [])
-    new_list = [
-        m for m in current
-        if not (m.get('allele1') == allele1 and m.get('allele2') == allele2)
-    ]
-    session['mutations'] = new_list
+    # Drop target
+    tracked = _tracked_mutations()
+    tracked.pop(_mutation_key(allele1, allele2), None)
+    session['mutations'] = tracked
 
-    return jsonify({ 'success': True, 'mutations': new_list }), 200
+    return jsonify({ 'success': True, 'mutations': list(tracked.values()) }), 200
 
 
 
@@ -274,331 +511,76 @@ def remove_mutation():
 def get_score():
     m1 = request.args.get('m1')
     m2 = request.args.get('m2')
-    print("Received m1:", m1)
-    print("Received m2:", m2)
-    if not m1 or not m2:
-        return jsonify({
-            "success": False,
-            "score":   None,
-            "error":   "Please enter values for both 'Mutation 1' and 'Mutation 2'"
-        }), 400
+    logger.debug("score request m1=%r m2=%r", m1, m2)
 
-    try:
-        info1 = parse_mutation(m1)
-        print("First mutation:", info1)
-    except ValueError as e:
-        print("Failure!", e)
-        return jsonify({
-            "success": False,
-            "score":   None,
-            "error":   "Invalid entry for 'Mutation 1'. Please see 'Expected Mutation Form' for more information"
-        }), 400
-    
-    try:
-        info2 = parse_mutation(m2)
-        print("Second mutation:", info2)
-    except ValueError as e:
-        print("Failure!", e)
+    with timed('score'):
+        result = score_pair(m1, m2)
+    if not result["success"]:
+        logger.debug("score failed error=%r", result["error"])
         return jsonify({
             "success": False,
             "score":   None,
-            "error":   "Invalid entry for 'Mutation 2'. Please see 'Expected Mutation Form' for more information"
+            "error":   result["error"]
         }), 400
 
-    in_frame     = {"substitution", "delins", "insertion", "duplication", "deletion", "missense"}
-    out_of_frame = {"frameshift", "nonsense"}
-
-    m1_in_frame = (True  if info1["mutation_type"] in  in_frame
-                   else False if info1["mutation_type"] in out_of_frame
-                   else None)
-    m2_in_frame = (True  if info2["mutation_type"] in  in_frame
-                   else False if info2["mutation_type"] in out_of_frame
-                   else None)
-    m1_tmem = info1["is_transmembrane"]
-    m2_tmem = info2["is_transmembrane"]
+    return jsonify({"success": True, "score": result["score"]})
 
-    if any(x is None for x in (m1_in_frame, m2_in_frame, m1_tmem, m2_tmem)):
-        return jsonify({
-            "success": False,
-            "score":   None,
-            "error":   "At least on mutation entry was invalid. See  'Expected Mutation Form' for more information'"
-        }), 400
 
-    # scoring logic
-    if m1_in_frame and m2_in_frame:
-        if m1_tmem and m2_tmem:
-            score = 3
-        elif m1_tmem or m2_tmem:
-            score = 2
+# Score many mutation pairs in one request
+# Body: JSON array of [m1, m2] / {"m1": ..., "m2": ...} (or {"pairs": [...]}), or NDJSON with one pair per line
+# Returns one {"m1", "m2", "success", "score", "error", "info1", "info2"} per pair, in input order
+# (as a JSON array, or NDJSON when the request was NDJSON)
+@api_bp.route('/score/batch', methods=['POST'])
+def get_score_batch():
+    ndjson = request.mimetype == 'application/x-ndjson'
+    try:
+        if ndjson:
+            items = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
         else:
-            score = 1
-    elif m1_in_frame and not m2_in_frame:
-        score = 5 if m1_tmem else 4
-    elif not m1_in_frame and m2_in_frame:
-        score = 5 if m2_tmem else 4
-    else:
-        score = 6
-
-    return jsonify({"success": True, "score": score})
-
-
-def parse_mutation(mutation):
-    print("inside parse mutation:", mutation)
-    prot = None
-
-    # 1) "(p.…)" notation?
-    m = re.search(r'\((p\.[^)]+)\)', mutation)
-    if m:
-        prot = m.group(1)
-    # 2) bare "p.…"
-    elif mutation.lower().startswith("p."):
-        prot = mutation
-
-    if prot:
-        try:
-            return parse_protein_mutation(prot)
-        except ValueError as e:
-            print("protein parse failed:", e)
-            # fall back to coding‐DNA
-            pass
-
-    # strip off any trailing " (p.…)" before coding parse
-    coding_only = re.sub(r'\s*\(p\.[^)]+\)', '', mutation)
-    print("Trying coding on:", coding_only)
-    return parse_coding_sequence_mutation(coding_only)
-
-
-def parse_protein_mutation(mutation):
-    print("inside parse PROTEIN mutation:", mutation)
-
-    info = dict.fromkeys([
-        'notation_type','aa_format','orig_aa','new_aa',
-        'start','end','ref','alt','position',
-        'mutation_type','is_transmembrane'
-    ], None)
-
-    AA_THREE_TO_ONE = {
-        'Ala':'A','Arg':'R','Asn':'N','Asp':'D','Cys':'C',
-        'Gln':'Q','Glu':'E','Gly':'G','His':'H','Ile':'I',
-        'Leu':'L','Lys':'K','Met':'M','Phe':'F','Pro':'P',
-        'Ser':'S','Thr':'T','Trp':'W','Tyr':'Y','Val':'V',
-        'Ter':'*','Sec':'U','Pyl':'O'
-    }
-
-    prot_patterns = [
-        # three‐letter nonsense: p.Glu753* or p.Glu753X
-        ('nonsense_3', re.compile(r'^(?:p\.)?([A-Za-z]{3})(\d+)(\*|X)$', re.IGNORECASE)),
-        ('del_single', re.compile(r'^(?:p\.)?([A-Za-z]{3})(\d+)del$',       re.IGNORECASE)),
-        ('del_range',  re.compile(r'^(?:p\.)?([A-Za-z]{3})(\d+)_([A-Za-z]{3})(\d+)del$', re.IGNORECASE)),
-        ('dup_range',  re.compile(r'^(?:p\.)?([A-Za-z]{3})(\d+)_([A-Za-z]{3})(\d+)dup$', re.IGNORECASE)),
-        ('ins',        re.compile(r'^(?:p\.)?([A-Za-z]{3})(\d+)_([A-Za-z]{3})(\d+)ins([A-Za-z]{3})$', re.IGNORECASE)),
-        ('sub_3',      re.compile(
-                          r'^(?:p\.)?([A-Za-z]{3})(\d+)([A-Za-z]{3})(fs\*?\d*|\*|X)?$',
-                          re.IGNORECASE
-                      )),
-        ('sub_1',      re.compile(
-                          r'^(?:p\.)?([ACDEFGHIKLMNPQRSTVWY])'      # orig
-                          r'(\d+)'                                   # pos
-                          r'([ACDEFGHIKLMNPQRSTVWYX\*])'            # new
-                          r'(fs\*?\d*)?$',                          # optional frameshift suffix
-                          re.IGNORECASE
-                      )),
-    ]
-
-    for kind, pat in prot_patterns:
-        m = pat.match(mutation)
-        if not m:
-            continue
-
-        info['notation_type'] = 'protein'
-        groups = m.groups()
-
-        if kind == 'nonsense_3':
-            orig3, pos, _ = groups
-            orig3 = orig3.title()
-            info.update({
-                'aa_format':     'three_letter',
-                'orig_aa':       AA_THREE_TO_ONE[orig3],
-                'new_aa':        '*',
-                'start':         int(pos),
-                'end':           int(pos),
-                'position':      int(pos),
-                'mutation_type': 'nonsense'
-            })
-
-        elif kind == 'del_single':
-            orig3, pos = groups
-            orig3 = orig3.title()
-            info.update({
-                'aa_format':     'three_letter',
-                'orig_aa':       AA_THREE_TO_ONE[orig3],
-                'new_aa':        None,
-                'start':         int(pos),
-                'end':           int(pos),
-                'position':      int(pos),
-                'mutation_type': 'deletion'
-            })
-
-        elif kind == 'del_range':
-            _, s, _, e = groups
-            info.update({
-                'aa_format':     'three_letter',
-                'start':         int(s),
-                'end':           int(e),
-                'position':      int(s),
-                'mutation_type': 'deletion'
-            })
-
-        elif kind == 'dup_range':
-            _, s, _, e = groups
-            info.update({
-                'aa_format':     'three_letter',
-                'start':         int(s),
-                'end':           int(e),
-                'position':      int(s),
-                'mutation_type': 'duplication'
-            })
-
-        elif kind == 'ins':
-            _, s, _, e, ins3 = groups
-            ins3 = ins3.title()
-            info.update({
-                'aa_format':     'three_letter',
-                'new_aa':        AA_THREE_TO_ONE[ins3],
-                'start':         int(s),
-                'end':           int(e),
-                'position':      int(s),
-                'mutation_type': 'insertion'
-            })
-
-        elif kind == 'sub_3':
-            orig3, pos, new3, suffix = groups
-            orig3, new3 = orig3.title(), new3.title()
-            one_orig = AA_THREE_TO_ONE[orig3]
-            one_new  = AA_THREE_TO_ONE[new3]
-            info.update({
-                'aa_format':     'three_letter',
-                'orig_aa':       one_orig,
-                'new_aa':        one_new,
-                'position':      int(pos),
-            })
-            if suffix and suffix.lower().startswith('fs'):
-                info['mutation_type'] = 'frameshift'
-            elif one_new == '*' or suffix in ('*', 'X'):
-                info['mutation_type'] = 'nonsense'
-            else:
-                info['mutation_type'] = 'missense'
-
-        elif kind == 'sub_1':
-            orig1, pos, new1, suffix = groups
-            orig1, new1 = orig1.upper(), new1.upper()
-            info.update({
-                'aa_format':     'one_letter',
-                'orig_aa':       orig1,
-                'new_aa':        new1,
-                'position':      int(pos),
-            })
-            if suffix and suffix.lower().startswith('fs'):
-                info['mutation_type'] = 'frameshift'
-            elif new1 in ('*', 'X'):
-                info['mutation_type'] = 'nonsense'
-            else:
-                info['mutation_type'] = 'missense'
-
-        # set TM status if we have a position
-        if info['position'] is not None:
-            info['is_transmembrane'] = is_in_transmembrane(info['position'])
-
-        return info
-
-    # if nothing matched
-    raise ValueError(f"Unrecognized protein mutation format: {mutation!r}")
-
-
-def parse_coding_sequence_mutation(mutation):
-    print("inside parse CODING mutation:", mutation)
-
-    info = dict.fromkeys([
-        'notation_type','aa_format','orig_aa','new_aa',
-        'start','end','ref','alt','position',
-        'mutation_type','is_transmembrane'
-    ], None)
-
-    coding_patterns = [
-        ('substitution', re.compile(r'^c\.(\d+)([ACGTNatgcy]+)>([ACGTNatgcy]+)$', re.IGNORECASE)),
-        ('delins',       re.compile(r'^c\.(\d+)_(\d+)delins([A-Za-z0-9]+)$', re.IGNORECASE)),
-        ('insertion',    re.compile(r'^c\.(\d+)_(\d+)ins([A-Za-z0-9]+)$', re.IGNORECASE)),
-        ('duplication',  re.compile(r'^c\.(\d+)(?:_(\d+))?dup([A-Za-z0-9]*)$', re.IGNORECASE)),
-        ('deletion',     re.compile(r'^c\.(\d+)(?:_(\d+))?del([A-Za-z0-9]+)$', re.IGNORECASE)),
-    ]
-
-    for name, pat in coding_patterns:
-        m = pat.match(mutation)
-        if not m:
-            continue
-
-        info['notation_type'] = 'coding'
-        groups = m.groups()
-
-        if name == 'substitution':
-            start, ref, alt = groups
-            info.update({
-                'mutation_type':'substitution',
-                'start':        int(start),
-                'position':     int(start),
-                'ref':          ref,
-                'alt':          alt
-            })
-        elif name == 'delins':
-            s, e, alt = groups
-            info.update({
-                'mutation_type':'delins',
-                'start':        int(s),
-                'end':          int(e),
-                'alt':          alt,
-                'position':     int(s)
-            })
-        elif name == 'insertion':
-            s, e, alt = groups
-            info.update({
-                'mutation_type':'insertion',
-                'start':        int(s),
-                'end':          int(e),
-                'alt':          alt,
-                'position':     int(s)
-            })
-        elif name == 'duplication':
-            s, e, dup = groups
-            info.update({
-                'mutation_type':'duplication',
-                'start':        int(s),
-                'end':          int(e) if e else None,
-                'alt':          dup,
-                'position':     int(s)
-            })
-        elif name == 'deletion':
-            s, e, ref = groups
-            info.update({
-                'mutation_type':'deletion',
-                'start':        int(s),
-                'end':          int(e) if e else None,
-                'ref':          ref,
-                'position':     int(s)
-            })
-
-        if info['position'] is not None:
-            aa_pos = (info['position'] + 2) // 3
-            info['is_transmembrane'] = is_in_transmembrane(aa_pos)
-
-        return info
-
-    raise ValueError(f"Unrecognized coding mutation format: {mutation!r}")
-
-
-def is_in_transmembrane(pos):
-    transmembrane_domains = [
-        (314, 334), (340, 360), (402, 422), (427, 447),
-        (465, 485), (496, 516), (529, 549), (563, 583),
-        (589, 609), (632, 652), (870, 890)
-    ]
-    return any(s <= pos <= e for s, e in transmembrane_domains)
+            items = request.get_json(silent=True)
+            if isinstance(items, dict):
+                items = items.get('pairs')
+    except ValueError as e:
+        return jsonify({'error': f'Invalid NDJSON body: {str(e)}'}), 400
+
+    if not isinstance(items, list):
+        return jsonify({'error': 'Expected a JSON array of mutation pairs'}), 400
+    if len(items) > current_app.config['SCORE_BATCH_MAX_PAIRS']:
+        return jsonify({'error': f"At most {current_app.config['SCORE_BATCH_MAX_PAIRS']} pairs per batch"}), 413
+
+    pairs = [_batch_pair(item) for item in items]
+    valid = [pair for pair in pairs if pair is not None]
+    with timed('score'):
+        scored = iter(score_batch(valid, workers=current_app.config['SCORE_BATCH_WORKERS']))
+
+    results = []
+    for item, pair in zip(items, pairs):
+        if pair is None:
+            result = {"success": False, "score": None, "error": "Each entry must be [m1, m2] or {\"m1\": ..., \"m2\": ...} with string values",
+                      "info1": None, "info2": None}
+            m1 = m2 = None
+        else:
+            result = next(scored)
+            m1, m2 = pair
+        results.append({"m1": m1, "m2": m2, **result})
+
+    with timed('serialize'):
+        if ndjson:
+            body = ''.join(json.dumps(result) + '\n' for result in results)
+            return current_app.response_class(body, mimetype='application/x-ndjson')
+        return jsonify(results)
+
+# (m1, m2) from one batch entry, or None if it isn't a pair of strings (null/'' count as missing)
+def _batch_pair(item):
+    if isinstance(item, dict):
+        item = (item.get('m1'), item.get('m2'))
+    if not isinstance(item, (list, tuple)) or len(item) != 2:
+        return None
+    if not all(m is None or isinstance(m, str) for m in item):
+        return None
+    return tuple(item)
+
+# Request metrics of this worker in the Prometheus text format
+@api_bp.route('/_metrics')
+def get_metrics():
+    return current_app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -2,20 +2,43 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 from routes import api_bp
 from config import Config
-from firebase_client import init_firebase
+from firebase_client import init_firebase, sync_shared_store
+from cache import response_cache, stats_cache
+from json_provider import JSONProvider
+from sessions import make_session_interface
+from mutation_parser import load_transmembrane_domains
+from scoring import start_pool
+from parallel_stats import start_pool as start_stats_pool
 
 # Factory function to create flask instance, add blueprint(s), and add configs
-def create_app():
+# load_data=False leaves the patient data to the caller (e.g. bench.py injects a synthetic cohort)
+def create_app(load_data=True):
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = JSONProvider(app)
+    session_interface = make_session_interface(app.config)
+    if session_interface is not None:
+        app.session_interface = session_interface
 
     CORS(
         app,
         origins=["http://localhost:3000", "https://liamoiknine.github.io"],
         supports_credentials=True,
-        resources={r"/api/*": {"origins": "*"}}
+        resources={r"/api/*": {"origins": "*"}},
+        expose_headers=["X-Stats-Cache", "X-Stats-Approximate", "X-Next-Cursor", "X-Total-Count"]
     )
-    init_firebase(app) 
+    # Before anything starts threads: the stats cube's first build may already use it
+    if app.config['STATS_WORKERS'] != 1:
+        start_stats_pool(app.config['STATS_WORKERS'])
+    if load_data:
+        init_firebase(app)
+    app.before_request(sync_shared_store)
+    stats_cache.configure(app.config['STATS_CACHE_MAX_ENTRIES'], app.config['STATS_CACHE_MAX_BYTES'])
+    response_cache.configure(app.config['RESPONSE_CACHE_MAX_ENTRIES'], app.config['RESPONSE_CACHE_MAX_BYTES'])
+    if app.config['TRANSMEMBRANE_DOMAINS']:
+        load_transmembrane_domains(app.config['TRANSMEMBRANE_DOMAINS'])
+    if app.config['SCORE_BATCH_WORKERS'] != 1:
+        start_pool(app.config['SCORE_BATCH_WORKERS'], app.config['TRANSMEMBRANE_DOMAINS'])
 
     app.register_blueprint(api_bp, url_prefix='/api')
     return app
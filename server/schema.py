@@ -0,0 +1,145 @@
+# schema.py
+# Column schema of the patient data, shared by the CSV importer (scripts/import_to_firestore.py), the
+# in-memory patient store and any other file loader, so every path agrees on each field's type
+import csv
+import itertools
+from collections import namedtuple
+import numpy as np
+
+# type is one of 'int', 'float', 'bool', 'str'; nullable fields map '' to None
+FieldSpec = namedtuple('FieldSpec', 'name type nullable')
+
+# A cell that couldn't be coerced: CSV row number (header = 1), column, raw text, reason
+CellError = namedtuple('CellError', 'row column value message')
+
+# In CSV column order
+PATIENT_SCHEMA = [
+    FieldSpec('id',          'int',   True),
+    FieldSpec('sex',         'int',   True),
+    FieldSpec('age',         'int',   True),
+    FieldSpec('inheritance', 'str',   False),
+    FieldSpec('hu',          'int',   True),
+    FieldSpec('allele_1',    'str',   False),
+    FieldSpec('allele_1_c',  'str',   False),
+    FieldSpec('allele_1_p',  'str',   False),
+    FieldSpec('mutation_1',  'str',   False),
+    FieldSpec('position_1',  'int',   True),
+    FieldSpec('tmem_1',      'int',   True),
+    FieldSpec('allele_2',    'str',   False),
+    FieldSpec('allele_2_c',  'str',   False),
+    FieldSpec('allele_2_p',  'str',   False),
+    FieldSpec('mutation_2',  'str',   False),
+    FieldSpec('position_2',  'int',   True),
+    FieldSpec('tmem_2',      'int',   True),
+    FieldSpec('n_nsfs',      'int',   True),
+    FieldSpec('n_tm',        'int',   True),
+    FieldSpec('has_dm',      'bool',  True),
+    FieldSpec('has_oa',      'bool',  True),
+    FieldSpec('has_di',      'bool',  True),
+    FieldSpec('has_hl',      'bool',  True),
+    FieldSpec('severity',    'float', True),
+    FieldSpec('dm',          'float', True),
+    FieldSpec('oa',          'float', True),
+    FieldSpec('di',          'float', True),
+    FieldSpec('hl',          'float', True),
+]
+
+# {field: type} for the patient store
+PATIENT_TYPES = {spec.name: spec.type for spec in PATIENT_SCHEMA}
+
+# CSV spelling of booleans
+BOOL_VALUES = {'Y': True, 'N': False}
+
+_NUMERIC = {
+    'int':   (np.int64, int),
+    'float': (np.float64, float),
+}
+
+
+# Coerce one column of raw CSV strings. Returns (data, null, bad) where data is a typed array (object
+# array of str for 'str' fields), null marks missing cells and bad maps row index -> reason
+def coerce_column(spec, raw):
+    raw = np.asarray(raw, dtype=str)
+    null = raw == ''
+    bad = {}
+
+    if spec.type == 'str':
+        # Strings are kept as-is, '' included
+        return raw.astype(object), np.zeros(len(raw), dtype=bool), bad
+
+    if spec.type == 'bool':
+        data = raw == 'Y'
+        for i in np.flatnonzero(~null & ~data & (raw != 'N')).tolist():
+            bad[i] = f"expected one of {sorted(BOOL_VALUES)}"
+    else:
+        dtype, cast = _NUMERIC[spec.type]
+        data = np.zeros(len(raw), dtype=dtype)
+        present = ~null
+        try:
+            data[present] = raw[present].astype(dtype)
+        except ValueError:
+            # Only now go cell by cell, to find which ones are wrong
+            for i in np.flatnonzero(present).tolist():
+                try:
+                    data[i] = cast(raw[i])
+                except ValueError:
+                    bad[i] = f"invalid {spec.type}"
+
+    if not spec.nullable:
+        for i in np.flatnonzero(null).tolist():
+            bad[i] = "missing value"
+    return data, null, bad
+
+
+# Coerce a chunk of CSV rows column by column against the schema
+# first_row is the CSV row number of rows[0]; returns ({field: (data, null)}, [CellError, ...])
+def coerce_chunk(header, rows, first_row, schema=PATIENT_SCHEMA):
+    width = len(header)
+    # Short rows are padded with empty cells, extra cells are ignored
+    cells = list(zip(*(row[:width] + [''] * (width - len(row)) for row in rows))) if rows else [()] * width
+    by_name = dict(zip(header, cells))
+
+    columns = {}
+    errors = []
+    specs = {spec.name: spec for spec in schema}
+    for name in header:
+        spec = specs.get(name, FieldSpec(name, 'str', False))
+        data, null, bad = coerce_column(spec, by_name[name])
+        columns[name] = (data, null)
+        for i, message in bad.items():
+            errors.append(CellError(first_row + i, name, by_name[name][i], message))
+        null[list(bad)] = True
+    errors.sort()
+    return columns, errors
+
+
+# Turn coerced columns back into per-row dicts (None for missing cells), leaving out the given rows
+def chunk_records(columns, skip=()):
+    names = list(columns)
+    lists = []
+    for name in names:
+        data, null = columns[name]
+        values = data.astype(object)
+        values[null] = None
+        lists.append(values.tolist())
+    skip = set(skip)
+    return [dict(zip(names, row)) for i, row in enumerate(zip(*lists)) if i not in skip]
+
+
+# Stream a CSV file in chunks: yields (records, errors) per chunk of chunk_size rows, where records
+# are typed dicts for the rows without bad cells and errors lists the bad cells (CellError)
+def read_csv(path, chunk_size=10000, schema=PATIENT_SCHEMA):
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        first_row = 2
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                return
+            columns, errors = coerce_chunk(header, rows, first_row, schema)
+            skip = {error.row - first_row for error in errors}
+            yield chunk_records(columns, skip), errors
+            first_row += len(rows)
@@ -0,0 +1,162 @@
+# score_cli.py
+# Offline batch scorer: streams mutation pairs from a CSV / TSV / VCF-like file through the same
+# parsing and scoring rules as /api/score and writes the input rows back out with score columns.
+#
+#   python score_cli.py input.tsv -o scored.tsv --workers 4
+#   cat pairs.csv | python score_cli.py - --format csv > scored.csv
+#
+# Like the server, it uses the transmembrane domains in TRANSMEMBRANE_DOMAINS when set (or --domains)
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from multiprocessing import Pool
+from mutation_parser import load_transmembrane_domains
+from scoring import score_batch
+
+DELIMITERS = {'csv': ',', 'tsv': '\t', 'vcf': '\t'}
+
+# Column names tried (in order) for each mutation when --m1-column / --m2-column aren't given;
+# if none is present the first two columns are used
+M1_COLUMNS = ['m1', 'mutation_1', 'allele_1_p', 'allele_1']
+M2_COLUMNS = ['m2', 'mutation_2', 'allele_2_p', 'allele_2']
+
+OUTPUT_COLUMNS = ['score', 'success', 'error', 'm1_type', 'm2_type']
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Score WFS1 mutation pairs from a file without running the server.')
+    parser.add_argument('input', help="input file, or '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    parser.add_argument('--format', choices=sorted(DELIMITERS), help='input format (default: from the file extension, else tsv)')
+    parser.add_argument('--m1-column', help='column holding the first mutation')
+    parser.add_argument('--m2-column', help='column holding the second mutation')
+    parser.add_argument('--domains', default=os.getenv('TRANSMEMBRANE_DOMAINS'),
+                        help='CSV (start,end) of transmembrane domains (default: $TRANSMEMBRANE_DOMAINS, '
+                             'else the bundled WFS1 table)')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes (default: 1, score in-process)')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='pairs scored per unit of work')
+    parser.add_argument('--progress-every', type=float, default=5.0, help='seconds between progress lines on stderr (0 = off)')
+    return parser.parse_args(argv)
+
+
+def detect_format(path):
+    for fmt in DELIMITERS:
+        if path.lower().endswith('.' + fmt) or path.lower().endswith(f'.{fmt}.txt'):
+            return fmt
+    return 'tsv'
+
+
+# Lines of the input with VCF-style '##' meta lines dropped and a leading '#' stripped off the header
+def data_lines(f):
+    for line in f:
+        if line.startswith('##') or not line.strip():
+            continue
+        yield line[1:] if line.startswith('#') else line
+
+
+def pick_column(header, explicit, candidates, fallback):
+    if explicit:
+        if explicit not in header:
+            raise SystemExit(f"Column {explicit!r} not found in input header: {header}")
+        return header.index(explicit)
+    for name in candidates:
+        if name in header:
+            return header.index(name)
+    return fallback
+
+
+# Score one chunk of rows: returns the rows with the output columns appended
+def score_rows(job):
+    rows, i1, i2 = job
+    pairs = [(_cell(row, i1), _cell(row, i2)) for row in rows]
+    out = []
+    for row, result in zip(rows, score_batch(pairs)):
+        info1, info2 = result['info1'] or {}, result['info2'] or {}
+        out.append(row + [
+            '' if result['score'] is None else result['score'],
+            'true' if result['success'] else 'false',
+            result['error'] or '',
+            info1.get('mutation_type') or '',
+            info2.get('mutation_type') or '',
+        ])
+    return out
+
+
+def _cell(row, index):
+    value = row[index].strip() if index < len(row) else ''
+    return value or None
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.domains:
+        load_transmembrane_domains(args.domains)
+    fmt = args.format or ('tsv' if args.input == '-' else detect_format(args.input))
+    delimiter = DELIMITERS[fmt]
+
+    infile = sys.stdin if args.input == '-' else open(args.input, newline='')
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        reader = csv.reader(data_lines(infile), delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            raise SystemExit('Input is empty')
+        i1 = pick_column(header, args.m1_column, M1_COLUMNS, 0)
+        i2 = pick_column(header, args.m2_column, M2_COLUMNS, 1)
+
+        writer = csv.writer(outfile, delimiter=delimiter, lineterminator='\n')
+        writer.writerow(header + OUTPUT_COLUMNS)
+
+        jobs = ((chunk, i1, i2) for chunk in chunked(reader, args.chunk_size))
+        # Workers load the same domain table (a spawned worker wouldn't inherit it)
+        pool = None
+        if args.workers > 1:
+            pool = Pool(args.workers, initializer=load_transmembrane_domains if args.domains else None,
+                        initargs=(args.domains,) if args.domains else ())
+        try:
+            # imap keeps input order while the pool streams through the file
+            results = pool.imap(score_rows, jobs) if pool else map(score_rows, jobs)
+            report(results, writer, outfile, args.progress_every)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+# Write scored chunks as they arrive, with periodic throughput lines on stderr
+def report(results, writer, outfile, every):
+    start = last = time.monotonic()
+    done = scored = 0
+    for rows in results:
+        writer.writerows(rows)
+        outfile.flush()
+        done += len(rows)
+        scored += sum(row[-4] == 'true' for row in rows)
+        now = time.monotonic()
+        if every and now - last >= every:
+            last = now
+            print(f"[score] {done} rows, {done / (now - start):.0f} rows/s", file=sys.stderr)
+    elapsed = max(time.monotonic() - start, 1e-9)
+    print(f"[score] done: {done} rows ({scored} scored, {done - scored} errors) in {elapsed:.1f}s, "
+          f"{done / elapsed:.0f} rows/s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
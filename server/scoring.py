@@ -0,0 +1,142 @@
+# scoring.py
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from mutation_parser import load_transmembrane_domains, parse_mutation
+
+IN_FRAME     = {"substitution", "delins", "insertion", "duplication", "deletion", "missense"}
+OUT_OF_FRAME = {"frameshift", "nonsense"}
+
+MISSING_ENTRY_ERROR = "Please enter values for both 'Mutation 1' and 'Mutation 2'"
+INVALID_ENTRY_ERROR = "Invalid entry for 'Mutation {n}'. Please see 'Expected Mutation Form' for more information"
+UNSCORABLE_ERROR    = "At least on mutation entry was invalid. See  'Expected Mutation Form' for more information'"
+
+# Below this many distinct mutation strings a batch is parsed in-process
+PARALLEL_MIN_MUTATIONS = 20000
+
+# Long-lived parser pool of a server (see start_pool), None when not started
+_pool = None
+_pool_workers = 0
+
+
+# Parse one mutation string: (info, None) on success, (None, error message) if it is not valid notation
+# (an unknown amino-acid code surfaces as KeyError from the parser)
+def try_parse(mutation):
+    try:
+        return parse_mutation(mutation), None
+    except (ValueError, KeyError) as e:
+        return None, str(e)
+
+
+# True / False for in-frame / out-of-frame mutation types, None if unknown
+def is_in_frame(info):
+    if info["mutation_type"] in IN_FRAME:
+        return True
+    if info["mutation_type"] in OUT_OF_FRAME:
+        return False
+    return None
+
+
+# Severity score (1-6) for two parsed mutations, or None if either can't be classified
+def score_infos(info1, info2):
+    m1_in_frame = is_in_frame(info1)
+    m2_in_frame = is_in_frame(info2)
+    m1_tmem = info1["is_transmembrane"]
+    m2_tmem = info2["is_transmembrane"]
+
+    if any(x is None for x in (m1_in_frame, m2_in_frame, m1_tmem, m2_tmem)):
+        return None
+
+    # scoring logic
+    if m1_in_frame and m2_in_frame:
+        if m1_tmem and m2_tmem:
+            return 3
+        elif m1_tmem or m2_tmem:
+            return 2
+        else:
+            return 1
+    elif m1_in_frame and not m2_in_frame:
+        return 5 if m1_tmem else 4
+    elif not m1_in_frame and m2_in_frame:
+        return 5 if m2_tmem else 4
+    else:
+        return 6
+
+
+# Score a pair given each mutation's (info, parse error) as returned by try_parse
+# Returns {"success", "score", "error", "info1", "info2"}
+def score_parsed(parsed1, parsed2):
+    (info1, err1), (info2, err2) = parsed1, parsed2
+    result = {"success": False, "score": None, "error": None, "info1": info1, "info2": info2}
+    if err1 is not None:
+        result["error"] = INVALID_ENTRY_ERROR.format(n=1)
+    elif err2 is not None:
+        result["error"] = INVALID_ENTRY_ERROR.format(n=2)
+    else:
+        score = score_infos(info1, info2)
+        if score is None:
+            result["error"] = UNSCORABLE_ERROR
+        else:
+            result.update(success=True, score=score)
+    return result
+
+
+# Score one pair of raw mutation strings (same rules and messages as /score)
+def score_pair(m1, m2):
+    if not m1 or not m2:
+        return {"success": False, "score": None, "error": MISSING_ENTRY_ERROR, "info1": None, "info2": None}
+    return score_parsed(try_parse(m1), try_parse(m2))
+
+
+def _parse_chunk(mutations):
+    return [try_parse(m) for m in mutations]
+
+
+# Start the pool parse_many uses from then on: `workers` processes (0 = one per CPU) that live as long
+# as this process. They are spawned, not forked, so they hold none of a server's threads or Firestore
+# connections; domains: transmembrane domain table file they load instead of the default one
+def start_pool(workers=0, domains=None):
+    global _pool, _pool_workers
+    if _pool is not None:
+        return _pool
+    _pool_workers = workers or os.cpu_count() or 1
+    _pool = ProcessPoolExecutor(max_workers=_pool_workers, mp_context=multiprocessing.get_context('spawn'),
+                                initializer=load_transmembrane_domains if domains else None,
+                                initargs=(domains,) if domains else ())
+    return _pool
+
+
+# Parse every distinct mutation string once: {mutation: (info, error)}
+# Large sets are split across the pool started with start_pool, if any, else across a pool of `workers`
+# processes (0/None = one per CPU) made for this call; workers=1 always parses in-process
+def parse_many(mutations, workers=1):
+    mutations = list(dict.fromkeys(mutations))
+    if _pool is not None and workers != 1:
+        workers = _pool_workers
+    else:
+        workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(mutations) < PARALLEL_MIN_MUTATIONS:
+        return dict(zip(mutations, _parse_chunk(mutations)))
+
+    size = -(-len(mutations) // (workers * 4))
+    chunks = [mutations[i:i + size] for i in range(0, len(mutations), size)]
+    parsed = {}
+    with nullcontext(_pool) if _pool is not None else ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk, results in zip(chunks, pool.map(_parse_chunk, chunks)):
+            parsed.update(zip(chunk, results))
+    return parsed
+
+
+# Score many (m1, m2) pairs; identical mutation strings are parsed only once across the batch
+# Returns one result dict per pair (see score_parsed), in input order
+def score_batch(pairs, workers=1):
+    pairs = list(pairs)
+    parsed = parse_many((m for pair in pairs for m in pair if m), workers)
+    results = []
+    for m1, m2 in pairs:
+        if not m1 or not m2:
+            results.append(score_pair(m1, m2))
+        else:
+            results.append(score_parsed(parsed[m1], parsed[m2]))
+    return results
@@ -0,0 +1,151 @@
+# sessions.py
+# Server-side sessions: the cookie carries only a signed session id and the data stays on the server,
+# so requests and responses don't grow with what a user keeps in their session (e.g. a long tracking
+# list). Sessions live in an in-process LRU store by default, or in Redis (or anything speaking its
+# protocol) so that several workers / instances share them
+import copy
+import json
+import os
+import secrets
+from itsdangerous import BadSignature, Signer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from cache import LRUCache
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+# Sessions of this process, least recently used dropped first (not shared between workers)
+class MemorySessionStore:
+    def __init__(self, max_entries=10000):
+        self._cache = LRUCache(max_entries=max_entries, max_bytes=float('inf'))
+
+    # Each request gets (and hands back) its own copy, so concurrent requests of one session never
+    # mutate the same nested values (e.g. the tracked mutations dict)
+    def load(self, sid):
+        data = self._cache.get(sid)
+        return copy.deepcopy(data) if data is not None else None
+
+    def save(self, sid, data, lifetime):
+        self._cache.put(sid, copy.deepcopy(data), 1)
+
+    def delete(self, sid):
+        self._cache.pop(sid)
+
+
+# Sessions as JSON under key_prefix + id in a Redis-compatible server, expiring after their lifetime
+class RedisSessionStore:
+    def __init__(self, client, key_prefix='session:'):
+        self.client = client
+        self.key_prefix = key_prefix
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis needs the redis package (pip install redis)")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def load(self, sid):
+        raw = self.client.get(self.key_prefix + sid)
+        return json.loads(raw) if raw is not None else None
+
+    def save(self, sid, data, lifetime):
+        self.client.set(self.key_prefix + sid, json.dumps(data), ex=int(lifetime.total_seconds()))
+
+    def delete(self, sid):
+        self.client.delete(self.key_prefix + sid)
+
+
+class ServerSessionInterface(SessionInterface):
+    salt = 'session-id'
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        if not app.secret_key:
+            return None
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request):
+        signer = self._signer(app)
+        if signer is None:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = signer.unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            data = self.store.load(sid) if sid else None
+            if data is not None:
+                return ServerSession(data, sid)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            # Emptied: forget it on both ends
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            self.store.save(session.sid, dict(session), app.permanent_session_lifetime)
+        if not self.should_set_cookie(app, session):
+            return
+        response.vary.add('Cookie')
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode()).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+# Number of server worker processes, as far as the environment tells: gunicorn's --workers /-w in
+# GUNICORN_CMD_ARGS, else WEB_CONCURRENCY (gunicorn's default for it, set by e.g. Heroku). 1 if unknown
+def worker_count(environ=os.environ):
+    args = environ.get('GUNICORN_CMD_ARGS', '').replace('=', ' ').split()
+    for flag, value in zip(args, args[1:]):
+        if flag in ('-w', '--workers') and value.isdigit():
+            return int(value)
+    value = environ.get('WEB_CONCURRENCY', '')
+    return int(value) if value.isdigit() else 1
+
+
+# Session interface for SESSION_BACKEND: 'memory', 'redis', or None for 'cookie' (Flask's signed-cookie
+# sessions). Unset means 'memory' for a single worker and 'cookie' for several, since memory sessions
+# are per process: asking for 'memory' with several workers is refused
+def make_session_interface(config, workers=None):
+    workers = worker_count() if workers is None else workers
+    backend = config.get('SESSION_BACKEND') or ('memory' if workers <= 1 else 'cookie')
+    if backend == 'cookie':
+        return None
+    if backend == 'redis':
+        return ServerSessionInterface(RedisSessionStore.from_url(config['SESSION_REDIS_URL']))
+    if backend == 'memory':
+        if workers > 1:
+            raise RuntimeError(f"SESSION_BACKEND=memory keeps sessions in one process but {workers} workers "
+                               "are configured; use SESSION_BACKEND=redis (or cookie)")
+        return ServerSessionInterface(MemorySessionStore(config.get('SESSION_MAX_ENTRIES', 10000)))
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r}")
@@ -0,0 +1,209 @@
+# sketch.py
+# Mergeable, bounded-memory summaries of a stream of numbers, for approximate stats: running moments
+# (Welford) give the count, mean, standard deviation, minimum and maximum, and a KLL sketch the median
+# and quartiles. Adding a value is O(1) (amortized), the summaries of two disjoint sets of patients
+# merge into the summary of their union, and a sketch keeps O(k) values however many it has seen.
+# Quantiles are off by about 1.7% of the count in rank at k=200 (as with Apache DataSketches' KLL),
+# and exact while fewer than ~k values have been added
+import math
+import numpy as np
+from stats import _stats_dict
+
+DEFAULT_K = 200
+
+
+# Count, mean, sum of squared deviations (m2), minimum and maximum of the values added so far
+class Moments:
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    # Add an array of values at once
+    def update_many(self, values):
+        if not len(values):
+            return
+        batch = Moments()
+        batch.count = len(values)
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        self.merge(batch)
+
+    # Fold in the moments of another set of values (Chan et al.)
+    def merge(self, other):
+        if not other.count:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy(self):
+        other = Moments()
+        other.count, other.mean, other.m2, other.min, other.max = self.count, self.mean, self.m2, self.min, self.max
+        return other
+
+    # Population standard deviation, as the exact stats report it
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / self.count) if self.count else math.nan
+
+
+# KLL quantile sketch (Karnin, Lang & Liberty): values sit in levels of compactors, a value at level h
+# standing for 2**h of the original ones. A full level is sorted and every other value (odd or even
+# positions, at random) moves up a level; the top level holds k values and each lower one 2/3 of the
+# one above
+class KLLSketch:
+    __slots__ = ('k', 'levels', 'count', '_bits')
+
+    def __init__(self, k=DEFAULT_K, seed=0):
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        # State of a small LCG picking the compaction offsets, so a given input always gives the same sketch
+        self._bits = seed & 0x7fffffff
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, x):
+        self.levels[0].append(x)
+        self.count += 1
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    # Add an array of values at once: they land on the bottom level, which is then compacted up as far
+    # as needed in one sweep (a sort and a halving per level)
+    def update_many(self, values):
+        self.levels[0].extend(values.tolist())
+        self.count += len(values)
+        self._compress()
+
+    def _coin(self):
+        self._bits = (self._bits * 1103515245 + 12345) & 0x7fffffff
+        return (self._bits >> 16) & 1
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items = np.sort(np.asarray(self.levels[level], dtype=np.float64))
+                # An odd one out stays behind so the total weight stays equal to the count
+                kept = items[-1:] if len(items) % 2 else items[:0]
+                self.levels[level + 1].extend(items[:len(items) - len(kept)][self._coin()::2].tolist())
+                self.levels[level] = kept.tolist()
+            level += 1
+
+    # Fold in a sketch of another set of values
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._compress()
+
+    def copy(self):
+        other = KLLSketch(self.k)
+        other.levels = [list(items) for items in self.levels]
+        other.count = self.count
+        other._bits = self._bits
+        return other
+
+    # Values at quantiles qs, interpolating linearly between neighbouring ranks like np.quantile (so
+    # results are exact while nothing has been compacted)
+    def quantiles(self, qs):
+        values = np.concatenate([np.asarray(items, dtype=np.float64) for items in self.levels])
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=np.int64)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        total = int(cumulative[-1])
+
+        def at(rank):
+            return values[np.searchsorted(cumulative, rank, side='right')]
+
+        out = []
+        for q in qs:
+            pos = q * (total - 1)
+            lo = math.floor(pos)
+            low = at(lo)
+            out.append(float(low + (at(min(lo + 1, total - 1)) - low) * (pos - lo)))
+        return out
+
+
+# Moments plus a quantile sketch of one set of values
+class StreamSummary:
+    __slots__ = ('moments', 'sketch')
+
+    def __init__(self, k=DEFAULT_K):
+        self.moments = Moments()
+        self.sketch = KLLSketch(k)
+
+    def __len__(self):
+        return self.moments.count
+
+    def update(self, x):
+        x = float(x)
+        self.moments.update(x)
+        self.sketch.update(x)
+
+    def update_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.moments.update_many(values)
+        self.sketch.update_many(values)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def copy(self):
+        other = StreamSummary.__new__(StreamSummary)
+        other.moments = self.moments.copy()
+        other.sketch = self.sketch.copy()
+        return other
+
+    # Stats dict in the form calculate_stats returns
+    def stats(self):
+        m = self.moments
+        q1, median, q3 = self.sketch.quantiles((0.25, 0.5, 0.75))
+        return _stats_dict({
+            "Count":              [m.count],
+            "Mean":               [m.mean],
+            "Median":             [median],
+            "Standard Deviation": [m.std],
+            "Minimum":            [m.min],
+            "First Quartile":     [q1],
+            "Third Quartile":     [q3],
+            "Maximum":            [m.max],
+        }, 0)
+
+
+# Summary of the union of the given summaries (which are left as they are)
+def merge_summaries(summaries, k=DEFAULT_K):
+    merged = StreamSummary(k)
+    for summary in summaries:
+        merged.merge(summary)
+    return merged
@@ -0,0 +1,183 @@
+# snapshot.py
+# On-disk copy of the patient store so workers can start without reading the whole Firestore collection.
+# A snapshot is a directory of plain .npy arrays (one data + null array per field, plus the vocabulary of
+# dictionary-encoded fields, as JSON when it isn't all strings) and a meta.json version stamp. Snapshots
+# live in versioned subdirectories of the snapshot root and the `current` symlink points at the live one,
+# so publishing is atomic.
+# Loaded with mmap=True the arrays are read-only memory maps: every worker process maps the same files
+# and shares one copy of the data through the page cache (put the root on /dev/shm to keep it in RAM)
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+import numpy as np
+from patient_store import Column, PatientStore
+
+FORMAT = 1
+CURRENT = 'current'
+
+
+# Content hash of a store, so identical data gets the same version whatever its load time
+def store_digest(store):
+    digest = hashlib.sha1()
+    for name, col in store.columns.items():
+        digest.update(f"{name}:{col.kind}:".encode())
+        digest.update(np.ascontiguousarray(col.data).tobytes())
+        digest.update(np.ascontiguousarray(col.null).tobytes())
+        if col.vocab is not None:
+            digest.update(json.dumps(col.vocab, default=repr).encode())
+    return digest.hexdigest()
+
+
+# Write a store as a new snapshot under root and make it the current one. Returns its meta dict
+def save_snapshot(store, root, source='firestore'):
+    created = time.time()
+    meta = {
+        'format':  FORMAT,
+        'version': f"{int(created)}-{store_digest(store)[:12]}",
+        'created': created,
+        'source':  source,
+        'size':    len(store),
+        'fields':  {name: col.kind for name, col in store.columns.items()},
+    }
+    os.makedirs(root, exist_ok=True)
+    target = os.path.join(root, meta['version'])
+    tmp = f"{target}.tmp-{os.getpid()}"
+    os.makedirs(tmp)
+    try:
+        for i, (name, col) in enumerate(store.columns.items()):
+            np.save(os.path.join(tmp, f"{i}.data.npy"), col.data)
+            np.save(os.path.join(tmp, f"{i}.null.npy"), col.null)
+            if col.vocab is not None:
+                _save_vocab(os.path.join(tmp, f"{i}.vocab"), name, col.vocab)
+        # Document ids, so changes from Firestore can be matched to rows after a reload
+        np.save(os.path.join(tmp, 'ids.npy'), np.array([doc_id or '' for doc_id in store.ids()], dtype=str))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if os.path.exists(target):
+        shutil.rmtree(tmp)
+    else:
+        os.rename(tmp, target)
+    _point_current(root, meta['version'])
+    return meta
+
+
+# Vocabulary of a dictionary-encoded field at path (without extension): a .npy string array, or, for
+# fields that also hold numbers / booleans, a JSON list so they load back as the same values.
+# TypeError for values JSON can't hold either
+def _save_vocab(path, name, vocab):
+    if all(isinstance(v, str) for v in vocab):
+        np.save(f"{path}.npy", np.array(vocab, dtype=str))
+        return
+    try:
+        with open(f"{path}.json", 'w') as f:
+            json.dump(vocab, f, allow_nan=True)
+    except TypeError:
+        raise TypeError(f"Field {name!r} holds values that can't be snapshotted")
+
+
+def _load_vocab(path):
+    if os.path.exists(f"{path}.json"):
+        with open(f"{path}.json") as f:
+            return json.load(f)
+    return np.load(f"{path}.npy").tolist()
+
+
+# Atomically repoint root/current at a snapshot directory
+def _point_current(root, version):
+    link = os.path.join(root, CURRENT)
+    tmp = f"{link}.tmp-{os.getpid()}"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(version, tmp)
+    os.replace(tmp, link)
+
+
+# Meta dict of the current snapshot under root, or None if there is none
+def read_meta(root):
+    path = os.path.join(root, CURRENT, 'meta.json')
+    try:
+        with open(path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('format') == FORMAT else None
+
+
+# Whether a snapshot is older than max_age seconds (None / 0 = never stale)
+def is_stale(meta, max_age):
+    return bool(max_age) and time.time() - meta['created'] > max_age
+
+
+# Version the `current` symlink points at, or None
+def current_version(root):
+    try:
+        return os.readlink(os.path.join(root, CURRENT))
+    except OSError:
+        return None
+
+
+# Load the current snapshot under root: (PatientStore, meta), or None if there is none
+# mmap=True maps the arrays read-only instead of copying them into this process
+def load_snapshot(root, mmap=False):
+    meta = read_meta(root)
+    if meta is None:
+        return None
+    directory = os.path.join(root, meta['version'])
+    mode = 'r' if mmap else None
+    columns = {}
+    for i, (name, kind) in enumerate(meta['fields'].items()):
+        data = np.load(os.path.join(directory, f"{i}.data.npy"), mmap_mode=mode)
+        null = np.load(os.path.join(directory, f"{i}.null.npy"), mmap_mode=mode)
+        vocab = None
+        if kind == 'str':
+            vocab = _load_vocab(os.path.join(directory, f"{i}.vocab"))
+        columns[name] = Column(name, kind, data, null, vocab)
+    ids = None
+    if os.path.exists(os.path.join(directory, 'ids.npy')):
+        ids = [doc_id or None for doc_id in np.load(os.path.join(directory, 'ids.npy')).tolist()]
+    return PatientStore(columns, meta['size'], ids), meta
+
+
+# Exclusive lock on a snapshot root (e.g. so only one of several workers reads Firestore and publishes)
+@contextmanager
+def locked(root):
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, '.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Non-blocking exclusive lock on root/name, held until the returned file is closed (or the process
+# exits); None if another process holds it
+def try_lock(root, name):
+    os.makedirs(root, exist_ok=True)
+    f = open(os.path.join(root, name), 'w')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+# Remove every snapshot under root except the current one and the `keep` most recent others
+def prune_snapshots(root, keep=1):
+    current = os.path.basename(os.path.realpath(os.path.join(root, CURRENT)))
+    versions = sorted(
+        (entry for entry in os.listdir(root)
+         if entry not in (current, CURRENT) and os.path.isdir(os.path.join(root, entry))
+         and '.tmp-' not in entry),
+        reverse=True,
+    )
+    for entry in versions[keep:]:
+        shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
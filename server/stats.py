@@ -0,0 +1,163 @@
+# stats.py
+from collections import namedtuple
+import numpy as np
+
+
+# Summary statistics for groups laid out back to back in one sorted array
+# values: sorted within each group, starts/counts: where each group begins and how long it is
+# Quantiles use linear interpolation (numpy's default), so results match np.median / np.quantile
+def _summaries(values, starts, counts):
+    ends = starts + counts - 1
+    sums = np.add.reduceat(values, starts)
+    means = sums / counts
+    dev = values - np.repeat(means, counts)
+    stds = np.sqrt(np.add.reduceat(dev * dev, starts) / counts)
+
+    def quantile(q):
+        pos = starts + q * (counts - 1)
+        lo = np.floor(pos).astype(np.intp)
+        hi = np.minimum(lo + 1, ends)
+        frac = pos - lo
+        return values[lo] + (values[hi] - values[lo]) * frac
+
+    return {
+        "Count":              counts,
+        "Mean":               means,
+        "Median":             quantile(0.5),
+        "Standard Deviation": stds,
+        "Minimum":            values[starts],
+        "First Quartile":     quantile(0.25),
+        "Third Quartile":     quantile(0.75),
+        "Maximum":            values[ends],
+    }
+
+
+# Assemble row i of the summaries into the JSON-serializable dict the API returns
+def _stats_dict(summaries, i):
+    stats = {"Count": int(summaries["Count"][i])}
+    for name, column in summaries.items():
+        if name != "Count":
+            stats[name] = round(float(column[i]), 2)
+    return stats
+
+
+# Statistics for a list (or 1-D array) of numbers: one conversion, one sort
+def calculate_stats(feature_list):
+    if feature_list is None or not len(feature_list):
+        return {'error': f'Stats failed for feature'}
+    values = np.sort(np.asarray(feature_list, dtype=np.float64), kind='stable')
+    summaries = _summaries(values, np.array([0]), np.array([len(values)]))
+    return _stats_dict(summaries, 0)
+
+
+# Statistics for every group in one batched call
+# values: 1-D numbers, labels: same-length group labels (any sortable dtype)
+# Returns (distinct labels in sorted order, list of stats dicts aligned with them)
+def calculate_grouped_stats(values, labels):
+    values = np.asarray(values, dtype=np.float64)
+    labels = np.asarray(labels)
+    if not len(values):
+        return labels[:0], []
+
+    # One sort orders by label, then by value inside each label
+    order = np.lexsort((values, labels))
+    values = values[order]
+    groups, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+
+    summaries = _summaries(values, starts, counts)
+    return groups, [_stats_dict(summaries, i) for i in range(len(groups))]
+
+
+# Mergeable summary of the values of each group: the distinct groups (sorted) with their count, mean and
+# sum of squared deviations from the mean (m2), plus the exact histogram of (group, value) -> count,
+# sorted by group then value. Partials of disjoint sets of patients merge into the partial of their
+# union (merge_partials); partial_stats turns one into the stats calculate_grouped_stats would give
+Partial = namedtuple('Partial', 'groups count mean m2 hist_groups hist_values hist_counts')
+
+
+def _partial_from_histogram(hist_groups, hist_values, hist_counts):
+    groups, inverse = np.unique(hist_groups, return_inverse=True)
+    count = np.bincount(inverse, weights=hist_counts, minlength=len(groups))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(inverse, weights=hist_counts * hist_values, minlength=len(groups)) / count
+    dev = hist_values - mean[inverse]
+    m2 = np.bincount(inverse, weights=hist_counts * dev * dev, minlength=len(groups))
+    return Partial(groups, count.astype(np.int64), mean, m2, hist_groups, hist_values, hist_counts)
+
+
+# Collapse runs of equal (group, value) pairs of arrays sorted by group then value into histogram entries
+def _collapse(labels, values, weights):
+    if not len(values):
+        return labels, values, weights.astype(np.int64)
+    first = np.concatenate(([True], (labels[1:] != labels[:-1]) | (values[1:] != values[:-1])))
+    starts = np.flatnonzero(first)
+    return labels[starts], values[starts], np.add.reduceat(weights, starts).astype(np.int64)
+
+
+# Partial of values grouped by labels (same-length 1-D arrays)
+def grouped_partial(values, labels):
+    values = np.asarray(values, dtype=np.float64)
+    labels = np.asarray(labels)
+    order = np.lexsort((values, labels))
+    return _partial_from_histogram(*_collapse(labels[order], values[order], np.ones(len(values), dtype=np.int64)))
+
+
+# Partial of the union of the patients behind each of the given partials
+def merge_partials(partials):
+    partials = list(partials)
+    groups = np.unique(np.concatenate([p.groups for p in partials]))
+    count = np.zeros(len(groups), dtype=np.int64)
+    mean = np.zeros(len(groups))
+    m2 = np.zeros(len(groups))
+    # Moments combine pairwise (Chan et al.), without revisiting any value
+    for p in partials:
+        at = np.searchsorted(groups, p.groups)
+        before = count[at]
+        total = before + p.count
+        delta = p.mean - mean[at]
+        mean[at] += delta * p.count / total
+        m2[at] += p.m2 + delta * delta * before * p.count / total
+        count[at] = total
+
+    labels = np.concatenate([p.hist_groups for p in partials])
+    values = np.concatenate([p.hist_values for p in partials])
+    weights = np.concatenate([p.hist_counts for p in partials])
+    order = np.lexsort((values, labels))
+    hist_groups, hist_values, hist_counts = _collapse(labels[order], values[order], weights[order])
+    return Partial(groups, count, mean, m2, hist_groups, hist_values, hist_counts)
+
+
+# Statistics of every group of a partial: (groups, list of stats dicts aligned with them). Count, mean
+# and standard deviation come from the merged moments; the quantiles, minimum and maximum are read off
+# the histogram by rank (interpolated as in _summaries), so nothing is expanded back to one entry per
+# patient. The results match calculate_grouped_stats over the same patients up to floating-point
+# rounding of the mean and standard deviation
+def partial_stats(partial):
+    if not len(partial.groups):
+        return partial.groups, []
+    counts = partial.count
+    # Ranks run across all groups, as the histogram is sorted by group, then value
+    cumulative = np.cumsum(partial.hist_counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ends = starts + counts - 1
+
+    def at(ranks):
+        return partial.hist_values[np.searchsorted(cumulative, ranks, side='right')]
+
+    def quantile(q):
+        pos = starts + q * (counts - 1)
+        lo = np.floor(pos).astype(np.int64)
+        low = at(lo)
+        return low + (at(np.minimum(lo + 1, ends)) - low) * (pos - lo)
+
+    summaries = {
+        "Count":              counts,
+        "Mean":               partial.mean,
+        "Median":             quantile(0.5),
+        "Standard Deviation": np.sqrt(partial.m2 / counts),
+        "Minimum":            at(starts),
+        "First Quartile":     quantile(0.25),
+        "Third Quartile":     quantile(0.75),
+        "Maximum":            at(ends),
+    }
+    return partial.groups, [_stats_dict(summaries, i) for i in range(len(partial.groups))]
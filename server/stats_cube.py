@@ -0,0 +1,209 @@
+# stats_cube.py
+from threading import Lock
+import numpy as np
+from parallel_stats import PARALLEL_MIN_ROWS, StatsTask, grouped_stats
+from sketch import DEFAULT_K, StreamSummary, merge_summaries
+from stats import calculate_grouped_stats
+
+# Features /relative-stats summarizes (value) and buckets them by (group)
+CUBE_VALUE_FEATURES = ['dm', 'oa', 'di', 'hl', 'severity']
+CUBE_GROUP_FEATURES = ['sex', 'severity', 'inheritance', 'n_nsfs', 'n_tm', 'tmem_1', 'tmem_2']
+
+
+# Per-(value feature, group feature) summary statistics for every group key, i.e. the answer of
+# /relative-stats?value=&group= for the whole cohort. Built when the data loads, or cell by cell
+# on first access when lazy=True; either way a computed cell is kept for the life of the store
+# cells: already computed cells that still hold for this store (see carry_over)
+# workers: processes a full build of a large store is spread over (see parallel_stats; 1 = in-process)
+class StatsCube:
+    def __init__(self, store, lazy=False, cells=None, workers=1):
+        self.store = store
+        self.lazy = lazy
+        self.workers = workers
+        self._cells = dict(cells or {})
+        self._lock = Lock()
+        if not lazy:
+            self.build()
+
+    # Whether a (value, group) pair is one the cube covers
+    @staticmethod
+    def covers(value_feature, group_feature):
+        return (value_feature in CUBE_VALUE_FEATURES and group_feature in CUBE_GROUP_FEATURES
+                and value_feature != group_feature)
+
+    # Materialize every cell; on a large store, all missing cells in one pass over a process pool
+    def build(self):
+        if self.workers != 1 and len(self.store) >= PARALLEL_MIN_ROWS:
+            missing = [(v, g) for v in CUBE_VALUE_FEATURES for g in CUBE_GROUP_FEATURES
+                       if self.covers(v, g) and (v, g) not in self._cells]
+            cells = grouped_stats(self.store, [StatsTask(v, g, ()) for v, g in missing], self.workers)
+            with self._lock:
+                for key, cell in zip(missing, cells):
+                    self._cells.setdefault(key, cell)
+        for value_feature in CUBE_VALUE_FEATURES:
+            for group_feature in CUBE_GROUP_FEATURES:
+                if self.covers(value_feature, group_feature):
+                    self.get(value_feature, group_feature)
+
+    # Computed cells that are unaffected by a change to the given fields (None = every field), to seed
+    # the cube of the next version of the store
+    def carry_over(self, changed_fields):
+        if changed_fields is None:
+            return {}
+        return {key: cell for key, cell in self._cells.items() if not changed_fields.intersection(key)}
+
+    def _compute(self, value_feature, group_feature):
+        values, keys, decode = self.store.grouped_arrays(value_feature, group_feature)
+        if not len(values):
+            return {}
+        groups, stats = calculate_grouped_stats(values, keys)
+        return dict(zip(decode(groups), stats))
+
+    # {group key: stats} for the pair ({} if no patient has both features), or None if the cube
+    # doesn't cover it
+    def get(self, value_feature, group_feature):
+        if not self.covers(value_feature, group_feature):
+            return None
+        key = (value_feature, group_feature)
+        cell = self._cells.get(key)
+        if cell is None:
+            with self._lock:
+                cell = self._cells.get(key)
+                if cell is None:
+                    cell = self._compute(value_feature, group_feature)
+                    self._cells[key] = cell
+        return cell
+
+
+# Approximate counterpart of the cube (STATS_APPROXIMATE, or exact=false): for each value feature, a
+# StreamSummary (see sketch.py) per cell of (group key, sex, severity) of every group feature, and of
+# (None, sex, severity) for no grouping at all. A sex / severity filter picks out a union of cells,
+# answered by merging their summaries without looking at a single patient, and patients added later
+# go into their cells in O(1) each (with_records). Built when the data loads, or pair by pair on
+# first access when lazy=True
+class SketchCube:
+    def __init__(self, store, lazy=False, k=DEFAULT_K, pairs=None):
+        self.store = store
+        self.lazy = lazy
+        self.k = k
+        # {(value feature, group feature or None): {(group key, sex, severity): StreamSummary}}
+        self._pairs = dict(pairs or {})
+        self._lock = Lock()
+        if not lazy:
+            self.build()
+
+    @staticmethod
+    def covers(value_feature, group_feature=None):
+        if group_feature is None:
+            return value_feature in CUBE_VALUE_FEATURES
+        return StatsCube.covers(value_feature, group_feature)
+
+    def build(self):
+        for value_feature in CUBE_VALUE_FEATURES:
+            for group_feature in [None] + CUBE_GROUP_FEATURES:
+                if self.covers(value_feature, group_feature):
+                    self._cells(value_feature, group_feature)
+
+    def _cells(self, value_feature, group_feature):
+        key = (value_feature, group_feature)
+        cells = self._pairs.get(key)
+        if cells is None:
+            with self._lock:
+                cells = self._pairs.get(key)
+                if cells is None:
+                    cells = self._compute(value_feature, group_feature)
+                    self._pairs[key] = cells
+        return cells
+
+    def _compute(self, value_feature, group_feature):
+        store = self.store
+        vcol = store.column(value_feature)
+        if vcol is None or vcol.kind == 'str':
+            return {}
+        keep = ~vcol.null
+        if group_feature is not None:
+            gcol = store.column(group_feature)
+            if gcol is None:
+                return {}
+            keep &= ~gcol.null
+        rows = np.flatnonzero(keep)
+
+        # One integer per (group key, sex, severity) combination, missing sex / severity as a value of
+        # their own; labels: python value of each dimension's codes
+        combined = np.zeros(len(rows), dtype=np.int64)
+        labels = []
+        for field in (group_feature, 'sex', 'severity'):
+            col = store.column(field) if field is not None else None
+            if col is None:
+                labels.append([None])
+                continue
+            uniq, inverse = np.unique(col.data[rows], return_inverse=True)
+            inverse = np.where(col.null[rows], len(uniq), inverse)
+            labels.append(col.decode(uniq) + [None])
+            combined = combined * len(labels[-1]) + inverse
+
+        order = np.argsort(combined, kind='stable')
+        values = vcol.data[rows[order]]
+        keys, starts = np.unique(combined[order], return_index=True)
+        bounds = starts.tolist() + [len(rows)]
+        cells = {}
+        for i, code in enumerate(keys.tolist()):
+            name = []
+            for dimension in reversed(labels):
+                code, index = divmod(code, len(dimension))
+                name.append(dimension[index])
+            summary = StreamSummary(self.k)
+            summary.update_many(values[bounds[i]:bounds[i + 1]])
+            cells[tuple(reversed(name))] = summary
+        return cells
+
+    # {pair: cells} of the built pairs that a change to changed_fields (a set; None = rows were added or
+    # removed) leaves as they are, to seed the next version's cube
+    def carry_over(self, changed_fields):
+        if changed_fields is None:
+            return {}
+        with self._lock:
+            return {key: cells for key, cells in self._pairs.items()
+                    if not changed_fields.intersection((*key, 'sex', 'severity'))}
+
+    # New cube for store, which is this cube's store with the given patient records (dicts) appended;
+    # this cube is left as it is. Only the cells the records fall into are copied (once each, then
+    # updated); every other cell is shared with this cube
+    def with_records(self, store, records):
+        with self._lock:
+            pairs = dict(self._pairs)
+        own_pairs, own_cells = set(), set()
+        for record in records:
+            for key in list(pairs):
+                value_feature, group_feature = key
+                value = record.get(value_feature)
+                if value is None or isinstance(value, str):
+                    continue
+                group = record.get(group_feature) if group_feature is not None else None
+                if group_feature is not None and group is None:
+                    continue
+                cell = (group, record.get('sex'), record.get('severity'))
+                if key not in own_pairs:
+                    pairs[key] = dict(pairs[key])
+                    own_pairs.add(key)
+                cells = pairs[key]
+                if (key, cell) not in own_cells:
+                    summary = cells.get(cell)
+                    cells[cell] = summary.copy() if summary is not None else StreamSummary(self.k)
+                    own_cells.add((key, cell))
+                cells[cell].update(value)
+        return SketchCube(store, self.lazy, self.k, pairs)
+
+    # {group key: StreamSummary} of value_feature among the patients whose sex / severity (stored
+    # values, None = any) match, the key None when group_feature is None; None if the cube doesn't
+    # cover the pair
+    def summaries(self, value_feature, group_feature=None, sex=None, severity=None):
+        if not self.covers(value_feature, group_feature):
+            return None
+        groups = {}
+        for (group, cell_sex, cell_severity), summary in self._cells(value_feature, group_feature).items():
+            if (sex is None or cell_sex == sex) and (severity is None or cell_severity == severity):
+                groups.setdefault(group, []).append(summary)
+        # Cells added by with_records come last; list the groups in order, as the exact stats do
+        # (group keys are never None when grouping)
+        return {group: merge_summaries(groups[group], self.k) for group in sorted(groups, key=lambda g: (g is None, g))}
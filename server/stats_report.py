@@ -0,0 +1,88 @@
+# stats_report.py
+# Bulk stats report without running the server: every /relative-stats cell (value x group feature)
+# and the stats of each feature for every sex x severity subgroup, computed over a process pool (see
+# parallel_stats.py) and written as one JSON document.
+#
+#   python stats_report.py --snapshot snapshot -o report.json
+#   python stats_report.py --csv ../scripts/data.csv --workers 1
+#   python stats_report.py --synthetic 1000000 --workers 8 -o report.json
+import argparse
+import json
+import sys
+import time
+from parallel_stats import StatsTask, grouped_stats, subgroup_stats
+from patient_store import PatientStore
+from schema import PATIENT_TYPES, read_csv
+from snapshot import load_snapshot
+from stats_cube import CUBE_GROUP_FEATURES, CUBE_VALUE_FEATURES
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Write summary statistics of every subgroup of the cohort as JSON.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--snapshot', metavar='DIR', help='patient snapshot root (see snapshot.py)')
+    source.add_argument('--csv', metavar='PATH', help="patient CSV in the importer's format")
+    source.add_argument('--synthetic', metavar='N', type=int, help='synthetic cohort of N patients (see synthetic_cohort.py)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic cohort')
+    parser.add_argument('-o', '--output', default='-', help='output file (default: stdout)')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes (default: 0, one per CPU)')
+    parser.add_argument('--features', nargs='+', default=CUBE_VALUE_FEATURES, help='features to summarize')
+    return parser.parse_args(argv)
+
+
+def load(args):
+    if args.snapshot:
+        loaded = load_snapshot(args.snapshot, mmap=True)
+        if loaded is None:
+            raise SystemExit(f"No patient snapshot in {args.snapshot!r}")
+        return loaded[0]
+    if args.csv:
+        records = []
+        for chunk, errors in read_csv(args.csv):
+            records.extend(chunk)
+            for error in errors:
+                print(f"Skipping row {error.row}: {error.column}={error.value!r} ({error.message})", file=sys.stderr)
+        return PatientStore.from_records(records, PATIENT_TYPES)
+    from synthetic_cohort import generate_store
+    return generate_store(args.synthetic, args.seed)
+
+
+# {value feature: {group feature: {group key: stats}}} for every cube cell of the features
+def cube_report(store, features, workers):
+    pairs = [(v, g) for v in features for g in CUBE_GROUP_FEATURES if v != g]
+    cells = grouped_stats(store, [StatsTask(v, g, ()) for v, g in pairs], workers)
+    report = {}
+    for (value_feature, group_feature), cell in zip(pairs, cells):
+        report.setdefault(value_feature, {})[group_feature] = cell
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.monotonic()
+    store = load(args)
+    print(f"Loaded {len(store)} patients in {time.monotonic() - started:.1f}s", file=sys.stderr)
+
+    started = time.monotonic()
+    report = {
+        'patients':  len(store),
+        'cube':      cube_report(store, args.features, args.workers),
+        'subgroups': [
+            {'feature': feature, 'sex': sex, 'severity': severity, 'stats': stats}
+            for (feature, sex, severity), stats in subgroup_stats(store, args.features, args.workers).items()
+        ],
+    }
+    print(f"Summarized {len(report['subgroups'])} subgroups and "
+          f"{sum(map(len, report['cube'].values()))} cube cells in {time.monotonic() - started:.1f}s", file=sys.stderr)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        json.dump(report, out, indent=2, default=str)
+        out.write('\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
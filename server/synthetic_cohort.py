@@ -0,0 +1,152 @@
+# synthetic_cohort.py
+# Made-up patient cohorts of any size with the importer's columns (schema.PATIENT_SCHEMA) and roughly
+# the registry's value distributions: a Zipf-weighted pool of HGVS alleles, ~20% single-allele
+# patients (no allele_2, n_nsfs, n_tm or severity), onset ages only where has_* is set. The store is
+# built straight from numpy arrays, so a million rows never exist as python dicts.
+# Same seed and size, same cohort
+import numpy as np
+from patient_store import Column, PatientStore
+from schema import PATIENT_SCHEMA
+from transmembrane import get_domain_table
+
+# WFS1 protein length
+PROTEIN_LENGTH = 890
+
+AMINO_ACIDS = ['Ala', 'Arg', 'Asn', 'Asp', 'Cys', 'Gln', 'Glu', 'Gly', 'His', 'Ile',
+               'Leu', 'Lys', 'Met', 'Phe', 'Pro', 'Ser', 'Thr', 'Trp', 'Tyr', 'Val']
+BASES = ['A', 'C', 'G', 'T']
+
+# (mutation type, share of the allele pool)
+MUTATION_TYPES = [
+    ('missense',             0.50),
+    ('frameshift, nonsense', 0.18),
+    ('ins/del',              0.16),
+    ('nonsense',             0.14),
+    ('duplication',          0.02),
+]
+
+INHERITANCE = [('Recessive', 0.80), ('Dominant', 0.16), ('Carrier', 0.04)]
+
+# Manifestation: (share of patients who have it, median onset age)
+MANIFESTATIONS = {
+    'dm': (0.84, 6.0),
+    'oa': (0.90, 12.0),
+    'di': (0.35, 12.0),
+    'hl': (0.55, 8.0),
+}
+
+
+# Pool of distinct alleles: arrays of allele text, c. and p. notation, mutation type and protein position
+def allele_pool(size, rng):
+    kinds = rng.choice(len(MUTATION_TYPES), size=size, p=[share for _, share in MUTATION_TYPES])
+    positions = rng.integers(1, PROTEIN_LENGTH + 1, size=size)
+    seen = set()
+    alleles, c_names, p_names, types, kept = [], [], [], [], []
+    for kind, pos in zip(kinds.tolist(), positions.tolist()):
+        orig, new = rng.choice(len(AMINO_ACIDS), size=2, replace=False).tolist()
+        base = 3 * pos - 2 + int(rng.integers(0, 3))
+        ref, alt = rng.choice(len(BASES), size=2, replace=False).tolist()
+        mutation = MUTATION_TYPES[kind][0]
+        if mutation == 'missense':
+            c_name = f"c.{base}{BASES[ref]}>{BASES[alt]}"
+            p_name = f"p.{AMINO_ACIDS[orig]}{pos}{AMINO_ACIDS[new]}"
+        elif mutation == 'nonsense':
+            c_name = f"c.{base}{BASES[ref]}>{BASES[alt]}"
+            p_name = f"p.{AMINO_ACIDS[orig]}{pos}*"
+        elif mutation == 'frameshift, nonsense':
+            c_name = f"c.{base}del{BASES[ref]}"
+            p_name = f"p.{AMINO_ACIDS[orig]}{pos}{AMINO_ACIDS[new]}fs*{int(rng.integers(2, 60))}"
+        elif mutation == 'ins/del':
+            codon = ''.join(BASES[b] for b in rng.integers(0, 4, size=3).tolist())
+            c_name = f"c.{3 * pos - 2}_{3 * pos}del{codon}"
+            p_name = f"p.{AMINO_ACIDS[orig]}{pos}del"
+        else:
+            end = min(pos + int(rng.integers(1, 8)), PROTEIN_LENGTH)
+            c_name = f"c.{3 * pos - 2}_{3 * end}dup"
+            p_name = f"p.{AMINO_ACIDS[orig]}{pos}_{AMINO_ACIDS[new]}{end}dup"
+        allele = f"{c_name} ({p_name})"
+        if allele in seen:
+            continue
+        seen.add(allele)
+        alleles.append(allele)
+        c_names.append(c_name)
+        p_names.append(p_name)
+        types.append(mutation)
+        kept.append(pos)
+    return (np.array(alleles, dtype=object), np.array(c_names, dtype=object),
+            np.array(p_names, dtype=object), np.array(types, dtype=object), np.array(kept, dtype=np.int64))
+
+
+# Zipf-like weights: a few founder alleles are common, most are rare
+def _allele_weights(size, exponent=1.1):
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+# 'str' column of pool[picks], '' where blank
+def _str_column(name, pool, picks, blank=None):
+    vocab, inverse = np.unique(np.append(pool, ''), return_inverse=True)
+    codes = inverse[:-1][picks].astype(np.int32)
+    if blank is not None:
+        codes[blank] = inverse[-1]
+    return Column(name, 'str', codes, np.zeros(len(picks), dtype=np.bool_), vocab=vocab.tolist())
+
+
+def _column(name, data, null=None):
+    kind = 'bool' if data.dtype == np.bool_ else 'float' if data.dtype.kind == 'f' else 'int'
+    if null is None:
+        null = np.zeros(len(data), dtype=np.bool_)
+    fill = False if kind == 'bool' else 0
+    return Column(name, kind, np.where(null, fill, data), null)
+
+
+# PatientStore of n synthetic patients (ids 1..n, which are also their doc ids) carrying pool_size
+# distinct alleles (default: grows with the square root of n, as the registry's does)
+def generate_store(n, seed=0, pool_size=None):
+    rng = np.random.default_rng(seed)
+    if pool_size is None:
+        pool_size = max(50, int(10 * np.sqrt(n)))
+    alleles, c_names, p_names, types, positions = allele_pool(pool_size, rng)
+    weights = _allele_weights(len(alleles))
+    tmem = get_domain_table().contains_many(positions).astype(np.int64)
+
+    ids = np.arange(1, n + 1, dtype=np.int64)
+    age = np.clip(rng.gamma(4.0, 7.0, size=n), 1, 80).astype(np.int64)
+    inheritance = rng.choice(len(INHERITANCE), size=n, p=[share for _, share in INHERITANCE])
+    a1 = rng.choice(len(alleles), size=n, p=weights)
+    a2 = rng.choice(len(alleles), size=n, p=weights)
+    # Patients with one reported allele have no second-allele or genotype-derived fields
+    single = rng.random(n) < 0.2
+
+    columns = {
+        'id':          _column('id', ids),
+        'sex':         _column('sex', (rng.random(n) < 0.58).astype(np.int64)),
+        'age':         _column('age', age),
+        'inheritance': _str_column('inheritance', np.array([name for name, _ in INHERITANCE], dtype=object),
+                                   inheritance),
+        'hu':          _column('hu', (rng.random(n) < 0.01).astype(np.int64)),
+    }
+    for slot, picks, blank in (('1', a1, None), ('2', a2, single)):
+        columns[f'allele_{slot}'] = _str_column(f'allele_{slot}', alleles, picks, blank)
+        columns[f'allele_{slot}_c'] = _str_column(f'allele_{slot}_c', c_names, picks, blank)
+        columns[f'allele_{slot}_p'] = _str_column(f'allele_{slot}_p', p_names, picks, blank)
+        columns[f'mutation_{slot}'] = _str_column(f'mutation_{slot}', types, picks, blank)
+        columns[f'position_{slot}'] = _column(f'position_{slot}', positions[picks], blank)
+        columns[f'tmem_{slot}'] = _column(f'tmem_{slot}', tmem[picks], blank)
+
+    columns['n_nsfs'] = _column('n_nsfs', rng.integers(0, 3, size=n), single)
+    columns['n_tm'] = _column('n_tm', rng.integers(0, 3, size=n), single)
+    for name, (share, median) in MANIFESTATIONS.items():
+        has = rng.random(n) < share
+        onset = np.minimum(np.round(rng.lognormal(np.log(median), 0.6, size=n), 2), age)
+        columns[f'has_{name}'] = _column(f'has_{name}', has)
+        columns[name] = _column(name, onset, ~has)
+    columns['severity'] = _column('severity', rng.integers(1, 7, size=n).astype(np.float64), single)
+
+    # In schema order, like a store built from imported records
+    return PatientStore({spec.name: columns[spec.name] for spec in PATIENT_SCHEMA}, n)
+
+
+# The same cohort as a list of patient dicts, as Firestore / the CSV importer would hand them over
+def generate_records(n, seed=0, pool_size=None):
+    return generate_store(n, seed, pool_size).to_records()
@@ -0,0 +1,25 @@
+# Shared fixtures: the app over a small synthetic cohort (see synthetic_cohort.py), without Firestore
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FIREBASE_OFFLINE', '1')
+
+
+@pytest.fixture(scope='session')
+def app():
+    from firebase_client import load_store
+    from run import create_app
+    from synthetic_cohort import generate_store
+    load_store(generate_store(500, seed=0))
+    return create_app(load_data=False)
+
+
+@pytest.fixture
+def client(app):
+    from cache import response_cache, stats_cache
+    response_cache.clear()
+    stats_cache.clear()
+    return app.test_client()
@@ -0,0 +1,44 @@
+# /alleles/suggest ranks the allele_1 values (or an allele_1's partners) that start with a prefix
+from collections import Counter
+
+import pytest
+
+from firebase_client import get_store
+
+
+def _expected(prefix, limit, allele_1=None):
+    records = get_store().to_records()
+    if allele_1 is None:
+        counts = Counter(r['allele_1'] for r in records if r.get('allele_1'))
+    else:
+        counts = Counter(r['allele_2'] for r in records if r.get('allele_1') == allele_1 and r.get('allele_2'))
+    matches = [(allele, n) for allele, n in counts.items() if str(allele).casefold().startswith(prefix.casefold())]
+    matches.sort(key=lambda pair: (-pair[1], str(pair[0]).casefold()))
+    return [{'allele': allele, 'count': n} for allele, n in matches[:limit]]
+
+
+def _top_allele():
+    return Counter(r['allele_1'] for r in get_store().to_records() if r.get('allele_1')).most_common(1)[0][0]
+
+
+@pytest.mark.parametrize('limit', [1, 5, 50])
+def test_prefix_and_limit(client, limit):
+    top = _top_allele()
+    for prefix in ('', top[:2], top[:4].upper(), top, 'no such allele'):
+        response = client.get('/api/alleles/suggest', query_string={'prefix': prefix, 'limit': limit})
+        assert response.status_code == 200
+        assert response.get_json() == _expected(prefix, limit)
+
+
+def test_partners_of_allele_1(client):
+    top = _top_allele()
+    suggestions = client.get('/api/alleles/suggest', query_string={'allele1': top, 'limit': 50}).get_json()
+    assert suggestions and suggestions == _expected('', 50, top)
+
+
+def test_limit_is_validated_and_capped(app, client):
+    for limit in ('0', '-3', 'ten'):
+        assert client.get('/api/alleles/suggest', query_string={'limit': limit}).status_code == 400
+    cap = app.config['ALLELE_SUGGEST_MAX_LIMIT']
+    suggestions = client.get('/api/alleles/suggest', query_string={'limit': cap + 100}).get_json()
+    assert len(suggestions) == min(cap, len(_expected('', cap + 100)))
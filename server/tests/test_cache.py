@@ -0,0 +1,20 @@
+# The response caches follow the dataset version forward only
+from cache import LRUCache
+
+
+def test_newer_version_drops_entries():
+    cache = LRUCache()
+    cache.put('a', 1, 1, version=1)
+    assert cache.get('a', 2) is None
+    assert len(cache) == 0 and cache.version == 2
+
+
+def test_older_version_neither_clears_nor_stores():
+    cache = LRUCache()
+    cache.put('a', 1, 1, version=2)
+    # A request still pinned to version 1 during a refresh
+    assert cache.get('a', 1) is None
+    cache.put('b', 'stale', 1, version=1)
+    assert cache.get('a', 2) == 1
+    assert cache.get('b', 2) is None
+    assert cache.version == 2
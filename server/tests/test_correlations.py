@@ -0,0 +1,65 @@
+# /correlations gives, for every pair of features, what numpy gives over the patients that have both
+from itertools import permutations
+
+import numpy as np
+import pytest
+
+from correlation import CORRELATION_FEATURES
+from filter_index import parse_filters
+from firebase_client import get_store
+
+
+def _pair_values(x_feature, y_feature, sex, severity):
+    sex, severity = parse_filters(sex, severity)
+    pairs = [(r[x_feature], r[y_feature]) for r in get_store().to_records()
+             if r.get(x_feature) is not None and r.get(y_feature) is not None
+             and (sex is None or r.get('sex') == sex)
+             and (severity is None or r.get('severity') == severity)]
+    return np.array(pairs, dtype=np.float64).reshape(-1, 2).T
+
+
+# Ranks with ties averaged, the plain way
+def _ranks(values):
+    return np.array([(values < v).sum() + ((values == v).sum() + 1) / 2 for v in values])
+
+
+@pytest.mark.parametrize('sex, severity', [(None, None), ('Female', None), (None, '3')])
+def test_matrix_matches_numpy(client, sex, severity):
+    response = client.get('/api/correlations', query_string={'sex': sex, 'severity': severity})
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['features'] == CORRELATION_FEATURES
+
+    checked = 0
+    for x_feature, y_feature in permutations(CORRELATION_FEATURES, 2):
+        x, y = _pair_values(x_feature, y_feature, sex, severity)
+        assert result['sample_size'][x_feature][y_feature] == len(x)
+        if len(x) < 3 or x.std() == 0 or y.std() == 0:
+            continue
+        checked += 1
+        assert result['pearson'][x_feature][y_feature] == pytest.approx(np.corrcoef(x, y)[0, 1], abs=0.0005)
+        assert result['spearman'][x_feature][y_feature] == pytest.approx(
+            np.corrcoef(_ranks(x), _ranks(y))[0, 1], abs=0.0005)
+        slope, intercept = np.polyfit(x, y, 1)
+        line = result['regression'][x_feature][y_feature]
+        assert line['slope'] == pytest.approx(slope, abs=0.0005)
+        assert line['intercept'] == pytest.approx(intercept, abs=0.0005)
+    assert checked
+
+
+@pytest.mark.parametrize('x_feature, y_feature', [('dm', 'hl'), ('oa', 'di'), ('hl', 'severity')])
+def test_pair_stats_match_numpy(client, x_feature, y_feature):
+    stats = client.get(f'/api/stats/{x_feature}', query_string={'manifestation2': y_feature}).get_json()
+    x, y = _pair_values(x_feature, y_feature, None, None)
+    slope, intercept = np.polyfit(x, y, 1)
+    # Rounded to 3 places (2 for means and standard deviations)
+    assert stats == {
+        'Correlation Coefficient': pytest.approx(np.corrcoef(x, y)[0, 1], abs=0.00051),
+        'Regression Slope': pytest.approx(slope, abs=0.00051),
+        'Regression Intercept': pytest.approx(intercept, abs=0.00051),
+        'Sample Size': len(x),
+        f'{x_feature} Mean': pytest.approx(x.mean(), abs=0.0051),
+        f'{y_feature} Mean': pytest.approx(y.mean(), abs=0.0051),
+        f'{x_feature} Std Dev': pytest.approx(x.std(), abs=0.0051),
+        f'{y_feature} Std Dev': pytest.approx(y.std(), abs=0.0051),
+    }
@@ -0,0 +1,41 @@
+# Query-string filters that can't be parsed are the client's error, on every route that takes them
+import pytest
+
+
+@pytest.mark.parametrize('exact', ['true', 'false'])
+def test_relative_stats_bad_severity(client, exact):
+    response = client.get(f'/api/relative-stats?value=dm&group=sex&severity=abc&exact={exact}')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid severity value'}
+
+
+def test_correlations_bad_severity(client):
+    response = client.get('/api/correlations?severity=abc')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid severity value'}
+
+
+def test_correlations_bad_sex(client):
+    response = client.get('/api/correlations?sex=Other')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid sex value'}
+
+
+def test_correlations_severity_filter(client):
+    response = client.get('/api/correlations?sex=Female&severity=3')
+    assert response.status_code == 200
+    assert response.get_json()['features']
+
+
+@pytest.mark.parametrize('manifestation', ['dm', 'all'])
+@pytest.mark.parametrize('exact', ['true', 'false'])
+def test_stats_bad_severity(client, manifestation, exact):
+    response = client.get(f'/api/stats/{manifestation}?severity=abc&exact={exact}')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid severity value'}
+
+
+def test_approximate_stats_bad_severity(client):
+    from routes.api import _compute_stats
+    with client.application.test_request_context():
+        assert _compute_stats('dm', None, 'abc', None, exact=False) == ({'error': 'Invalid severity value'}, 400)
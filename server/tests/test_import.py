@@ -0,0 +1,86 @@
+# scripts/import_to_firestore.py: batched import into an in-memory client, and resuming from the
+# checkpoint after a batch fails for good
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'scripts')
+sys.path.insert(0, SCRIPTS)
+from import_to_firestore import Checkpoint, MemoryClient, _MemoryBatch, import_csv, read_batches  # noqa: E402
+
+
+# Fails every commit that writes one of the given doc ids
+class FailingClient(MemoryClient):
+    def __init__(self, failing_ids):
+        super().__init__()
+        self.failing_ids = set(failing_ids)
+
+    def batch(self):
+        client = self
+
+        class Batch(_MemoryBatch):
+            def commit(self):
+                if any(doc_id in client.failing_ids for (_, doc_id), _ in self.writes):
+                    raise RuntimeError('commit failed')
+                super().commit()
+
+        return Batch()
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'data.csv'
+    shutil.copy(os.path.join(SCRIPTS, 'data.csv'), path)
+    return str(path)
+
+
+def _expected(csv_path):
+    return {doc_id: row for _, docs in read_batches(csv_path, 50) for doc_id, row in docs}
+
+
+def test_import_writes_every_row(csv_path, tmp_path):
+    db = MemoryClient()
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    expected = _expected(csv_path)
+    assert import_csv(db, csv_path, batch_size=50, workers=3, checkpoint_path=checkpoint) == len(expected)
+    assert db.collections['patients'] == expected
+    assert not os.path.exists(checkpoint)
+
+
+def test_resume_after_failed_batch(csv_path, tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    expected = _expected(csv_path)
+    batches = dict(read_batches(csv_path, 50))
+    failing = batches[2][0][0]
+
+    first = FailingClient([failing])
+    with pytest.raises(RuntimeError):
+        import_csv(first, csv_path, batch_size=50, workers=1, checkpoint_path=checkpoint, retries=1, backoff=0)
+    with open(checkpoint) as f:
+        done = set(json.load(f)['done'])
+    assert 2 not in done and {0, 1} <= done
+    assert failing not in first.collections['patients']
+
+    # Only the batches not checkpointed are written again
+    second = MemoryClient()
+    remaining = sum(len(docs) for number, docs in batches.items() if number not in done)
+    assert import_csv(second, csv_path, batch_size=50, workers=3, checkpoint_path=checkpoint) == remaining
+    assert {**first.collections['patients'], **second.collections['patients']} == expected
+    assert set(second.collections['patients']).isdisjoint(
+        doc_id for number in done for doc_id, _ in batches[number])
+    assert not os.path.exists(checkpoint)
+
+
+def test_checkpoint_is_dropped_for_a_changed_file(csv_path, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = Checkpoint(path, csv_path, 50)
+    checkpoint.mark(0)
+    assert Checkpoint(path, csv_path, 50).done == {0}
+    assert Checkpoint(path, csv_path, 100).done == set()
+    # Rewritten in place, same size
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert Checkpoint(path, csv_path, 50).done == set()
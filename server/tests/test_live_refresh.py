@@ -0,0 +1,113 @@
+# Diffing a re-read of the collection against the loaded data, and applying the change without rebuilding
+# what it doesn't touch
+import threading
+import time
+from collections import namedtuple
+
+import firebase_client
+from live_refresh import PatientSync, diff_documents
+from patient_store import PatientStore
+from schema import PATIENT_TYPES
+from snapshot import current_version
+from synthetic_cohort import generate_store
+
+
+class Doc(namedtuple('Doc', 'id update_time data')):
+    exists = True
+
+    def to_dict(self):
+        return dict(self.data)
+
+
+def _docs(store, time=1):
+    return [Doc(doc_id, time, record) for doc_id, record in zip(store.ids(), store.to_records())]
+
+
+def test_diff_by_update_time_only_decodes_rewritten_documents():
+    docs = _docs(generate_store(50))
+    known = {doc.id: doc.update_time for doc in docs}
+    edited = dict(docs[3].data, dm=99.0)
+    docs[3] = Doc(docs[3].id, 2, edited)
+    docs = docs[1:] + [Doc('new', 1, edited)]
+
+    def records():
+        raise AssertionError('update times are known; records should not be materialized')
+
+    upserts, deletes, times = diff_documents(docs, known, records)
+    assert upserts == {docs[2].id: edited, 'new': edited}
+    assert deletes == {'1'}
+    assert times[docs[2].id] == 2 and '1' not in times
+
+
+def test_diff_without_update_times_compares_records():
+    store = generate_store(50)
+    docs = _docs(store)
+    upserts, deletes, times = diff_documents(docs, None, lambda: dict(zip(store.ids(), store.to_records())))
+    assert (upserts, deletes) == ({}, set())
+    assert set(times) == set(store.ids())
+
+
+def test_update_shares_untouched_columns():
+    store = PatientStore.from_records(generate_store(50).to_records(), PATIENT_TYPES, [str(i) for i in range(50)])
+    record = dict(store.to_records()[7], dm=99.0)
+    updated, changed = store.apply_changes({'7': record}, (), PATIENT_TYPES)
+    assert changed == {'dm'}
+    assert updated.column('sex') is store.column('sex')
+    assert updated.column('dm') is not store.column('dm')
+    assert updated.to_records()[7]['dm'] == 99.0
+    assert store.to_records()[7]['dm'] != 99.0
+
+
+def test_shared_changes_are_published_once_per_interval(tmp_path, monkeypatch):
+    store = PatientStore.from_records(generate_store(50).to_records(), PATIENT_TYPES, [str(i) for i in range(50)])
+    monkeypatch.setattr(firebase_client, '_dataset', firebase_client._new_dataset(store, 1))
+    monkeypatch.setattr(firebase_client, '_update_times', None)
+    monkeypatch.setattr(firebase_client, '_shared', True)
+    monkeypatch.setattr(firebase_client, '_snapshot_dir', str(tmp_path))
+    monkeypatch.setattr(firebase_client, '_publish_interval', 0.2)
+    monkeypatch.setattr(firebase_client, '_last_publish', time.monotonic())
+    monkeypatch.setattr(firebase_client, '_snapshot_version', None)
+    saved = []
+    save = firebase_client.save_snapshot
+    monkeypatch.setattr(firebase_client, 'save_snapshot', lambda store, *args, **kwargs: saved.append(store) or save(store, *args, **kwargs))
+
+    for dm in (97.0, 98.0, 99.0):
+        firebase_client.apply_patient_changes({'7': dict(store.to_records()[7], dm=dm)})
+    firebase_client._publish_timer.join()
+    assert len(saved) == 1
+    assert saved[0].to_records()[7]['dm'] == 99.0
+    assert firebase_client._snapshot_version == current_version(str(tmp_path))
+
+
+class _Collection:
+    def __init__(self, polled):
+        self.polled = polled
+
+    def get(self):
+        self.polled.set()
+        return []
+
+
+class _Db:
+    def __init__(self):
+        self.polled = threading.Event()
+
+    def collection(self, name):
+        return _Collection(self.polled)
+
+
+def test_follower_keeps_trying_for_the_lock():
+    db, attempts = _Db(), []
+
+    def acquire():
+        attempts.append(None)
+        return len(attempts) >= 3
+
+    sync = PatientSync(db, 'patients', None, lambda docs: None, poll_interval=0.01, acquire=acquire)
+    sync.start('poll')
+    try:
+        assert sync.mode is None
+        assert db.polled.wait(5)
+        assert sync.mode == 'poll' and len(attempts) == 3
+    finally:
+        sync.stop()
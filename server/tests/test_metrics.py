@@ -0,0 +1,68 @@
+# /_metrics is valid Prometheus text exposition and counts what the API did
+import re
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+# {metric family: type}, [(sample name, {label: value}, value)], checking the format line by line
+def _parse(text):
+    assert text.endswith('\n')
+    types, samples, family = {}, [], None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            family = line.split()[2]
+        elif line.startswith('# TYPE '):
+            _, _, name, kind = line.split()
+            assert name == family and name not in types
+            types[name] = kind
+        else:
+            m = SAMPLE.match(line)
+            assert m, line
+            name, labels, value = m.group(1), dict(LABEL.findall(m.group(2) or '')), float(m.group(3))
+            assert re.sub(r'_(bucket|count|sum)$', '', name) == family or name == family, line
+            samples.append((name, labels, value))
+    return types, samples
+
+
+def _value(samples, name, **labels):
+    return sum(value for sample, found, value in samples if sample == name and labels.items() <= found.items())
+
+
+def test_exposition_format_and_counts(client):
+    _, before = _parse(client.get('/api/_metrics').get_data(as_text=True))
+    for _ in range(3):
+        assert client.get('/api/stats/dm').status_code == 200
+    client.get('/api/stats/no_such_feature')
+
+    response = client.get('/api/_metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain' and response.mimetype_params.get('version') == '0.0.4'
+    types, samples = _parse(response.get_data(as_text=True))
+    assert types['api_requests_total'] == 'counter'
+    assert types['api_request_duration_seconds'] == 'histogram'
+    assert types['cache_hit_ratio'] == 'gauge'
+
+    def delta(name, **labels):
+        return _value(samples, name, **labels) - _value(before, name, **labels)
+
+    assert delta('api_requests_total', endpoint='api.get_stats', status='200') == 3
+    assert delta('api_requests_total', endpoint='api.get_stats', status='404') == 1
+    assert delta('api_request_duration_seconds_count', endpoint='api.get_stats') == 4
+    assert delta('api_phase_duration_seconds_count', endpoint='api.get_stats', phase='serialize') >= 3
+    assert delta('cache_hits_total', cache='stats') + delta('cache_hits_total', cache='response') >= 2
+
+
+def test_histogram_buckets_are_cumulative(client):
+    client.get('/api/stats/dm')
+    _, samples = _parse(client.get('/api/_metrics').get_data(as_text=True))
+    series = {}
+    for name, labels, value in samples:
+        if name == 'api_request_duration_seconds_bucket':
+            key = (labels['endpoint'], labels['method'])
+            series.setdefault(key, []).append((labels['le'], value))
+    assert series
+    for key, buckets in series.items():
+        counts = [value for _, value in buckets]
+        assert counts == sorted(counts) and buckets[-1][0] == '+Inf'
+        assert counts[-1] == _value(samples, 'api_request_duration_seconds_count', endpoint=key[0], method=key[1])
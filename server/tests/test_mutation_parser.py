@@ -0,0 +1,65 @@
+# The one-alternation parser picks the same notation as trying each pattern in turn, and memoizes
+import re
+
+import pytest
+
+import mutation_parser
+from mutation_parser import CODING_PATTERNS, PROTEIN_PATTERNS, parse_mutation
+
+PROTEIN = ['p.Glu753*', 'p.Glu753X', 'p.glu753x', 'p.Arg75del', 'p.Lys100_Gly102del', 'p.Ala5_Leu6dup',
+           'p.Ala5_Leu6insGly', 'p.Arg75Trp', 'p.Arg75Glyfs*3', 'p.Ter10Arg', 'p.R75W', 'P.R75W', 'p.W1000*',
+           'p.R75fs*12', 'Arg75Trp', 'p.Foo12Bar', 'p.Arg75', 'garbage']
+CODING = ['c.235C>T', 'c.1000g>a', 'c.100_102delinsAT', 'c.10_11insA', 'c.10dup', 'c.10_12dupAAA', 'c.10delA',
+          'c.10_12delAAT', 'c.12', 'c.10_12del', 'c.235C>T>G']
+
+
+# How the parsers matched before: each pattern compiled on its own and tried in order
+def _first_match(patterns, mutation):
+    for kind, pattern in patterns:
+        m = re.match(f'^{pattern}$', mutation, re.IGNORECASE)
+        if m:
+            return kind, m.groups()
+    return None, None
+
+
+@pytest.mark.parametrize('patterns, dispatch, slots, mutation', [
+    *[(PROTEIN_PATTERNS, mutation_parser._PROTEIN_DISPATCH, mutation_parser._PROTEIN_SLOTS, m) for m in PROTEIN],
+    *[(CODING_PATTERNS, mutation_parser._CODING_DISPATCH, mutation_parser._CODING_SLOTS, m) for m in CODING],
+])
+def test_dispatch_matches_patterns_in_order(patterns, dispatch, slots, mutation):
+    assert mutation_parser._dispatch(dispatch, slots, mutation) == _first_match(patterns, mutation)
+
+
+@pytest.mark.parametrize('mutation, expected', [
+    ('p.Glu753*', {'notation_type': 'protein', 'aa_format': 'three_letter', 'orig_aa': 'E', 'new_aa': '*',
+                   'start': 753, 'end': 753, 'position': 753, 'mutation_type': 'nonsense',
+                   'is_transmembrane': False}),
+    ('p.Arg75Glyfs*3', {'notation_type': 'protein', 'aa_format': 'three_letter', 'orig_aa': 'R', 'new_aa': 'G',
+                        'position': 75, 'mutation_type': 'frameshift', 'is_transmembrane': False}),
+    ('p.R75W', {'notation_type': 'protein', 'aa_format': 'one_letter', 'orig_aa': 'R', 'new_aa': 'W',
+                'position': 75, 'mutation_type': 'missense', 'is_transmembrane': False}),
+    ('c.1000G>A (p.Gly334Ser)', {'notation_type': 'protein', 'aa_format': 'three_letter', 'orig_aa': 'G',
+                                 'new_aa': 'S', 'position': 334, 'mutation_type': 'missense',
+                                 'is_transmembrane': True}),
+    ('c.10_12delAAT (p.?)', {'notation_type': 'coding', 'start': 10, 'end': 12, 'ref': 'AAT',
+                             'position': 10, 'mutation_type': 'deletion', 'is_transmembrane': False}),
+])
+def test_parse_mutation(mutation, expected):
+    info = parse_mutation(mutation)
+    assert {key: value for key, value in info.items() if value is not None} == expected
+
+
+@pytest.mark.parametrize('mutation', ['garbage', 'p.Arg75', 'c.12'])
+def test_unparseable_mutation_raises(mutation):
+    with pytest.raises(ValueError):
+        parse_mutation(mutation)
+
+
+def test_results_are_memoized_and_copied():
+    mutation_parser._parse_mutation_cached.cache_clear()
+    first = parse_mutation('c.235C>T')
+    first['position'] = -1
+    second = parse_mutation('c.235C>T')
+    assert second['position'] == 235
+    info = mutation_parser._parse_mutation_cached.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
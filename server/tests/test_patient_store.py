@@ -0,0 +1,30 @@
+# Values that don't fit a field's schema kind are kept as they are, never silently converted
+import numpy as np
+
+from patient_store import Column, PatientStore
+from schema import PATIENT_TYPES
+
+
+def test_fractional_value_in_int_field_is_not_truncated():
+    store = PatientStore.from_records([{'age': 1}, {'age': 1.5}, {'age': None}], PATIENT_TYPES)
+    assert store.column('age').kind == 'float'
+    assert store.to_records() == [{'age': 1.0}, {'age': 1.5}, {'age': None}]
+
+
+def test_whole_float_in_int_field_stays_int():
+    store = PatientStore.from_records([{'age': 1}, {'age': 2.0}], PATIENT_TYPES)
+    assert store.column('age').kind == 'int'
+    assert store.to_records() == [{'age': 1}, {'age': 2}]
+
+
+def test_string_in_bool_field_is_not_read_as_true():
+    store = PatientStore.from_records([{'has_dm': True}, {'has_dm': 'N'}], PATIENT_TYPES)
+    assert store.to_records() == [{'has_dm': True}, {'has_dm': 'N'}]
+
+
+def test_patching_int_column_with_fraction_rebuilds_it():
+    col = Column.from_values('age', [1, 2], 'int')
+    patched = col.patched(np.array([0]), [2.5])
+    assert patched.kind == 'float'
+    assert patched.to_list() == [2.5, 2.0]
+    assert col.to_list() == [1, 2]
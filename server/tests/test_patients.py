@@ -0,0 +1,42 @@
+# The shape of /patients records, and paging them with cursors
+import pytest
+
+
+def _pages(client, limit):
+    ids, cursor = [], None
+    while True:
+        url = f'/api/patients?limit={limit}&fields=id' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        ids.extend(record['id'] for record in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return ids
+
+
+def test_pages_cover_every_patient_once(client):
+    ids = _pages(client, 64)
+    assert ids == sorted(ids) and len(ids) == len(set(ids)) == 500
+
+
+@pytest.mark.parametrize('cursor', ['!!!', 'abc', 'NDI', '%%%'])
+def test_garbage_cursor_is_a_bad_request(client, cursor):
+    response = client.get(f'/api/patients?limit=10&cursor={cursor}')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+
+def test_cursor_of_unknown_patient_is_stale(client):
+    import base64
+    cursor = base64.urlsafe_b64encode(b'no-such-patient').decode()
+    assert client.get(f'/api/patients?limit=10&cursor={cursor}').status_code == 409
+
+
+def test_every_record_has_every_field(client):
+    from firebase_client import get_store
+    fields = set(get_store().fields())
+    records = client.get('/api/patients').get_json()
+    assert records and all(set(record) == fields for record in records)
+    assert any(value is None for record in records for value in record.values())
+    subset = client.get('/api/patients?fields=dm,hl').get_json()
+    assert all(set(record) == {'dm', 'hl'} for record in subset)
@@ -0,0 +1,81 @@
+# Cached responses are compressed lazily, per encoding asked for, and only when they are cached; they
+# carry ETags, and the JSON provider encodes what Flask's own does
+import dataclasses
+import datetime
+import decimal
+import gzip
+import json
+import uuid
+
+import numpy as np
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+from cache import response_cache
+
+
+def test_identity_client_gets_uncompressed_body_and_nothing_is_compressed(client):
+    response = client.get('/api/patients', headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    (entry, _), = response_cache._entries.values()
+    assert set(entry.bodies) == {'identity'}
+    assert 'gzip' in entry.encodings
+
+
+def test_gzip_is_compressed_on_first_request_and_reused(client):
+    first = client.get('/api/patients', headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in first.headers['Vary']
+    (entry, size), = response_cache._entries.values()
+    assert set(entry.bodies) == {'identity', 'gzip'}
+    assert size == sum(len(body) for body in entry.bodies.values()) == response_cache.size_bytes
+    second = client.get('/api/patients', headers={'Accept-Encoding': 'gzip'})
+    assert second.data == first.data
+    assert gzip.decompress(second.data) == client.get('/api/patients').data
+
+
+def test_body_too_big_to_cache_is_never_compressed(client):
+    max_bytes = response_cache.max_bytes
+    response_cache.configure(max_bytes=1000)
+    try:
+        response = client.get('/api/patients', headers={'Accept-Encoding': 'gzip'})
+    finally:
+        response_cache.configure(max_bytes=max_bytes)
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert len(response_cache) == 0
+
+
+def test_etag_answers_304(client):
+    first = client.get('/api/patients')
+    etag = first.headers['ETag']
+    again = client.get('/api/patients', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and not again.data
+    gzipped = client.get('/api/patients', headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['ETag'] != etag
+    assert client.get('/api/patients', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 200
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_json_provider_matches_flask(app, monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(json_provider, 'orjson', None)
+    elif json_provider.orjson is None:
+        pytest.skip('orjson is not installed')
+
+    @dataclasses.dataclass
+    class Point:
+        x: int
+        y: float
+
+    plain = {'int': 3, 'float': 1.5, 'date': datetime.date(2024, 5, 1), 'decimal': decimal.Decimal('1.10'),
+             'uuid': uuid.UUID(int=7), 'point': Point(1, 2.5), 'list': [1, None, 'a'], 'nested': {'b': True}}
+    numpy = {'int': np.int64(3), 'float': np.float32(1.5), 'array': np.arange(3), 'bool': np.bool_(True)}
+    provider = json_provider.JSONProvider(app)
+    with app.app_context():
+        assert json.loads(provider.dumps(plain)) == json.loads(DefaultJSONProvider(app).dumps(plain))
+        assert json.loads(provider.dumps_bytes(numpy)) == {'int': 3, 'float': 1.5, 'array': [0, 1, 2], 'bool': True}
+        with pytest.raises(TypeError):
+            provider.dumps({'set': {1, 2}})
@@ -0,0 +1,47 @@
+# POST /score/batch scores like /score, per pair and in order, and rejects bodies it can't read with a 400
+import json
+
+PAIRS = [['p.Arg75Trp', 'c.235C>T'], ['p.Glu753*', 'p.Gly334Ser'], ['c.10_12delAAT', 'p.R75W']]
+
+
+def _single(client, m1, m2):
+    return client.get('/api/score', query_string={'m1': m1, 'm2': m2}).get_json()
+
+
+def test_json_array_matches_single_scores(client):
+    response = client.post('/api/score/batch', json=PAIRS + [{'m1': 'garbage', 'm2': 'c.235C>T'}])
+    assert response.status_code == 200
+    results = response.get_json()
+    assert [[r['m1'], r['m2']] for r in results] == PAIRS + [['garbage', 'c.235C>T']]
+    for (m1, m2), result in zip(PAIRS, results):
+        assert result['success'] and result['score'] == _single(client, m1, m2)['score']
+        assert result['info1']['notation_type'] in ('protein', 'coding')
+    assert not results[-1]['success'] and results[-1]['score'] is None and results[-1]['error']
+
+
+def test_pairs_object_and_ndjson(client):
+    expected = client.post('/api/score/batch', json=PAIRS).get_json()
+    assert client.post('/api/score/batch', json={'pairs': PAIRS}).get_json() == expected
+
+    body = '\n'.join(json.dumps({'m1': m1, 'm2': m2}) for m1, m2 in PAIRS) + '\n\n'
+    response = client.post('/api/score/batch', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == expected
+
+
+def test_malformed_entries_fail_alone(client):
+    results = client.post('/api/score/batch', json=[PAIRS[0], ['only one'], {'m1': 1, 'm2': 2}, None, PAIRS[1]]).get_json()
+    assert [r['success'] for r in results] == [True, False, False, False, True]
+    assert all(r['error'] for r in results[1:4])
+
+
+def test_unreadable_bodies_are_400(client):
+    assert client.post('/api/score/batch', data='[["a",', content_type='application/json').status_code == 400
+    assert client.post('/api/score/batch', json={'m1': 'p.R75W'}).status_code == 400
+    assert client.post('/api/score/batch', data='{"m1": "p.R75W"}\nnot json\n',
+                       content_type='application/x-ndjson').status_code == 400
+
+
+def test_too_many_pairs(app, client):
+    limit = app.config['SCORE_BATCH_MAX_PAIRS']
+    assert client.post('/api/score/batch', json=[PAIRS[0]] * (limit + 1)).status_code == 413
@@ -0,0 +1,66 @@
+# Server-side sessions: per-request copies of memory sessions, and which backend runs with how many workers
+import pytest
+
+from sessions import MemorySessionStore, ServerSessionInterface, make_session_interface, worker_count
+
+
+def test_memory_store_hands_out_copies():
+    store = MemorySessionStore()
+    data = {'mutations': {'a|b': {'allele1': 'a'}}}
+    store.save('sid', data, None)
+    data['mutations']['c|d'] = {}
+    loaded = store.load('sid')
+    assert loaded == {'mutations': {'a|b': {'allele1': 'a'}}}
+    loaded['mutations'].clear()
+    assert store.load('sid')['mutations'] == {'a|b': {'allele1': 'a'}}
+
+
+def test_worker_count():
+    assert worker_count({}) == 1
+    assert worker_count({'WEB_CONCURRENCY': '3'}) == 3
+    assert worker_count({'WEB_CONCURRENCY': '3', 'GUNICORN_CMD_ARGS': '--bind :80 --workers=2'}) == 2
+    assert worker_count({'GUNICORN_CMD_ARGS': '-w 4'}) == 4
+
+
+def test_backend_follows_worker_count():
+    assert isinstance(make_session_interface({}, workers=1), ServerSessionInterface)
+    assert make_session_interface({}, workers=4) is None
+    assert make_session_interface({'SESSION_BACKEND': 'cookie'}, workers=1) is None
+    with pytest.raises(RuntimeError):
+        make_session_interface({'SESSION_BACKEND': 'memory'}, workers=4)
+
+
+def _pairs(n):
+    from firebase_client import get_store
+    pairs = []
+    for record in get_store().to_records():
+        pair = (record.get('allele_1'), record.get('allele_2'))
+        if all(pair) and pair not in pairs:
+            pairs.append(pair)
+    return pairs[:n]
+
+
+def test_tracked_mutations_across_requests(app, client):
+    (a1, a2), (b1, b2) = _pairs(2)
+    added = client.get('/api/check_alleles', query_string={'allele1': a1, 'allele2': a2}).get_json()
+    assert (added['allele1'], added['allele2']) == (a1, a2)
+    # Already tracked
+    assert client.get('/api/check_alleles', query_string={'allele1': a1, 'allele2': a2}).get_json() is None
+    client.get('/api/check_alleles', query_string={'allele1': b1, 'allele2': b2})
+    tracked = client.get('/api/get_mutation_list').get_json()
+    assert [(m['allele1'], m['allele2']) for m in tracked] == [(a1, a2), (b1, b2)]
+
+    removed = client.post('/api/remove_mutation', json={'allele1': a1, 'allele2': a2}).get_json()
+    assert removed['success'] and [(m['allele1'], m['allele2']) for m in removed['mutations']] == [(b1, b2)]
+    assert client.get('/api/get_mutation_list').get_json() == removed['mutations']
+
+    # Another user's session is their own
+    assert app.test_client().get('/api/get_mutation_list').get_json() == []
+
+
+def test_cookie_carries_only_the_session_id(client):
+    for allele1, allele2 in _pairs(20):
+        client.get('/api/check_alleles', query_string={'allele1': allele1, 'allele2': allele2})
+    cookie = client.get_cookie('session')
+    assert len(client.get('/api/get_mutation_list').get_json()) == 20
+    assert len(cookie.value) < 100
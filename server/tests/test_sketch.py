@@ -0,0 +1,66 @@
+# Approximate stats (exact=false) match the exact ones where they must, and their quartiles stay
+# within the sketch's rank error
+import numpy as np
+import pytest
+
+from filter_index import parse_filters
+from firebase_client import get_store
+from patient_store import PatientStore
+from schema import PATIENT_TYPES
+from sketch import merge_summaries
+from stats_cube import SketchCube
+from synthetic_cohort import generate_store
+
+# Rank error allowed for a quantile: the documented ~1.7% at k=200, with some slack
+RANK_ERROR = 0.02
+QUARTILES = (('First Quartile', 0.25), ('Median', 0.5), ('Third Quartile', 0.75))
+
+
+# Whether value could be the q-quantile of values (sorted, interpolated like np.quantile) give or take
+# RANK_ERROR in rank; values are rounded to 2 decimals, so ties within half a cent count either way
+def _within_rank(values, q, value):
+    below = np.searchsorted(values, value - 0.005, 'left')
+    upto = np.searchsorted(values, value + 0.005, 'right')
+    slack = RANK_ERROR * len(values)
+    return below - 1 - slack <= q * (len(values) - 1) <= upto + slack
+
+
+def _values(manifestation, sex, severity):
+    sex, severity = parse_filters(sex, severity)
+    return np.sort([r[manifestation] for r in get_store().to_records()
+                    if r.get(manifestation) is not None
+                    and (sex is None or r.get('sex') == sex)
+                    and (severity is None or r.get('severity') == severity)])
+
+
+@pytest.mark.parametrize('manifestation', ['dm', 'oa', 'di', 'hl'])
+@pytest.mark.parametrize('sex, severity', [(None, None), ('Female', None), (None, '3'), ('Male', '2')])
+def test_approximate_stats_within_error_bound(client, manifestation, sex, severity):
+    query = {'sex': sex, 'severity': severity}
+    exact = client.get(f'/api/stats/{manifestation}', query_string={**query, 'exact': 'true'}).get_json()
+    approximate = client.get(f'/api/stats/{manifestation}', query_string={**query, 'exact': 'false'}).get_json()
+    values = _values(manifestation, sex, severity)
+    if not len(values):
+        assert 'error' in exact and 'error' in approximate
+        return
+
+    assert approximate['Count'] == exact['Count'] == len(values)
+    assert (approximate['Minimum'], approximate['Maximum']) == (exact['Minimum'], exact['Maximum'])
+    # Merged moments can land on the other side of a rounding tie
+    for field in ('Mean', 'Standard Deviation'):
+        assert approximate[field] == pytest.approx(exact[field], abs=0.0100001)
+    for field, q in QUARTILES:
+        assert _within_rank(values, q, approximate[field]), (field, approximate[field], exact[field])
+
+
+def test_compacted_sketches_within_error_bound():
+    store = PatientStore.from_records(generate_store(20000, seed=3).to_records(), PATIENT_TYPES)
+    cube = SketchCube(store)
+    for manifestation in ('dm', 'hl'):
+        merged = merge_summaries(cube.summaries(manifestation).values())
+        column = store.column(manifestation)
+        values = np.sort(column.data[~column.null])
+        assert merged.moments.count == len(values)
+        assert len(merged.sketch.levels) > 1, 'expected the sketch to have compacted'
+        for (_, q), value in zip(QUARTILES, merged.sketch.quantiles([q for _, q in QUARTILES])):
+            assert _within_rank(values, q, value), (manifestation, q, value)
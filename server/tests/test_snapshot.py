@@ -0,0 +1,29 @@
+# Snapshots round-trip whatever the store holds, and a failed one leaves nothing behind
+import datetime
+import os
+
+import pytest
+
+from patient_store import PatientStore
+from schema import PATIENT_TYPES
+from snapshot import current_version, load_snapshot, save_snapshot
+
+
+def test_mixed_str_column_round_trips(tmp_path):
+    store = PatientStore.from_records([
+        {'id': 1, 'inheritance': 'Recessive', 'allele_1': 5},
+        {'id': 2, 'inheritance': 3, 'allele_1': 'c.1A>G'},
+        {'id': 3, 'inheritance': None, 'allele_1': 2.5},
+    ], PATIENT_TYPES)
+    save_snapshot(store, str(tmp_path))
+    loaded, meta = load_snapshot(str(tmp_path), mmap=True)
+    assert loaded.to_records() == store.to_records()
+    assert meta['size'] == 3
+
+
+def test_unsnapshottable_value_leaves_no_snapshot(tmp_path):
+    store = PatientStore.from_records([{'id': 1, 'allele_1': datetime.date(2020, 1, 1)}], PATIENT_TYPES)
+    with pytest.raises(TypeError):
+        save_snapshot(store, str(tmp_path))
+    assert current_version(str(tmp_path)) is None
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,114 @@
+# The single-sort stats kernel matches numpy, merged partials give the stats of the whole, and bulk
+# subgroup stats keep every severity apart
+import numpy as np
+import pytest
+
+from parallel_stats import subgroup_stats
+from patient_store import PatientStore
+from schema import PATIENT_TYPES
+from stats import calculate_grouped_stats, calculate_stats, grouped_partial, merge_partials, partial_stats
+from stats_cube import SketchCube
+from synthetic_cohort import generate_store
+
+
+# What calculate_stats computed before it sorted once: one numpy call per statistic
+def _numpy_stats(values):
+    return {
+        "Count":              len(values),
+        "Mean":               round(float(np.mean(values)), 2),
+        "Median":             round(float(np.median(values)), 2),
+        "Standard Deviation": round(float(np.std(values)), 2),
+        "Minimum":            round(float(np.min(values)), 2),
+        "First Quartile":     round(float(np.quantile(values, 0.25)), 2),
+        "Third Quartile":     round(float(np.quantile(values, 0.75)), 2),
+        "Maximum":            round(float(np.max(values)), 2),
+    }
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_stats_kernel_matches_numpy(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 300))
+    values = np.round(rng.lognormal(2, 0.7, n), 2).tolist()
+    if seed % 2:
+        # Plenty of ties, as plain ints
+        values = rng.integers(0, 6, n).tolist()
+    assert calculate_stats(values) == _numpy_stats(values)
+
+    labels = rng.integers(0, 4, n)
+    groups, stats = calculate_grouped_stats(values, labels)
+    assert groups.tolist() == sorted(set(labels.tolist()))
+    for group, group_stats in zip(groups, stats):
+        assert group_stats == calculate_stats([v for v, label in zip(values, labels) if label == group])
+
+
+def test_stats_of_nothing():
+    assert 'error' in calculate_stats([])
+    assert 'error' in calculate_stats(None)
+    assert calculate_grouped_stats([], [])[1] == []
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_merged_partials_match_exact_stats(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 400))
+    values = np.round(rng.lognormal(2, 0.7, n), 2)
+    labels = rng.integers(0, 5, n)
+    cuts = [0, *sorted(rng.integers(0, n, 3).tolist()), n]
+    partials = [grouped_partial(values[a:b], labels[a:b]) for a, b in zip(cuts, cuts[1:])]
+
+    groups, stats = partial_stats(merge_partials(partials))
+    exact_groups, exact = calculate_grouped_stats(values, labels)
+    assert groups.tolist() == exact_groups.tolist()
+    for got, want in zip(stats, exact):
+        assert got.keys() == want.keys()
+        for name in got:
+            # Moments merged pairwise may land on the other side of a rounding tie
+            tolerance = 0.0100001 if name in ('Mean', 'Standard Deviation') else 0
+            assert abs(got[name] - want[name]) <= tolerance, name
+
+
+def test_subgroup_stats_keep_fractional_severities():
+    store = PatientStore.from_records([
+        {'sex': 0, 'severity': 2.0, 'dm': 1.0},
+        {'sex': 0, 'severity': 2.5, 'dm': 3.0},
+        {'sex': 1, 'severity': 2.5, 'dm': 5.0},
+    ], PATIENT_TYPES)
+    stats = subgroup_stats(store, ['dm'], workers=1)
+    assert stats[('dm', None, 2.0)]['Count'] == 1
+    assert stats[('dm', None, 2.5)]['Count'] == 2
+    assert stats[('dm', 'Male', 2.5)]['Mean'] == 3.0
+
+
+def test_spawned_workers_match_in_process(monkeypatch):
+    import parallel_stats
+    from synthetic_cohort import generate_store
+    monkeypatch.setattr(parallel_stats, 'PARALLEL_MIN_ROWS', 0)
+    store = generate_store(3000)
+    exact = subgroup_stats(store, ['dm', 'oa'], workers=1)
+    spread = subgroup_stats(store, ['dm', 'oa'], workers=2)
+    assert spread.keys() == exact.keys()
+    for key, stats in spread.items():
+        assert all(abs(stats[name] - exact[key][name]) <= 0.0100001 for name in stats)
+
+
+def test_sketch_cube_with_records_copies_only_touched_cells():
+    records = generate_store(300, seed=2).to_records()
+    store = PatientStore.from_records(records[:-1], PATIENT_TYPES)
+    cube = SketchCube(store)
+    before = {key: {cell: summary.stats() for cell, summary in cells.items()} for key, cells in cube._pairs.items()}
+    added = records[-1]
+    grown = cube.with_records(PatientStore.from_records(records, PATIENT_TYPES), [added])
+
+    fresh = SketchCube(PatientStore.from_records(records, PATIENT_TYPES))
+    for key, cells in grown._pairs.items():
+        value_feature, group_feature = key
+        touched = (added.get(value_feature) is not None
+                   and (group_feature is None or added.get(group_feature) is not None))
+        cell = (added.get(group_feature) if group_feature else None, added.get('sex'), added.get('severity'))
+        for name, summary in cells.items():
+            assert (summary is cube._pairs[key].get(name)) == (not touched or name != cell)
+            assert summary.moments.count == fresh._pairs[key][name].moments.count
+    # The original cube is untouched
+    assert {key: {cell: summary.stats() for cell, summary in cells.items()}
+            for key, cells in cube._pairs.items()} == before
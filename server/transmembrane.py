@@ -0,0 +1,63 @@
+# transmembrane.py
+import csv
+import os
+import numpy as np
+
+# Default domain annotation (WFS1); override with the TRANSMEMBRANE_DOMAINS config / env var
+DEFAULT_DOMAINS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'wfs1_transmembrane_domains.csv')
+
+
+# Transmembrane domains of one protein as a per-position bitmap (index = amino-acid position),
+# so a lookup is a single index instead of a scan over the domain list
+class DomainTable:
+    def __init__(self, domains):
+        self.domains = sorted((int(s), int(e)) for s, e in domains)
+        size = max((e for _, e in self.domains), default=0) + 1
+        self.bitmap = np.zeros(size, dtype=bool)
+        for s, e in self.domains:
+            self.bitmap[max(s, 0):e + 1] = True
+        # Plain list for the scalar path, indexing it beats indexing a numpy array
+        self._bits = self.bitmap.tolist()
+
+    # Load a CSV with start,end columns (1-based, inclusive); lines starting with '#' are comments
+    @classmethod
+    def from_file(cls, path):
+        with open(path, newline='') as f:
+            rows = csv.DictReader(line for line in f if line.strip() and not line.startswith('#'))
+            return cls((row['start'], row['end']) for row in rows)
+
+    # Whether a single position falls inside any domain
+    def contains(self, pos):
+        return 0 <= pos < len(self._bits) and self._bits[pos]
+
+    # Boolean array: whether each position falls inside any domain
+    def contains_many(self, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        inside = (positions >= 0) & (positions < len(self.bitmap))
+        out = np.zeros(positions.shape, dtype=bool)
+        out[inside] = self.bitmap[positions[inside]]
+        return out
+
+
+_table = None
+
+
+# The active domain table (loaded from DEFAULT_DOMAINS_PATH on first use)
+def get_domain_table():
+    global _table
+    if _table is None:
+        _table = DomainTable.from_file(DEFAULT_DOMAINS_PATH)
+    return _table
+
+
+def set_domain_table(table):
+    global _table
+    _table = table
+
+
+# Is an amino-acid position (or each of an array of positions) inside a transmembrane domain
+def is_in_transmembrane(pos):
+    table = get_domain_table()
+    if np.ndim(pos) == 0:
+        return table.contains(int(pos))
+    return table.contains_many(pos)